@@ -0,0 +1,244 @@
+"""
+Pulse Train Hat ADC Sampler
+===========================
+
+.. module:: pthat.adc_sampler
+   :platform: Mac, Linux, Windows
+   :synopsis: Sample the ADCs at a fixed rate with requests pipelined on the serial port.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'ADCSampler' class.
+
+Reading an ADC with :meth:'pthat.pthat.ADC.get_reading' and get_all_responses waits for the serial port read timeout
+after every reading, which limits sampling to a few readings a second. An :class:'ADCSampler' writes the requests for
+all of its ADC channels back to back in one write at a fixed rate and does not wait for the replies before sending the
+next requests. Up to depth requests a channel can be waiting for a reply. The ADC result replies carry the ADC number,
+so they are matched to their channel without command IDs and timestamped as they are read. A request whose reply has
+not arrived max_wait seconds after it was written is taken as lost, for example thrown away by a stop all, and counted
+in :attr:'ADCSampler.lost' so it no longer holds up the sampling.
+
+Each channel keeps :class:'pthat.stats.RollingStats' of its recent readings and a history with one sample for every
+decimation readings in a :class:'pthat.telemetry.RingBuffer', holding the time, mean, minimum and maximum of the
+readings.
+
+The serial port limits how fast the ADCs can be read. Every reading is sent back as the result reply plus the received
+and completed replies if they are on, about 21 bytes, and each byte takes 10 bits on the wire. The sampler counts the
+bytes it reads and reports :attr:'ADCSampler.budget_rate', the highest rate the link allows, next to the rate it
+achieved.
+
+.. code-block:: python
+
+   from pthat.adc_sampler import ADCSampler
+   from pthat.pthat import ADC
+
+   adc = ADC(1, serial_device="/dev/ttyS0")
+   sampler = ADCSampler(adc, channels=(1, 2), rate=200.0, decimation=20)
+   sampler.run(duration=10)
+   print(sampler.stats[1], sampler.achieved_rate, sampler.budget_rate)
+   history = sampler.history[1].last(100)
+"""
+from pthat.clock import get_clock
+from pthat.pthat import ADC
+from pthat.stats import RollingStats, RunningStats
+from pthat.telemetry import RingBuffer, parse_adc_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+READING_REPLY_BYTES = 21
+"""
+Bytes sent back for each reading with the received and completed replies on, used until bytes have been counted
+"""
+
+
+class ADCSampler:
+    """
+    .. class:: ADCSampler
+
+    Reads ADC channels at a fixed rate with the requests pipelined.
+
+    :param pthat: PTHat, Axis, ADC, AUX or PWM object whose serial port is used
+    :param channels: ADC numbers to read - default (1, 2)
+    :param rate: readings a second of each channel - default 100.0
+    :param depth: most requests of a channel waiting for a reply - default 2
+    :param window: number of readings in the rolling statistics - default 100
+    :param decimation: number of readings in each history sample - default 10
+    :param capacity: number of history samples to keep for each channel - default 10000
+    :param max_wait: seconds to wait for a reply before the request is taken as lost - default 0.1
+    :param on_reply: function called with every reply read that is not an ADC reading - default None to drop them
+    :param clock: clock used for the timing - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, pthat, channels=(1, 2), rate=100.0, depth=2, window=100, decimation=10, capacity=10000,
+                 on_reply=None, max_wait=0.1, clock=None):
+        """
+        Constructor
+        """
+        if not channels or any(channel not in (1, 2) for channel in channels):
+            raise ValueError(f"Invalid channels {channels}. Must be some of 1 and 2")
+        if rate <= 0:
+            raise ValueError(f"Invalid rate {rate}. Must be greater than 0")
+        if depth < 1 or decimation < 1:
+            raise ValueError("The depth and decimation must be at least 1")
+        if max_wait <= 0:
+            raise ValueError(f"Invalid max wait {max_wait}. Must be greater than 0")
+
+        self.pthat = pthat
+        self.channels = tuple(channels)
+        self.rate = rate
+        self.depth = depth
+        self.decimation = decimation
+        self.on_reply = on_reply
+        self.max_wait = max_wait
+        self.clock = get_clock() if clock is None else clock
+        self.stats = {channel: RollingStats(window, f"ADC{channel}") for channel in self.channels}
+        """
+        Dict of ADC number to the rolling statistics of its recent readings
+        """
+        self.history = {channel: RingBuffer((("ns", "q"), ("mean", "d"), ("min", "l"), ("max", "l")), capacity)
+                        for channel in self.channels}
+        """
+        Dict of ADC number to its decimated history
+        """
+        self.latency = RunningStats("ADC round trip")
+        """
+        Statistics of the time in nanoseconds from writing a request until its reading arrived
+        """
+        self.samples = 0
+        """
+        Number of readings received
+        """
+        self.skipped = 0
+        """
+        Number of times the requests were not sent because depth requests were still waiting for a reply
+        """
+        self.lost = 0
+        """
+        Number of requests that were not answered within max_wait
+        """
+        self.bytes_read = 0
+        """
+        Number of bytes read
+        """
+        self._request = b"".join(ADC(channel, test_mode=True).get_reading().encode("ascii")
+                                 for channel in self.channels)
+        self._sent = {channel: [] for channel in self.channels}     # write times of the requests waiting for a reply
+        self._blocks = {channel: [] for channel in self.channels}   # readings of the history sample being built
+        self._start_ns = None
+        self._end_ns = None
+
+    @property
+    def achieved_rate(self):
+        """
+        Readings a second of each channel over the last run
+
+        :rtype: float
+        """
+        if self._start_ns is None:
+            return 0.0
+        end = self.clock.monotonic_ns() if self._end_ns is None else self._end_ns
+        seconds = (end - self._start_ns) / 1e9
+        return self.samples / len(self.channels) / seconds if seconds > 0 else 0.0
+
+    @property
+    def budget_rate(self):
+        """
+        Highest readings a second of each channel the serial port allows, from the bytes read for each reading
+
+        :rtype: float
+        """
+        per_reading = self.bytes_read / self.samples if self.samples else READING_REPLY_BYTES
+        return self.pthat.baud_rate / 10 / per_reading / len(self.channels)
+
+    def request(self):
+        """
+        Write the requests of every channel in one write, unless a channel already has depth requests waiting. A request
+        not answered within max_wait is counted as lost and no longer waits.
+
+        :returns: True if the requests were written
+        :rtype: bool
+        """
+        expired = self.clock.monotonic_ns() - int(self.max_wait * 1e9)
+        for sent in self._sent.values():
+            while sent and sent[0] <= expired:
+                sent.pop(0)
+                self.lost += 1
+        if any(len(sent) >= self.depth for sent in self._sent.values()):
+            self.skipped += 1
+            return False
+        self.pthat.serial.write(self._request)
+        now = self.clock.monotonic_ns()
+        for sent in self._sent.values():
+            sent.append(now)
+        return True
+
+    def read_replies(self):
+        """
+        Read every reply that has arrived without waiting
+
+        :returns: number of readings read
+        :rtype: int
+        """
+        serial = self.pthat.serial
+        count = 0
+        while serial.in_waiting:
+            data = serial.read_until(b"*")
+            if not data:
+                break
+            self.bytes_read += len(data)
+            resp = data.decode("ascii", "replace")
+            parsed = parse_adc_reply(resp)
+            if parsed is None or parsed[0] not in self._sent:
+                if self.on_reply is not None:
+                    self.on_reply(resp)
+                continue
+            self.add_reading(parsed[0], parsed[1], self.clock.monotonic_ns())
+            count += 1
+        return count
+
+    def add_reading(self, channel, value, ns):
+        """
+        Add a reading to the statistics and history of its channel
+
+        :param channel: ADC number
+        :param value: the reading
+        :param ns: monotonic time in nanoseconds the reading arrived
+        """
+        sent = self._sent[channel]
+        if sent:
+            self.latency.add(ns - sent.pop(0))
+        self.samples += 1
+        self.stats[channel].add(value)
+        block = self._blocks[channel]
+        block.append(value)
+        if len(block) == self.decimation:
+            self.history[channel].append(ns, sum(block) / len(block), min(block), max(block))
+            block.clear()
+
+    def run(self, duration=None, should_stop=None):
+        """
+        Sample at the fixed rate. Between requests the replies are read as they arrive.
+
+        :param duration: seconds to run for - default None to run until should_stop returns True
+        :param should_stop: function called between requests, the run ends when it returns True - default None
+        """
+        period = int(1e9 / self.rate)
+        self._start_ns = self.clock.monotonic_ns()
+        self._end_ns = None
+        self.samples = self.bytes_read = 0
+        # Replies to the requests of an earlier run are not waited for
+        for sent in self._sent.values():
+            sent.clear()
+        end = None if duration is None else self._start_ns + int(duration * 1e9)
+        due = self._start_ns
+        while (end is None or due < end) and not (should_stop is not None and should_stop()):
+            self.request()
+            due += period
+            while True:
+                self.read_replies()
+                remaining = due - self.clock.monotonic_ns()
+                if remaining <= 0:
+                    break
+                # Wake up often enough to timestamp the replies close to when they arrive
+                self.clock.sleep(min(remaining, 200000) / 1e9)
+        self.read_replies()
+        self._end_ns = self.clock.monotonic_ns()
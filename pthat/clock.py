@@ -0,0 +1,218 @@
+"""
+Pulse Train Hat Clocks
+======================
+
+.. module:: pthat.clock
+   :platform: Mac, Linux, Windows
+   :synopsis: Injectable clocks for timing in the library.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'SystemClock' and :class:'VirtualClock' classes.
+
+Everything in the library that needs the time or needs to wait takes a clock parameter. When it is not passed the
+clock returned by :func:'get_clock' is used, which is the :class:'SystemClock' unless it is changed with
+:func:'set_clock'.
+
+A :class:'VirtualClock' never waits. Sleeping on it moves its time on straight away, running any callbacks scheduled
+on the way, so a motion program that takes an hour on the PTHat can be simulated in seconds.
+
+.. code-block:: python
+
+   from pthat.clock import VirtualClock, set_clock
+   from pthat.pthat import Axis
+   from pthat.simulator import SimulatedSerial
+
+   clock = VirtualClock()
+   set_clock(clock)
+
+   xaxis = Axis("X", command_id=1, serial_port=SimulatedSerial())
+   ...
+   print(f"Job took {clock.monotonic_ns() / 1e9} simulated seconds")
+"""
+import heapq
+import itertools
+import threading
+import time
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+# The nanosecond functions of the time module were added in Python 3.7
+_monotonic_ns = getattr(time, "monotonic_ns", None) or (lambda: int(time.monotonic() * 1e9))
+_perf_counter_ns = getattr(time, "perf_counter_ns", None) or (lambda: int(time.perf_counter() * 1e9))
+_time_ns = getattr(time, "time_ns", None) or (lambda: int(time.time() * 1e9))
+
+
+class SystemClock:
+    """
+    .. class:: SystemClock
+
+    Clock using the real time of the host.
+    """
+    def monotonic_ns(self):
+        """
+        :returns: monotonic time in nanoseconds
+        :rtype: int
+        """
+        return _monotonic_ns()
+
+    def perf_counter_ns(self):
+        """
+        :returns: high resolution performance counter in nanoseconds
+        :rtype: int
+        """
+        return _perf_counter_ns()
+
+    def time_ns(self):
+        """
+        :returns: wall clock time in nanoseconds since the epoch
+        :rtype: int
+        """
+        return _time_ns()
+
+    def sleep(self, seconds):
+        """
+        Wait for a number of seconds
+
+        :param seconds: seconds to wait
+        """
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    .. class:: VirtualClock
+
+    Discrete event clock. Time only moves when :meth:'sleep' or :meth:'advance' is called and it moves instantly.
+    Callbacks can be scheduled with :meth:'call_at' and :meth:'call_later' and are run in time order as the clock
+    passes them.
+
+    :param start_ns: monotonic time to start at in nanoseconds - default 0
+    :param epoch_ns: wall clock time in nanoseconds that start_ns corresponds to - default the current time
+    """
+    def __init__(self, start_ns=0, epoch_ns=None):
+        """
+        Constructor
+        """
+        self._now = start_ns
+        self._epoch = (_time_ns() if epoch_ns is None else epoch_ns) - start_ns
+        self._events = []
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+
+    def monotonic_ns(self):
+        """
+        :returns: virtual monotonic time in nanoseconds
+        :rtype: int
+        """
+        return self._now
+
+    def perf_counter_ns(self):
+        """
+        :returns: virtual monotonic time in nanoseconds
+        :rtype: int
+        """
+        return self._now
+
+    def time_ns(self):
+        """
+        :returns: virtual wall clock time in nanoseconds since the epoch
+        :rtype: int
+        """
+        return self._epoch + self._now
+
+    def sleep(self, seconds):
+        """
+        Move the time on by a number of seconds without waiting
+
+        :param seconds: seconds to move on
+        """
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        """
+        Move the time on by a number of seconds, running the callbacks that are due on the way
+
+        :param seconds: seconds to move on
+        """
+        self.advance_to(self._now + max(0, int(seconds * 1e9)))
+
+    def advance_to(self, ns):
+        """
+        Move the time on to a monotonic time, running the callbacks that are due on the way. Time never goes back.
+
+        :param ns: monotonic time in nanoseconds
+        """
+        with self._lock:
+            while self._events and self._events[0][0] <= ns:
+                due, sequence, callback = heapq.heappop(self._events)
+                self._now = max(self._now, due)
+                callback()
+            self._now = max(self._now, ns)
+
+    def call_at(self, ns, callback):
+        """
+        Schedule a callback to run when the clock reaches a monotonic time
+
+        :param ns: monotonic time in nanoseconds
+        :param callback: function to call with no arguments
+        """
+        with self._lock:
+            heapq.heappush(self._events, (ns, next(self._sequence), callback))
+
+    def call_later(self, seconds, callback):
+        """
+        Schedule a callback to run after a number of seconds
+
+        :param seconds: seconds from now
+        :param callback: function to call with no arguments
+        """
+        self.call_at(self._now + int(seconds * 1e9), callback)
+
+    def next_event_ns(self):
+        """
+        :returns: time of the next scheduled callback or None if there are none
+        :rtype: int
+        """
+        with self._lock:
+            return self._events[0][0] if self._events else None
+
+    def run(self, until_ns=None):
+        """
+        Run scheduled callbacks in time order, moving the time to each one, until there are none left or the next
+        one is after until_ns
+
+        :param until_ns: monotonic time to stop at - default run until there are no callbacks left
+        """
+        while True:
+            due = self.next_event_ns()
+            if due is None or (until_ns is not None and due > until_ns):
+                break
+            self.advance_to(due)
+        if until_ns is not None:
+            self.advance_to(until_ns)
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    """
+    Get the clock used when no clock is passed to a class in the library
+
+    :returns: the default clock
+    :rtype: SystemClock or VirtualClock
+    """
+    return _clock
+
+
+def set_clock(clock):
+    """
+    Set the clock used when no clock is passed to a class in the library. Objects that have already been created keep
+    the clock they were created with.
+
+    :param clock: the new default clock, None to go back to the system clock
+    """
+    global _clock
+    _clock = SystemClock() if clock is None else clock
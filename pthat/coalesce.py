@@ -0,0 +1,304 @@
+"""
+Pulse Train Hat Write Coalescing
+================================
+
+.. module:: pthat.coalesce
+   :platform: Mac, Linux, Windows
+   :synopsis: Join bursts of commands into one serial write.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'CoalescingSerial' class.
+
+With auto_send_command on, every command method writes to the serial port on its own. Setting up four axes, auto count
+and starting them is nine writes, each one a system call. A :class:'CoalescingSerial' wraps the serial port and holds
+the commands written to it, then writes them all at once. Commands are held either for the length of a
+:meth:'CoalescingSerial.batch' block or, when a delay is given, for up to that long after the first one was written.
+
+Stop and reset commands are never held. A stop all or reset is written straight away and the held commands are thrown
+away, as they would only be stopped again. A stop of a single axis writes the held commands first, so it never goes
+out ahead of the start it is meant to stop. Held commands are also written before anything is read, so a reply is
+never waited on for a command that has not been sent.
+
+.. code-block:: python
+
+   from pthat.coalesce import CoalescingSerial
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", command_id=1, serial_device="/dev/ttyS0")
+   xaxis.auto_send_command = True
+   coalescer = CoalescingSerial.attach(xaxis)
+   yaxis = Axis("Y", command_id=2, serial_port=coalescer)
+   yaxis.auto_send_command = True
+
+   with coalescer.batch():
+       xaxis.set_axis(frequency=1000.0, pulse_count=2000, direction=0)
+       yaxis.set_axis(frequency=500.0, pulse_count=1000, direction=1)
+       xaxis.start_all()
+
+   print(f"{coalescer.writes_saved} writes saved")
+"""
+import threading
+from contextlib import contextmanager
+
+from pthat.clock import get_clock
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+def is_priority_command(data):
+    """
+    Check if a command written to the serial port is a stop or reset command, which must never be held back
+
+    :param data: bytes of a single command
+    :returns: True if the command is a stop, stop all or reset command
+    :rtype: bool
+    """
+    data = data.lstrip(b"*")
+    return data == b"N*" or (len(data) >= 6 and data[0:1] == b"I" and data[3:4] == b"T")
+
+
+def is_stop_all_command(data):
+    """
+    Check if a command written to the serial port is a stop all or reset command, which makes every command sent
+    before it pointless
+
+    :param data: bytes of a single command
+    :returns: True if the command is a stop all or reset command
+    :rtype: bool
+    """
+    data = data.lstrip(b"*")
+    return data == b"N*" or (is_priority_command(data) and data[4:5] == b"A")
+
+
+def discard_output(port, data):
+    """
+    Throw away the bytes waiting in the output buffer of a serial port before a stop or reset command is written. If
+    a command was cut short by this, the command end character is put in front of the stop or reset command so the
+    PTHat rejects the partial command instead of joining it to the stop or reset.
+
+    :param port: the serial port
+    :param data: bytes of the stop or reset command
+    :returns: the bytes to write
+    :rtype: bytes
+    """
+    if getattr(port, "out_waiting", 0):
+        data = b"*" + data
+    port.reset_output_buffer()
+    return data
+
+
+class CoalescingSerial:
+    """
+    .. class:: CoalescingSerial
+
+    Serial like object that joins the commands written to it into fewer writes to another serial port.
+
+    :param serial_port: the serial port to write to
+    :param delay: seconds to hold commands outside of a batch, None to only hold them inside a batch - default None
+    :param max_bytes: write the held commands once this many bytes are held - default 4096
+    :param clock: clock used for the delay, a :class:'pthat.clock.VirtualClock' runs it on its own schedule - default
+                  the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, serial_port, delay=None, max_bytes=4096, clock=None):
+        """
+        Constructor
+        """
+        if delay is not None and delay < 0:
+            raise ValueError(f"Invalid delay {delay}. Must be 0 or more")
+
+        self.serial_port = serial_port
+        self.delay = delay
+        self.max_bytes = max_bytes
+        self.clock = get_clock() if clock is None else clock
+        self.commands = 0
+        """
+        Number of writes made to this object
+        """
+        self.writes = 0
+        """
+        Number of writes made to the serial port
+        """
+        self.priority_writes = 0
+        """
+        Number of stop and reset commands written straight away
+        """
+        self._pending = bytearray()
+        self._batch_depth = 0
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        return getattr(self.serial_port, name)
+
+    @classmethod
+    def attach(cls, pthat, delay=None, max_bytes=4096):
+        """
+        Wrap the serial port of a PTHat object. Other objects sharing the serial port should be given the returned
+        object as their serial_port.
+
+        :param pthat: PTHat, Axis, ADC, AUX or PWM object
+        :param delay: seconds to hold commands outside of a batch - default None
+        :param max_bytes: write the held commands once this many bytes are held - default 4096
+        :returns: the coalescing serial port
+        :rtype: CoalescingSerial
+        """
+        if not isinstance(pthat.serial, cls):
+            pthat.serial = cls(pthat.serial, delay=delay, max_bytes=max_bytes, clock=pthat.clock)
+        return pthat.serial
+
+    @property
+    def writes_saved(self):
+        """
+        Number of serial port writes saved by joining commands
+        """
+        return self.commands - self.writes
+
+    @property
+    def pending(self):
+        """
+        Number of bytes held and not written yet
+        """
+        return len(self._pending)
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that holds every command written inside it and writes them in one go at the end. Batches can
+        be nested, the commands are written when the outermost one ends.
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.write_pending()
+
+    def write(self, data):
+        """
+        Hold data to be written with the next commands. Stop and reset commands are written straight away, after the
+        held commands for a stop of a single axis and instead of them for a stop all or reset.
+
+        :param data: bytes to write
+        :returns: number of bytes taken
+        :rtype: int
+        """
+        with self._lock:
+            self.commands += 1
+            if is_priority_command(data):
+                if is_stop_all_command(data):
+                    self._pending.clear()
+                else:
+                    self.write_pending()
+                self.priority_writes += 1
+                self.writes += 1
+                return self.serial_port.write(data)
+
+            self._pending += data
+            if len(self._pending) >= self.max_bytes:
+                self.write_pending()
+            elif self._batch_depth == 0:
+                if self.delay is None:
+                    self.write_pending()
+                elif self._timer is None:
+                    self._start_timer()
+        return len(data)
+
+    def write_pending(self):
+        """
+        Write the held commands to the serial port in one write
+        """
+        with self._lock:
+            if self._timer is not None:
+                if hasattr(self._timer, "cancel"):
+                    self._timer.cancel()
+                self._timer = None
+            if self._pending:
+                data = bytes(self._pending)
+                self._pending.clear()
+                self.writes += 1
+                self.serial_port.write(data)
+
+    @property
+    def in_waiting(self):
+        """
+        Number of reply bytes that can be read without waiting. The held commands are written first.
+        """
+        self._write_unless_batched()
+        return self.serial_port.in_waiting
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Write the held commands and read from the serial port
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        self.write_pending()
+        return self.serial_port.read_until(expected, size)
+
+    def read(self, size=1):
+        """
+        Write the held commands and read from the serial port
+
+        :param size: number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        self.write_pending()
+        return self.serial_port.read(size)
+
+    def flush(self):
+        """
+        Write the held commands, unless inside a batch, and wait until the serial port has sent everything
+        """
+        self._write_unless_batched()
+        self.serial_port.flush()
+
+    def reset_output_buffer(self):
+        """
+        Throw away the held commands and the bytes waiting in the serial port output buffer
+        """
+        with self._lock:
+            self._pending.clear()
+        self.serial_port.reset_output_buffer()
+
+    def close(self):
+        """
+        Write the held commands and close the serial port
+        """
+        self.write_pending()
+        self.serial_port.close()
+
+    def _write_unless_batched(self):
+        """
+        Write the held commands if no batch is open
+        """
+        with self._lock:
+            if self._batch_depth == 0:
+                self.write_pending()
+
+    def _start_timer(self):
+        """
+        Write the held commands once the delay has passed
+        """
+        def expired():
+            with self._lock:
+                if self._timer is token and self._batch_depth == 0:
+                    self.write_pending()
+
+        call_later = getattr(self.clock, "call_later", None)
+        if call_later is not None:
+            token = object()    # the clock callback can not be cancelled, so it checks it is still the current timer
+            self._timer = token
+            call_later(self.delay, expired)
+        else:
+            token = threading.Timer(self.delay, expired)
+            token.daemon = True
+            self._timer = token
+            token.start()
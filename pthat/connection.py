@@ -0,0 +1,400 @@
+"""
+Pulse Train Hat Connection
+==========================
+
+.. module:: pthat.connection
+   :platform: Mac, Linux, Windows
+   :synopsis: Thread safe connection to the PTHat with replies routed to the thread that sent the command.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'Connection' class.
+
+The send_command and get_response methods of :class:'pthat.pthat.PTHat' are not safe to call from several threads on
+one serial port. Writes from two threads can be mixed up in the middle of a command and a thread can read the reply
+to a command another thread sent.
+
+A :class:'Connection' owns the serial port and runs two threads. The writer thread takes commands off an outbound
+:class:'queue.SimpleQueue' and writes each one whole. The reader thread reads every reply and matches it to its
+command by the command ID, using a :class:'pthat.pipeline.CommandIDAllocator'. Any thread can submit a command and gets
+a :class:'concurrent.futures.Future' back, which is resolved once the command has completed. A thread only ever waits
+on its own commands and no lock is held for the round trip. The locks are only held to hand out an ID and to write
+one command.
+
+Stop all and reset commands are written straight away by the thread that submits them and cancel every command still
+waiting in the queue. A stop of a single axis waits its turn in the queue like any other command, so it never goes out
+ahead of the start it is meant to stop.
+
+With a :class:'pthat.override.FeedOverride' the writer thread scales the frequencies of the commands as it writes them.
+
+.. code-block:: python
+
+   import threading
+   from pthat.connection import Connection
+   from pthat.pthat import ADC, AUX
+
+   connection = Connection(serial_device="/dev/ttyS0")
+   adc = ADC(1, test_mode=True)
+   aux = AUX(1, test_mode=True)
+
+   def read_adc():
+       while True:
+           print(connection.request(adc.get_reading()).result)
+
+   threading.Thread(target=read_adc, daemon=True).start()
+   connection.request(aux.output_on())
+   ...
+   connection.close()
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+import serial
+
+from pthat.clock import get_clock
+from pthat.coalesce import discard_output, is_priority_command, is_stop_all_command
+from pthat.hooks import registry
+from pthat.pipeline import CommandIDAllocator
+from pthat.stats import RunningStats
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+_STOP = object()    # put on the outbound queue to stop the writer thread
+_logger = logging.getLogger("pthat")
+
+
+def _command_ids(data):
+    """
+    The command IDs of the commands in the bytes of one write
+    """
+    return [int(frame[1:3]) for frame in data.split(b"*") if frame[1:3].isdigit()]
+
+
+class Connection:
+    """
+    .. class:: Connection
+
+    Thread safe connection to one PTHat.
+
+    :param serial_port: an open serial port or serial like object - default None to open serial_device
+    :param serial_device: path to the serial device, used when serial_port is not given - default /dev/ttyS0
+    :param baud_rate: serial port baud rate - default 115200
+    :param allocator: command ID allocator of the connection - default a new allocator for the whole 0-99 range
+    :param on_reply: function called from the reader thread with each reply that is not matched to a command, such
+                     as auto count pulse counts - default None to keep them in :attr:'unmatched'
+    :param clock: clock used to time the commands - default the clock from :func:'pthat.clock.get_clock'
+    :param override: :class:'pthat.override.FeedOverride' applied to the commands as they are written - default None
+    """
+    __owns_serial = False   # if the serial port was opened by this connection and should be closed by it
+
+    def __init__(self, serial_port=None, serial_device="/dev/ttyS0", baud_rate=115200, allocator=None,
+                 on_reply=None, clock=None, override=None):
+        """
+        Constructor
+        """
+        self.clock = get_clock() if clock is None else clock
+        if serial_port is None:
+            serial_port = serial.Serial(port=serial_device, baudrate=baud_rate, timeout=0.1, write_timeout=2)
+            self.__owns_serial = True
+        self.serial = serial_port
+        self.allocator = CommandIDAllocator(clock=self.clock) if allocator is None else allocator
+        self.on_reply = on_reply
+        self.override = override
+        self.unmatched = queue.SimpleQueue()
+        """
+        Replies not matched to a command when on_reply is not set
+        """
+        self.priority_latency = RunningStats("priority latency")
+        """
+        Statistics of the time in nanoseconds from submitting a stop all or reset command until it was written
+        """
+        self.writes = 0
+        """
+        Number of commands written
+        """
+
+        self._outbound = queue.SimpleQueue()
+        self._write_lock = threading.Lock()     # held only while a single command is written
+        self._generation = 0                    # bumped by a stop all or reset, with the write lock held
+        self._ids = threading.Condition()       # held only while an ID is handed out or a reply is matched
+        self._futures = {}
+        self._listeners = {}
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_commands, name="pthat-writer", daemon=True)
+        self._reader = threading.Thread(target=self._read_replies, name="pthat-reader", daemon=True)
+        self._writer.start()
+        self._reader.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, command, received_only=False, timeout=None, listener=None, completions=1):
+        """
+        Queue a command to be sent with the next free command ID. Stop all and reset commands are written straight
+        away.
+
+        :param command: command string, such as one returned by a command method with auto_send_command off
+        :param received_only: resolve the future when the received reply arrives instead of when the command has
+                              completed, for example for a start command on a long move - default False
+        :param timeout: seconds to wait for a free command ID, None to wait for as long as it takes - default None
+        :param listener: function called from the reader thread with each reply matched to the command as it arrives,
+                         until the command has completed - default None
+        :param completions: number of completed replies the command is sent back, such as one for each axis started
+                            by a start all - default 1
+        :returns: future resolved with the :class:'pthat.pipeline.InFlightCommand', or with None for commands without
+                  an ID as nothing is sent back for them
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        future.received_only = received_only
+        with self._ids:
+            if not self._ids.wait_for(lambda: self.allocator.available or self._closed, timeout):
+                future.set_exception(TimeoutError(f"No command ID free to send {command}"))
+                return future
+            if self._closed:
+                future.set_exception(ConnectionError("Connection closed"))
+                return future
+            command, entry = self._assign(command, future, completions)
+            if entry is not None and listener is not None:
+                self._listeners[entry.command_id] = (entry, listener)
+
+        data = command.encode("utf-8")
+        if is_stop_all_command(data):
+            self._write_priority(data, cancel_queued=True)
+        else:
+            self._outbound.put((self._generation, data))
+        if entry is None:
+            future.set_result(None)
+        return future
+
+    def submit_many(self, commands, received_only=False, timeout=None):
+        """
+        Queue several commands to be written together in a single write. IDs are handed out for all of them before
+        anything is queued, so they go out in one piece. Stop and reset commands have to be sent with :meth:'submit'.
+
+        :param commands: list of command strings
+        :param received_only: resolve the futures on the received replies - default False
+        :param timeout: seconds to wait for enough free command IDs, None to wait for as long as it takes - default None
+        :returns: list of futures, one for each command, as returned by :meth:'submit'
+        :rtype: list
+        """
+        if any(is_priority_command(command.encode("utf-8")) for command in commands):
+            raise ValueError("Stop and reset commands can not be written together with other commands")
+
+        futures = [Future() for command in commands]
+        for future in futures:
+            future.received_only = received_only
+        with self._ids:
+            if not self._ids.wait_for(lambda: self.allocator.available >= len(commands) or self._closed, timeout):
+                for future in futures:
+                    future.set_exception(TimeoutError(f"No command IDs free to send {len(commands)} commands"))
+                return futures
+            if self._closed:
+                for future in futures:
+                    future.set_exception(ConnectionError("Connection closed"))
+                return futures
+            assigned = [self._assign(command, future, 1) for command, future in zip(commands, futures)]
+
+        self._outbound.put((self._generation, "".join(command for command, entry in assigned).encode("utf-8")))
+        for future, (command, entry) in zip(futures, assigned):
+            if entry is None:
+                future.set_result(None)
+        return futures
+
+    def request(self, command, received_only=False, timeout=None):
+        """
+        Send a command and wait for it
+
+        :param command: command string
+        :param received_only: wait for the received reply only - default False
+        :param timeout: seconds to wait for an ID and again for the command - default None to wait for ever
+        :returns: the command once it has completed
+        :rtype: pthat.pipeline.InFlightCommand
+        """
+        return self.submit(command, received_only, timeout).result(timeout)
+
+    def set_feed_override(self, factor, timeout=None):
+        """
+        Change the factor of the feed override. Commands still in the queue are written with the new factor and a
+        change speed command is sent for every axis that is moving.
+
+        :param factor: new feed override factor
+        :param timeout: seconds to wait for free command IDs, None to wait for as long as it takes - default None
+        :returns: list of futures of the change speed commands
+        :rtype: list
+        """
+        if self.override is None:
+            raise ValueError("The connection has no feed override")
+        return [self.submit(command, timeout=timeout) for command in self.override.set(factor)]
+
+    def emergency_stop(self, reset=False):
+        """
+        Cancel every command waiting in the queue and write the stop all command I00TA*, or the reset command N*,
+        straight away
+
+        :param reset: send the reset command instead of stop all - default False
+        """
+        self._write_priority(b"N*" if reset else b"I00TA*", cancel_queued=True)
+
+    def close(self):
+        """
+        Stop the threads, fail anything still in flight and close the serial port if the connection opened it
+        """
+        with self._ids:
+            if self._closed:
+                return
+            self._closed = True
+            self._ids.notify_all()
+        self._outbound.put(_STOP)
+        self._writer.join()
+        self._reader.join()
+        with self._ids:
+            for command_id, future in self._futures.items():
+                future.set_exception(ConnectionError("Connection closed"))
+                self.allocator.release(command_id)
+            self._futures.clear()
+            self._listeners.clear()
+        if self.__owns_serial:
+            self.serial.close()
+
+    def _assign(self, command, future, completions):
+        """
+        Give a command its ID and keep its future, with the ID lock held
+        """
+        command, entry = self.allocator.assign(command)
+        future.entry = entry
+        if entry is not None:
+            entry.completions = completions
+            self._futures[entry.command_id] = future
+        return command, entry
+
+    def _write_priority(self, data, cancel_queued):
+        """
+        Write a stop all or reset command ahead of the queue
+        """
+        start = self.clock.perf_counter_ns()
+        if self.override is not None:
+            # A reset sends no completed replies, so the override has to see it to forget the moving axes
+            data = self.override.scale(data)
+        with self._write_lock:
+            if cancel_queued:
+                # The writer thread drops a command it took off the queue before this, instead of writing it after
+                self._generation += 1
+                self._cancel_queued()
+                data = discard_output(self.serial, data)
+            if registry.sending:
+                registry.send(self, self.serial.write, data, self.clock)
+            else:
+                self.serial.write(data)
+            self.serial.flush()
+            self.writes += 1
+        self.priority_latency.add(self.clock.perf_counter_ns() - start)
+
+    def _cancel_queued(self):
+        """
+        Take every command off the outbound queue and cancel its future
+        """
+        while True:
+            try:
+                item = self._outbound.get_nowait()
+            except queue.Empty:
+                return
+            if item is _STOP:
+                self._outbound.put(_STOP)
+                return
+            self._cancel(item[1])
+
+    def _cancel(self, data):
+        """
+        Cancel the futures of the commands in the bytes of one write
+        """
+        with self._ids:
+            for command_id in _command_ids(data):
+                future = self._futures.pop(command_id, None)
+                self._listeners.pop(command_id, None)
+                if future is not None:
+                    self.allocator.release(command_id)
+                    future.cancel()
+            self._ids.notify_all()
+
+    def _write_commands(self):
+        """
+        Writer thread
+        """
+        while True:
+            item = self._outbound.get()
+            if item is _STOP:
+                return
+            generation, data = item
+            if self.override is not None:
+                data = self.override.scale(data)
+            with self._write_lock:
+                if generation != self._generation:
+                    # A stop all or reset was written since the command was queued
+                    self._cancel(data)
+                    continue
+                with self._ids:
+                    now = self.clock.monotonic_ns()
+                    for command_id in _command_ids(data):
+                        entry = self.allocator.in_flight.get(command_id)
+                        if entry is not None:
+                            entry.sent_ns = now
+                if registry.sending:
+                    registry.send(self, self.serial.write, data, self.clock)
+                else:
+                    self.serial.write(data)
+                self.writes += 1
+
+    def _read_replies(self):
+        """
+        Reader thread
+        """
+        while not self._closed:
+            data = self.serial.read_until(b"*")
+            if not data:
+                continue
+            resp = data.decode("ascii", "replace")
+            if registry.on_reply:
+                self._call(registry.reply, self, resp)
+            if self.override is not None:
+                self._call(self.override.add_reply, resp)
+            listener = None
+            with self._ids:
+                entry = self.allocator.handle_reply(resp)
+                if entry is not None:
+                    listening = self._listeners.get(entry.command_id)
+                    if listening is not None and listening[0] is entry:
+                        listener = listening[1]
+                        if entry.completed:
+                            del self._listeners[entry.command_id]
+                    if entry.completed:
+                        self._ids.notify_all()
+                    future = self._futures.get(entry.command_id)
+                    # A command resolved on its received reply keeps its ID until it completes
+                    if future is not None and future.entry is entry and not entry.expects_result and \
+                            (entry.completed or (future.received_only and entry.received)):
+                        del self._futures[entry.command_id]
+                        future.set_result(entry)
+            if entry is not None:
+                if listener is not None:
+                    self._call(listener, resp)
+                continue
+            if self.on_reply is not None:
+                self._call(self.on_reply, resp)
+            else:
+                self.unmatched.put(resp)
+
+    @staticmethod
+    def _call(function, *args):
+        """
+        Call a function from the reader thread. Anything it raises is logged so the thread keeps reading replies.
+        """
+        try:
+            function(*args)
+        except Exception:
+            _logger.exception("Error calling %s from the reader thread", getattr(function, "__qualname__", function))
@@ -0,0 +1,641 @@
+"""
+Pulse Train Hat Daemon
+======================
+
+.. module:: pthat.daemon
+   :platform: Linux, Mac
+   :synopsis: Share one PTHat between several local processes over a Unix domain socket.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'PTHatDaemon' and :class:'DaemonSerial' classes and the main function of the pthatd command.
+
+Only one process can open the serial port of the PTHat. The daemon opens it with a :class:'pthat.connection.Connection'
+and serves any number of local clients over a Unix domain socket. Each client uses a :class:'DaemonSerial' as the
+serial_port of the usual :class:'pthat.pthat.Axis', :class:'pthat.pthat.ADC', :class:'pthat.pthat.AUX' and
+:class:'pthat.pthat.PWM' classes, so client code is the same as code that owns the serial port.
+
+The daemon gives each command a command ID that is free on the board and puts the ID the client used back into the
+replies before they are sent to that client. Clients can subscribe to telemetry, which sends them every pulse count, ADC
+and IO port status reply, whoever asked for it, and every reply that does not belong to a command.
+
+One client at a time can take control of the board. While a client has control, the motion, AUX and PWM commands of
+the other clients are rejected, and so is the reset command. Stop commands and commands that only read from the
+board are always accepted. A stop all from any client drops the commands still waiting to be written, of every client,
+and each of those commands is sent back to its client as MSG_CANCELLED.
+
+**Protocol**
+
+Every message is a 1 byte message type and a 2 byte little endian payload length, followed by the payload.
+
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| Message         | Direction | Payload                                                                               |
++=================+===========+=======================================================================================+
+| MSG_COMMAND     | to daemon | one command including its end character                                               |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| MSG_REPLY       | to client | one reply to a command the client sent                                                |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| MSG_TELEMETRY   | to client | one telemetry reply the client subscribed to                                          |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| MSG_SUBSCRIBE   | to daemon | 1 byte mask of the TELEMETRY_* kinds to receive                                       |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| MSG_CONTROL     | both      | 1 byte, to the daemon 1 = take control, 0 = give it back. To the client 1 = granted   |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| MSG_REJECTED    | to client | a command that was not sent because another client has control                        |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+| MSG_CANCELLED   | to client | a command that was not sent because a stop all was sent before it                     |
++-----------------+-----------+---------------------------------------------------------------------------------------+
+
+.. code-block:: python
+
+   # Run the daemon, or use the pthatd command
+   from pthat.daemon import PTHatDaemon
+   PTHatDaemon("/tmp/pthatd.sock", serial_device="/dev/ttyS0").serve_forever()
+
+   # In each client process
+   from pthat.daemon import DaemonSerial, TELEMETRY_PULSE_COUNT
+   from pthat.pthat import Axis
+
+   port = DaemonSerial("/tmp/pthatd.sock")
+   port.subscribe(TELEMETRY_PULSE_COUNT)
+   xaxis = Axis("X", command_id=1, serial_port=port)
+   xaxis.auto_send_command = True
+   if port.acquire_control():
+       xaxis.set_axis(frequency=1000.0, pulse_count=2000, direction=0)
+       ...
+"""
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+from pthat.clock import get_clock
+from pthat.coalesce import is_priority_command
+from pthat.connection import Connection
+from pthat.telemetry_log import ADC, PORT_STATUS, PULSE_COUNT, decode_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+DEFAULT_SOCKET_PATH = "/tmp/pthatd.sock"
+
+MESSAGE_HEADER = struct.Struct("<BH")
+"""
+Message type and payload length
+"""
+MSG_COMMAND = 1
+MSG_REPLY = 2
+MSG_TELEMETRY = 3
+MSG_SUBSCRIBE = 4
+MSG_CONTROL = 5
+MSG_REJECTED = 6
+MSG_CANCELLED = 7
+
+TELEMETRY_PULSE_COUNT = 1
+"""
+Subscribe to pulse count replies
+"""
+TELEMETRY_ADC = 2
+"""
+Subscribe to ADC result replies
+"""
+TELEMETRY_PORT_STATUS = 4
+"""
+Subscribe to IO port status result replies
+"""
+TELEMETRY_OTHER = 8
+"""
+Subscribe to replies that do not belong to any command, such as the auto count pulse out replies
+"""
+TELEMETRY_ALL = 15
+
+_TELEMETRY_KINDS = {PULSE_COUNT: TELEMETRY_PULSE_COUNT, ADC: TELEMETRY_ADC, PORT_STATUS: TELEMETRY_PORT_STATUS}
+# Commands that only read from the board and are accepted from any client - bytes 4-5
+_READ_ONLY_CODES = ("LI", "FW", "D1", "D2", "XP", "YP", "ZP", "EP")
+
+
+def send_message(sock, message_type, payload=b""):
+    """
+    Send one message on a socket
+
+    :param sock: the socket
+    :param message_type: one of the MSG_* message types
+    :param payload: payload bytes, at most 65535
+    """
+    sock.sendall(MESSAGE_HEADER.pack(message_type, len(payload)) + payload)
+
+
+def receive_message(sock):
+    """
+    Receive one message from a socket
+
+    :param sock: the socket
+    :returns: tuple of (message type, payload) or None if the socket was closed
+    :rtype: tuple
+    """
+    header = _receive_exactly(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+    message_type, length = MESSAGE_HEADER.unpack(header)
+    payload = _receive_exactly(sock, length)
+    if payload is None:
+        return None
+    return message_type, payload
+
+
+def _receive_exactly(sock, size):
+    """
+    Receive exactly size bytes or None if the socket was closed first
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return None
+        received += count
+    return bytes(data)
+
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    """
+    Serves one client connection on its own thread
+    """
+    def setup(self):
+        self.subscriptions = 0
+        self._send_lock = threading.Lock()
+
+    def send(self, message_type, payload=b""):
+        """
+        Send a message to the client, ignoring a client that has gone away
+        """
+        with self._send_lock:
+            try:
+                send_message(self.request, message_type, payload)
+            except OSError:
+                pass
+
+    def handle(self):
+        daemon = self.server.pthat_daemon
+        daemon.add_client(self)
+        try:
+            while True:
+                message = receive_message(self.request)
+                if message is None:
+                    return
+                message_type, payload = message
+                if message_type == MSG_COMMAND:
+                    daemon.handle_command(self, payload)
+                elif message_type == MSG_SUBSCRIBE:
+                    self.subscriptions = payload[0] if payload else 0
+                elif message_type == MSG_CONTROL:
+                    granted = daemon.control(self, bool(payload and payload[0]))
+                    self.send(MSG_CONTROL, bytes((granted,)))
+        except OSError:
+            return
+        finally:
+            daemon.remove_client(self)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PTHatDaemon:
+    """
+    .. class:: PTHatDaemon
+
+    Owns the serial port of a PTHat and serves local clients on a Unix domain socket.
+
+    :param socket_path: path of the Unix domain socket - default /tmp/pthatd.sock
+    :param serial_port: an open serial port or serial like object, such as a :class:'pthat.simulator.SimulatedSerial'
+                        - default None to open serial_device
+    :param serial_device: path to the serial device - default /dev/ttyS0
+    :param baud_rate: serial port baud rate - default 115200
+    :param clock: clock used to time the commands - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, serial_port=None, serial_device="/dev/ttyS0",
+                 baud_rate=115200, clock=None):
+        """
+        Constructor
+        """
+        self.socket_path = socket_path
+        self.clients = set()
+        """
+        Connected clients
+        """
+        self.controller = None
+        """
+        The client that has control or None
+        """
+        self.rejected = 0
+        """
+        Number of commands rejected because another client had control
+        """
+        self._lock = threading.Lock()
+        self._buffer_client = None  # client that sent the last buffer command, it gets the buffer replies
+        self._auto_count_clients = {}   # axis letter to (client, client command ID) of the last auto count command
+        self._auto_count_client = None  # client of the last auto count announcement, it gets the pulse counts
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self._server = _UnixServer(socket_path, _ClientHandler)
+        self._server.pthat_daemon = self
+        self._thread = None
+        self._serving = False
+        self.connection = Connection(serial_port=serial_port, serial_device=serial_device, baud_rate=baud_rate,
+                                     on_reply=self._fan_out, clock=get_clock() if clock is None else clock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def serve_forever(self):
+        """
+        Serve clients until :meth:'close' is called
+        """
+        self._serving = True
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Serve clients on a background thread
+        """
+        self._serving = True
+        self._thread = threading.Thread(target=self.serve_forever, name="pthatd", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop serving, close the connection to the PTHat and remove the socket
+        """
+        # shutdown waits for serve_forever to return, so it would never return if serving was not started
+        if self._serving:
+            self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+        for client in list(self.clients):
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.connection.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def add_client(self, client):
+        """
+        Register a client that has connected
+        """
+        with self._lock:
+            self.clients.add(client)
+
+    def remove_client(self, client):
+        """
+        Forget a client that has gone away and take control back from it
+        """
+        with self._lock:
+            self.clients.discard(client)
+            if self.controller is client:
+                self.controller = None
+            if self._buffer_client is client:
+                self._buffer_client = None
+            if self._auto_count_client is client:
+                self._auto_count_client = None
+            for axis, (owner, client_id) in list(self._auto_count_clients.items()):
+                if owner is client:
+                    del self._auto_count_clients[axis]
+
+    def control(self, client, take):
+        """
+        Take or give back control for a client
+
+        :param client: the client
+        :param take: True to take control, False to give it back
+        :returns: True if the client has control afterwards
+        :rtype: bool
+        """
+        with self._lock:
+            if take and self.controller is None:
+                self.controller = client
+            elif not take and self.controller is client:
+                self.controller = None
+            return self.controller is client
+
+    def handle_command(self, client, data):
+        """
+        Send a command from a client to the PTHat, or reject it if another client has control
+
+        :param client: the client
+        :param data: the command bytes
+        """
+        command = data.decode("ascii", "replace")
+        with self._lock:
+            controller = self.controller
+            # Any client can stop the axes, but only the client in control can reset the board
+            if controller is not None and controller is not client and \
+                    (data == b"N*" or (not is_priority_command(data) and command[3:5] not in _READ_ONLY_CODES)):
+                self.rejected += 1
+                client.send(MSG_REJECTED, data)
+                return
+            if not command[1:3].isdigit():
+                self._buffer_client = client
+            elif command[3:4] == "J":
+                self._auto_count_clients[command[4:5]] = (client, command[1:3])
+
+        client_id = command[1:3]
+
+        def listener(resp):
+            if len(resp) >= 7 and resp[0] in "RCD" and resp[1] in "IB" and resp[2:4].isdigit():
+                resp = resp[:2] + client_id + resp[4:]
+            else:
+                self._fan_out(resp, client)
+            client.send(MSG_REPLY, resp.encode("ascii"))
+
+        def done(future):
+            if future.cancelled():
+                client.send(MSG_CANCELLED, data)
+
+        self.connection.submit(command, received_only=True, listener=listener).add_done_callback(done)
+
+    def _fan_out(self, resp, requester=None):
+        """
+        Send a reply to the clients subscribed to its kind. Buffer replies go to the client that sent the last
+        buffer command. Auto count announcements and the pulse counts after them also go to the client that sent the
+        auto count command.
+        """
+        if resp.startswith("RB"):
+            client = self._buffer_client
+            if client is not None:
+                client.send(MSG_REPLY, resp.encode("ascii"))
+            return
+
+        decoded = decode_reply(resp)
+        with self._lock:
+            if len(resp) >= 7 and resp[0] == "D" and resp[4] == "J":
+                owner, client_id = self._auto_count_clients.get(resp[5], (None, None))
+                self._auto_count_client = requester = owner
+                if owner is not None:
+                    owner.send(MSG_REPLY, f"{resp[:2]}{client_id}{resp[4:]}".encode("ascii"))
+            elif decoded is not None and decoded[0] == PULSE_COUNT and requester is None:
+                requester = self._auto_count_client
+                if requester is not None:
+                    requester.send(MSG_REPLY, resp.encode("ascii"))
+
+            kind = TELEMETRY_OTHER if decoded is None else _TELEMETRY_KINDS[decoded[0]]
+            clients = [c for c in self.clients if c.subscriptions & kind and c is not requester]
+        payload = resp.encode("ascii")
+        for client in clients:
+            client.send(MSG_TELEMETRY, payload)
+
+
+class DaemonSerial:
+    """
+    .. class:: DaemonSerial
+
+    Serial like object connected to a :class:'PTHatDaemon'. Pass it as the serial_port of the PTHat classes.
+
+    :param socket_path: path of the daemon socket - default /tmp/pthatd.sock
+    :param timeout: read timeout in seconds - default 2
+    :param on_telemetry: function called from the receiving thread with each telemetry reply - default None to keep
+                         them in :attr:'telemetry'
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=2, on_telemetry=None):
+        """
+        Constructor
+        """
+        self.timeout = timeout
+        self.on_telemetry = on_telemetry
+        self.is_open = True
+        self.telemetry = queue.SimpleQueue()
+        """
+        Telemetry replies when on_telemetry is not set
+        """
+        self.rejected = []
+        """
+        Commands the daemon rejected because another client had control
+        """
+        self.cancelled = []
+        """
+        Commands the daemon did not send because a stop all was sent before them
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._output = b""
+        self._input = bytearray()
+        self._arrived = threading.Condition()
+        self._control = None
+        self._thread = threading.Thread(target=self._receive, name="pthatd-client", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def in_waiting(self):
+        """
+        Number of reply bytes that can be read without waiting
+        """
+        with self._arrived:
+            return len(self._input)
+
+    @property
+    def out_waiting(self):
+        """
+        Number of bytes of a command written without its end character
+        """
+        return len(self._output)
+
+    def subscribe(self, kinds=TELEMETRY_ALL):
+        """
+        Choose the telemetry to receive
+
+        :param kinds: mask of TELEMETRY_PULSE_COUNT, TELEMETRY_ADC, TELEMETRY_PORT_STATUS and TELEMETRY_OTHER, 0 to
+                      stop receiving telemetry - default all of them
+        """
+        send_message(self._socket, MSG_SUBSCRIBE, bytes((kinds,)))
+
+    def acquire_control(self):
+        """
+        Take control of the board so the motion, AUX and PWM commands of other clients are rejected
+
+        :returns: True if control was granted
+        :rtype: bool
+        """
+        return self._request_control(True)
+
+    def release_control(self):
+        """
+        Give control of the board back
+        """
+        self._request_control(False)
+
+    def write(self, data):
+        """
+        Send each complete command to the daemon. A command written without its end character is held until the rest
+        of it is written.
+
+        :param data: bytes to write
+        :returns: number of bytes written
+        :rtype: int
+        """
+        self._output += bytes(data)
+        while True:
+            end = self._output.find(b"*")
+            if end < 0:
+                break
+            command, self._output = self._output[:end + 1], self._output[end + 1:]
+            if len(command) > 1:
+                send_message(self._socket, MSG_COMMAND, command)
+        return len(data)
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Read replies up to and including expected, waiting up to the timeout for more to arrive
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        with self._arrived:
+            self._arrived.wait_for(lambda: expected in self._input or not self.is_open
+                                   or (size is not None and len(self._input) >= size), self.timeout)
+            end = self._input.find(expected)
+            end = len(self._input) if end < 0 else end + len(expected)
+            if size is not None:
+                end = min(end, size)
+            data = bytes(self._input[:end])
+            del self._input[:end]
+            return data
+
+    def read(self, size=1):
+        """
+        Read up to size bytes of replies that have arrived
+
+        :param size: number of bytes
+        :returns: bytes read
+        :rtype: bytes
+        """
+        with self._arrived:
+            data = bytes(self._input[:size])
+            del self._input[:size]
+            return data
+
+    def flush(self):
+        """
+        Commands are sent to the daemon as soon as they are complete so there is nothing to flush
+        """
+
+    def reset_input_buffer(self):
+        """
+        Drop replies that have not been read
+        """
+        with self._arrived:
+            self._input.clear()
+
+    def reset_output_buffer(self):
+        """
+        Drop a command written without its end character
+        """
+        self._output = b""
+
+    def close(self):
+        """
+        Disconnect from the daemon
+        """
+        if self.is_open:
+            self.is_open = False
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            self._thread.join()
+
+    def _request_control(self, take):
+        """
+        Ask the daemon for control or give it back and wait for the answer
+        """
+        with self._arrived:
+            self._control = None
+            send_message(self._socket, MSG_CONTROL, bytes((int(take),)))
+            self._arrived.wait_for(lambda: self._control is not None or not self.is_open, self.timeout)
+            return bool(self._control)
+
+    def _receive(self):
+        """
+        Receiving thread
+        """
+        try:
+            while True:
+                message = receive_message(self._socket)
+                if message is None:
+                    break
+                message_type, payload = message
+                if message_type == MSG_REPLY:
+                    with self._arrived:
+                        self._input += payload
+                        self._arrived.notify_all()
+                elif message_type == MSG_TELEMETRY:
+                    resp = payload.decode("ascii", "replace")
+                    if self.on_telemetry is not None:
+                        self.on_telemetry(resp)
+                    else:
+                        self.telemetry.put(resp)
+                elif message_type == MSG_CONTROL:
+                    with self._arrived:
+                        self._control = payload[0]
+                        self._arrived.notify_all()
+                elif message_type == MSG_REJECTED:
+                    self.rejected.append(payload.decode("ascii", "replace"))
+                elif message_type == MSG_CANCELLED:
+                    self.cancelled.append(payload.decode("ascii", "replace"))
+        except OSError:
+            pass
+        finally:
+            with self._arrived:
+                self.is_open = False
+                self._arrived.notify_all()
+
+
+def main(argv=None):
+    """
+    Run the pthatd daemon
+
+    :param argv: command line arguments - default sys.argv
+    """
+    parser = argparse.ArgumentParser(prog="pthatd", description="Share one PTHat between local processes")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="path of the Unix domain socket")
+    parser.add_argument("--device", default="/dev/ttyS0", help="serial device of the PTHat")
+    parser.add_argument("--baud", type=int, default=115200, help="serial port baud rate")
+    parser.add_argument("--simulate", action="store_true", help="serve a simulated PTHat instead of the serial device")
+    args = parser.parse_args(argv)
+
+    serial_port = None
+    if args.simulate:
+        from pthat.simulator import SimulatedSerial
+        serial_port = SimulatedSerial(baud_rate=args.baud, timeout=0.1)
+
+    daemon = PTHatDaemon(args.socket, serial_port=serial_port, serial_device=args.device, baud_rate=args.baud)
+    print(f"pthatd serving {'a simulated PTHat' if args.simulate else args.device} on {args.socket}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
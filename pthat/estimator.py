@@ -0,0 +1,413 @@
+"""
+Pulse Train Hat Cycle Time Estimator
+====================================
+
+.. module:: pthat.estimator
+   :platform: Mac, Linux, Windows
+   :synopsis: Work out how long a program of commands takes to run without a PTHat.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'CycleTimeEstimator', :class:'ProgramEstimate' and :class:'Segment' classes and the
+:func:'move_time_ns' function.
+
+A :class:'CycleTimeEstimator' walks a list of commands the way the host and the PTHat would run them. Every command
+takes the time its bytes take on the wire at the baud rate, and the host waits for the received reply of each one.
+A start command starts the axes and the host carries on, so change speed and other commands can be sent while the
+axes move. The host only waits for an axis when it sets up or starts it again, and for every axis at the end of the
+program. Moves use the ramp model of :class:'pthat.simulator.MotionProfile'. A change speed carries on with the rest of
+the move at the new frequency without a ramp, like the simulator does.
+
+Buffered commands are sent to the buffer with their received replies and are run by the firmware when the buffer is
+started. Each takes command_time, wait delays take their delay and the host waits for the buffer to finish. A looped
+buffer is counted once.
+
+The time is split into segments, a new one at each start and buffer start, and each segment into the time spent
+sending commands, waiting for replies, running buffered commands, in wait delays and waiting for axes to finish.
+
+The move times of every set axis command are worked out together with NumPy when it is installed, so programs of a
+million commands take seconds.
+
+.. code-block:: python
+
+   from pthat.estimator import CycleTimeEstimator
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", test_mode=True)
+   program = [xaxis.set_axis(frequency=1000.0, pulse_count=10000, start_ramp=1, finish_ramp=1, ramp_divide=100,
+                             ramp_pause=10),
+              xaxis.start()]
+   estimate = CycleTimeEstimator(baud_rate=115200).estimate(program * 100)
+   print(estimate.total_ns / 1e9, estimate.totals())
+"""
+from pthat.simulator import RAMP_TICK_S, MotionProfile
+
+try:
+    import numpy
+except ImportError:     # NumPy is optional, move times are then worked out one at a time
+    numpy = None
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+REPLY_BYTES = 7
+"""
+Length of a received or completed reply, such as RI00CX*
+"""
+CATEGORIES = ("transmit", "replies", "firmware", "delays", "motion")
+"""
+Categories the time of each segment is split into
+"""
+
+_SET_AXIS_LENGTH = 37   # length of a set axis command, all of its fields are a fixed width
+
+
+def move_time_ns(frequency, pulse_count, start_ramp=0, finish_ramp=0, ramp_divide=0, ramp_pause=0):
+    """
+    Work out how long a move takes, the same as the duration of a :class:'pthat.simulator.MotionProfile'
+
+    :param frequency: frequency in Hz
+    :param pulse_count: number of pulses
+    :param start_ramp: start ramp, 0 or 1 - default 0
+    :param finish_ramp: finish ramp, 0 or 1 - default 0
+    :param ramp_divide: ramp divide 0-255 - default 0
+    :param ramp_pause: ramp pause 0-255 - default 0
+    :returns: nanoseconds or None for a move that runs until stopped
+    :rtype: int
+    """
+    if frequency <= 0 or pulse_count == 0:
+        return None
+    step_ns = int((ramp_pause + 1) * RAMP_TICK_S * 1e9)
+    levels = ramp_divide - 1 if ramp_divide > 1 else 0
+    ramp_ns = ((1 if start_ramp else 0) + (1 if finish_ramp else 0)) * levels * step_ns
+    # The levels of a ramp go up evenly, so on average a ramp runs at half the frequency
+    ramp_pulses = ramp_ns * frequency / 2e9
+    if ramp_pulses >= pulse_count:
+        return int(ramp_ns * pulse_count / ramp_pulses)
+    return ramp_ns + int((pulse_count - ramp_pulses) / frequency * 1e9)
+
+
+def _parse_set_axis(command):
+    """
+    The frequency, pulse count, start ramp, finish ramp, ramp divide and ramp pause of a set axis command
+    """
+    body = command[5:]
+    return (float(body[0:10]), int(body[10:20]), int(body[21]), int(body[22]), int(body[23:26]),
+            int(body[26:29]))
+
+
+def _set_axis_moves(commands):
+    """
+    Parse a list of set axis commands and work out their move times
+
+    :returns: list of (settings, move time ns) in the same order
+    """
+    if numpy is None or not commands or any(len(command) != _SET_AXIS_LENGTH for command in commands):
+        return [(settings, move_time_ns(*settings)) for settings in map(_parse_set_axis, commands)]
+
+    digits = numpy.frombuffer("".join(commands).encode("ascii"), dtype=numpy.uint8)
+    digits = digits.reshape(len(commands), _SET_AXIS_LENGTH).astype(numpy.int64) - ord("0")
+
+    def number(start, end):
+        return digits[:, start:end] @ (10 ** numpy.arange(end - start - 1, -1, -1, dtype=numpy.int64))
+
+    frequency = number(5, 11) + number(12, 15) / 1000.0
+    pulse_count = number(15, 25)
+    start_ramp, finish_ramp = digits[:, 26], digits[:, 27]
+    ramp_divide, ramp_pause = number(28, 31), number(31, 34)
+
+    step_ns = ((ramp_pause + 1) * int(RAMP_TICK_S * 1e9))
+    levels = numpy.where(ramp_divide > 1, ramp_divide - 1, 0)
+    ramp_ns = ((start_ramp > 0).astype(numpy.int64) + (finish_ramp > 0)) * levels * step_ns
+    ramp_pulses = ramp_ns * frequency / 2e9
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        ramped = (ramp_ns * (pulse_count / ramp_pulses)).astype(numpy.int64)
+        cruise = ramp_ns + ((pulse_count - ramp_pulses) / frequency * 1e9).astype(numpy.int64)
+    moves = numpy.where(ramp_pulses >= pulse_count, ramped, cruise)
+    moves = numpy.where((frequency <= 0) | (pulse_count == 0), -1, moves)
+
+    settings = zip(frequency.tolist(), pulse_count.tolist(), start_ramp.tolist(), finish_ramp.tolist(),
+                   ramp_divide.tolist(), ramp_pause.tolist())
+    return [(setting, None if move < 0 else move) for setting, move in zip(settings, moves.tolist())]
+
+
+class Segment:
+    """
+    .. class:: Segment
+
+    Time spent in one part of a program, from a start or buffer start up to the next one.
+
+    :param index: index of the command the segment starts with
+    :param start_ns: nanoseconds from the start of the program
+    """
+    def __init__(self, index, start_ns):
+        """
+        Constructor
+        """
+        self.index = index
+        self.start_ns = start_ns
+        self.transmit = 0
+        """
+        Nanoseconds sending commands
+        """
+        self.replies = 0
+        """
+        Nanoseconds waiting for replies
+        """
+        self.firmware = 0
+        """
+        Nanoseconds the firmware spent running buffered commands
+        """
+        self.delays = 0
+        """
+        Nanoseconds in wait delays
+        """
+        self.motion = 0
+        """
+        Nanoseconds waiting for axes to finish
+        """
+
+    @property
+    def duration_ns(self):
+        """
+        Length of the segment in nanoseconds
+
+        :rtype: int
+        """
+        return self.transmit + self.replies + self.firmware + self.delays + self.motion
+
+    def as_dict(self):
+        """
+        :returns: the index, start, duration and the time of each category in nanoseconds
+        :rtype: dict
+        """
+        times = {category: getattr(self, category) for category in CATEGORIES}
+        return dict(index=self.index, start_ns=self.start_ns, duration_ns=self.duration_ns, **times)
+
+
+class ProgramEstimate:
+    """
+    .. class:: ProgramEstimate
+
+    Estimated run time of a program, returned by :meth:'CycleTimeEstimator.estimate'.
+
+    :param segments: list of :class:'Segment'
+    """
+    def __init__(self, segments):
+        """
+        Constructor
+        """
+        self.segments = segments
+
+    @property
+    def total_ns(self):
+        """
+        Run time of the whole program in nanoseconds
+
+        :rtype: int
+        """
+        return sum(segment.duration_ns for segment in self.segments)
+
+    def totals(self):
+        """
+        :returns: dict of category to nanoseconds over the whole program
+        :rtype: dict
+        """
+        return {category: sum(getattr(segment, category) for segment in self.segments) for category in CATEGORIES}
+
+
+class _AxisState:
+    """
+    What the estimator knows about one axis
+    """
+    __slots__ = ("settings", "move_ns", "start_ns", "end_ns", "running", "profile_pulses")
+
+    def __init__(self):
+        self.settings = None        # (frequency, pulse count, start ramp, finish ramp, ramp divide, ramp pause)
+        self.move_ns = None
+        self.start_ns = 0
+        self.end_ns = None          # None while running until stopped
+        self.running = False
+        self.profile_pulses = None  # (pulses at start_ns, frequency) once the move is run at a fixed frequency
+
+
+class CycleTimeEstimator:
+    """
+    .. class:: CycleTimeEstimator
+
+    Estimates how long programs take to run.
+
+    :param baud_rate: serial port baud rate - default 115200
+    :param latency: microseconds from a reply being sent until the host reads it, on top of its time on the wire
+                    - default 0
+    :param command_time: microseconds the PTHat takes to run each buffered command - default 1
+    :param wait_for_replies: the host waits for the received reply of each command before sending the next, False for
+                             commands sent back to back such as with :class:'pthat.pipeline.Pipeline' - default True
+    """
+    def __init__(self, baud_rate=115200, latency=0, command_time=1, wait_for_replies=True):
+        """
+        Constructor
+        """
+        if baud_rate <= 0:
+            raise ValueError(f"Invalid baud rate {baud_rate}. Must be greater than 0")
+        if latency < 0 or command_time < 0:
+            raise ValueError("The latency and command time must be 0 or more")
+
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.command_time = command_time
+        self.wait_for_replies = wait_for_replies
+
+    def byte_time_ns(self, count):
+        """
+        :param count: number of bytes
+        :returns: nanoseconds the bytes take on the wire, 10 bits a byte
+        :rtype: float
+        """
+        return count * 10 * 1e9 / self.baud_rate
+
+    def estimate(self, commands):
+        """
+        Work out how long a program takes
+
+        :param commands: list of command strings, such as ones returned by the command methods in test mode
+        :returns: the estimate split into segments
+        :rtype: ProgramEstimate
+        """
+        commands = list(commands)
+        set_axis = [index for index, command in enumerate(commands) if command[3:4] == "C" and command[4:5] in "XYZE"
+                    and len(command) >= 34]
+        moves = dict(zip(set_axis, _set_axis_moves([commands[index] for index in set_axis])))
+
+        transmits = self._transmit_times(commands)
+        reply_ns = int(self.byte_time_ns(REPLY_BYTES) + self.latency * 1000)
+        command_ns = int(self.command_time * 1000)
+        axes = {axis: _AxisState() for axis in "XYZE"}
+        segment = Segment(0, 0)
+        segments = [segment]
+        buffer = []
+        now = 0
+
+        def wait_for(state):
+            nonlocal now
+            if state.end_ns is None:
+                raise ValueError("An axis that runs until stopped is waited for but never stopped")
+            done = state.end_ns + reply_ns
+            if done > now:
+                segment.motion += max(0, state.end_ns - now)
+                segment.replies += done - max(now, state.end_ns)
+                now = done
+            state.running = False
+
+        def run(index, command, at):
+            """
+            Carry out a command at a time, returning the nanoseconds it blocks for
+            """
+            code, letter = command[3:4], command[4:5]
+            if index in moves:
+                state = axes[letter]
+                state.settings, state.move_ns = moves[index]
+            elif code == "S":
+                for name in _letters(letter):
+                    state = axes[name]
+                    if state.running or state.settings is None or (letter == "A" and state.settings[0] <= 0):
+                        continue
+                    if state.move_ns is None:
+                        state.move_ns = move_time_ns(*state.settings)
+                    state.running = True
+                    state.start_ns = at
+                    state.end_ns = None if state.move_ns is None else at + state.move_ns
+                    state.profile_pulses = None
+            elif code == "Q" and letter in axes:
+                _change_speed(axes[letter], float(command[5:15]), at)
+            elif code == "T":
+                for name in _letters(letter):
+                    state = axes[name]
+                    if state.running and (state.end_ns is None or state.end_ns > at):
+                        state.end_ns = at
+            elif code == "W":
+                return int(command[5:9] or 0) * (1000000 if letter == "W" else 1000)
+            return 0
+
+        for index, (command, transmit) in enumerate(zip(commands, transmits)):
+            code, letter = command[3:4], command[4:5]
+            buffer_command = command[:1] in ("H", "Z", "W") and command[1:5] == "0000"
+            buffered = command[:1] == "B" and code != "T"
+            if not (buffered or buffer_command) and (code == "S" or index in moves):
+                for name in _letters(letter):
+                    if axes[name].running:
+                        wait_for(axes[name])
+            if (code == "S" and not buffered) or (buffer_command and command[:1] != "H"):
+                segment = Segment(index, now)
+                segments.append(segment)
+
+            segment.transmit += transmit
+            now += transmit
+            if buffered:
+                buffer.append((index, command))
+            elif buffer_command and command[:1] == "H":
+                buffer = []
+            elif buffer_command:
+                for buffered_index, buffered_command in buffer:
+                    block = run(buffered_index, buffered_command, now)
+                    segment.firmware += command_ns
+                    segment.delays += block
+                    now += command_ns + block
+            else:
+                block = run(index, command, now)
+                segment.delays += block
+                now += block
+            if self.wait_for_replies:
+                segment.replies += reply_ns
+                now += reply_ns
+
+        for state in axes.values():
+            if state.running:
+                wait_for(state)
+        if len(segments) > 1 and segments[0].duration_ns == 0:
+            del segments[0]
+        return ProgramEstimate(segments)
+
+    def _transmit_times(self, commands):
+        """
+        Nanoseconds each command takes on the wire
+        """
+        byte_ns = self.byte_time_ns(1)
+        if numpy is None:
+            return [int(len(command) * byte_ns) for command in commands]
+        lengths = numpy.fromiter(map(len, commands), dtype=numpy.int64, count=len(commands))
+        return (lengths * byte_ns).astype(numpy.int64).tolist()
+
+
+def _letters(letter):
+    """
+    The axes a command is for, all of them for A
+    """
+    return "XYZE" if letter == "A" else letter
+
+
+def _change_speed(state, frequency, at):
+    """
+    Carry on with the rest of the move of an axis at a new frequency without a ramp
+    """
+    if state.settings is None:
+        return
+    settings = state.settings
+    state.settings = (frequency,) + settings[1:]
+    state.move_ns = None
+    if not state.running or state.end_ns is None or state.end_ns <= at:
+        return
+
+    if state.profile_pulses is None:
+        pulses = MotionProfile(*settings).pulses_at(at - state.start_ns)
+    else:
+        base, previous = state.profile_pulses
+        pulses = base + int(previous * (at - state.start_ns) / 1e9 + 1e-6)
+    state.profile_pulses = (pulses, frequency)
+    state.start_ns = at
+    remaining = settings[1] - pulses
+    if remaining <= 0:
+        state.end_ns = at
+    elif frequency <= 0:
+        state.end_ns = None
+    else:
+        state.end_ns = at + int(remaining / frequency * 1e9)
@@ -0,0 +1,236 @@
+"""
+Pulse Train Hat Electronic Gearing
+==================================
+
+.. module:: pthat.gearing
+   :platform: Mac, Linux, Windows
+   :synopsis: Make a slave axis follow a master axis at a fixed ratio with change speed commands.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'ElectronicGearing' class.
+
+The master axis, such as a conveyor, sends back its pulse count with the auto count pulse out command. Every pulse count
+is fed to an :class:'ElectronicGearing', which works out the speed of the master and sends the slave a change speed
+command so the slave runs at ratio times the master speed. The part of the slave speed that comes from the master speed
+is the feed forward. On top of it a correction proportional to the tracking error pulls the slave back into position,
+where the tracking error is the number of pulses the slave is behind ratio times the pulses of the master.
+
+The new speed can be rate limited to protect a stepper motor from stalling, as change speed has no ramp. It is then
+passed through :meth:'pthat.pthat.Axis.change_speed', so it is checked against the same firmware limits, 0.0-125000.0.
+
+The slave position is worked out from the speeds sent to it. If the pulse count of the slave is also sent back, for
+example by setting both axes in the auto count pulse out command, it is used instead.
+
+.. code-block:: python
+
+   from pthat.gearing import ElectronicGearing
+   from pthat.pthat import Axis
+
+   conveyor = Axis("X", serial_device="/dev/ttyS0")
+   conveyor.auto_send_command = True
+   follower = Axis("Y", serial_port=conveyor.serial)
+   follower.auto_send_command = True
+
+   gearing = ElectronicGearing(follower, ratio=0.5, master_axis="X", max_rate=20000.0)
+   conveyor.set_auto_count_pulse_out(pulse_count=100, xreplies=1, yreplies=1)
+   ...
+   while True:
+       gearing.feed(conveyor.get_all_responses())
+       print(f"Tracking error {gearing.tracking_error.last} pulses")
+"""
+from pthat.clock import get_clock
+from pthat.stats import RunningStats
+from pthat.telemetry import AXES, RingBuffer, parse_pulse_count_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+MIN_CHANGE_SPEED_FREQUENCY = 0.0
+"""
+Lowest frequency the firmware accepts in a change speed command
+"""
+MAX_CHANGE_SPEED_FREQUENCY = 125000.0
+"""
+Highest frequency the firmware accepts in a change speed command
+"""
+
+
+class ElectronicGearing:
+    """
+    .. class:: ElectronicGearing
+
+    Sends change speed commands to a slave axis so it follows the pulse counts of a master axis at a ratio.
+
+    :param slave: the :class:'pthat.pthat.Axis' of the slave. Its change_speed method builds the commands and sends
+                  them when auto_send_command is on.
+    :param ratio: slave pulses for each master pulse - default 1.0
+    :param master_axis: letter of the master axis - default X
+    :param feed_forward: fraction of ratio times the master speed that is sent to the slave straight away
+                         - default 1.0
+    :param gain: correction in Hz for each pulse of tracking error - default 1.0
+    :param max_rate: largest change of the slave frequency in Hz per second - default None for no limit
+    :param send: function called with each change speed command - default None as the slave sends it
+    :param capacity: number of tracking error samples to keep - default 10000
+    :param clock: clock used to timestamp the pulse counts - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, slave, ratio=1.0, master_axis="X", feed_forward=1.0, gain=1.0, max_rate=None, send=None,
+                 capacity=10000, clock=None):
+        """
+        Constructor
+        """
+        if master_axis not in AXES:
+            raise ValueError(f"Invalid master axis {master_axis}. Must be X, Y, Z or E")
+        if master_axis == slave.axis:
+            raise ValueError("The master and slave must be different axes")
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError(f"Invalid max rate {max_rate}. Must be greater than 0")
+
+        self.slave = slave
+        self.ratio = ratio
+        self.master_axis = master_axis
+        self.feed_forward = feed_forward
+        self.gain = gain
+        self.max_rate = max_rate
+        self.send = send
+        self.clock = get_clock() if clock is None else clock
+        self.frequency = 0.0
+        """
+        Frequency last sent to the slave
+        """
+        self.master_speed = 0.0
+        """
+        Speed of the master in pulses per second worked out from its last two pulse counts
+        """
+        self.slave_position = 0.0
+        """
+        Slave pulses since the gearing started, measured if the slave pulse counts are fed, otherwise worked out from
+        the frequencies sent
+        """
+        self.tracking_error = RunningStats("tracking error", unit="pulses")
+        """
+        Statistics of the tracking error at each master pulse count
+        """
+        self.history = RingBuffer((("ns", "q"), ("error", "d"), ("frequency", "d")), capacity)
+        """
+        Tracking error and slave frequency at each master pulse count
+        """
+        self.commands = 0
+        """
+        Number of change speed commands sent
+        """
+        self.rejected = 0
+        """
+        Number of change speed commands the slave rejected
+        """
+        self._master_origin = None
+        self._master_count = None
+        self._master_ns = None
+        self._slave_origin = None
+        self._slave_ns = None
+
+    def reset(self):
+        """
+        Forget the pulse counts seen so far, so the next master pulse count starts the gearing again
+        """
+        self._master_origin = self._master_count = self._master_ns = self._slave_origin = self._slave_ns = None
+        self.master_speed = 0.0
+        self.slave_position = 0.0
+        self.tracking_error.reset()
+        self.history.clear()
+
+    def add_reply(self, resp, ns=None):
+        """
+        Use a single reply. Pulse counts of the master update the slave speed and pulse counts of the slave update its
+        position.
+
+        :param resp: a single response string
+        :param ns: timestamp in monotonic nanoseconds - default now
+        :returns: True if the reply was a pulse count of the master or slave, otherwise False
+        :rtype: bool
+        """
+        parsed = parse_pulse_count_reply(resp)
+        if parsed is None:
+            return False
+
+        axis = AXES[parsed[0]]
+        ns = self.clock.monotonic_ns() if ns is None else ns
+        if axis == self.master_axis:
+            self.update(parsed[2], ns)
+        elif axis == self.slave.axis:
+            self._advance_slave(ns)
+            if self._slave_origin is None:
+                self._slave_origin = parsed[2] - self.slave_position
+            self.slave_position = parsed[2] - self._slave_origin
+        else:
+            return False
+        return True
+
+    def feed(self, responses):
+        """
+        Use a list of replies such as the one returned by get_all_responses. Replies that are not pulse counts of the
+        master or slave are returned so they can still be parsed by the caller.
+
+        :param responses: list of responses
+        :returns: list of responses that were not used
+        :rtype: list
+        """
+        others = []
+        if responses is not None:
+            ns = self.clock.monotonic_ns()
+            for resp in responses:
+                if not self.add_reply(resp, ns):
+                    others.append(resp)
+        return others
+
+    def update(self, master_count, ns=None):
+        """
+        Work out the slave speed from a master pulse count and send it if it has changed
+
+        :param master_count: pulse count of the master
+        :param ns: timestamp of the pulse count in monotonic nanoseconds - default now
+        :returns: the change speed command sent or None if the speed did not change
+        :rtype: str
+        """
+        ns = self.clock.monotonic_ns() if ns is None else ns
+        if self._master_ns is None:
+            self._master_origin = self._master_count = master_count
+            self._master_ns = ns
+            return None
+
+        seconds = (ns - self._master_ns) / 1e9
+        if seconds <= 0:
+            return None
+
+        self._advance_slave(ns)
+        self.master_speed = (master_count - self._master_count) / seconds
+        self._master_count = master_count
+        self._master_ns = ns
+
+        error = self.ratio * (master_count - self._master_origin) - self.slave_position
+        self.tracking_error.add(error)
+        target = self.feed_forward * self.ratio * self.master_speed + self.gain * error
+        if self.max_rate is not None:
+            step = self.max_rate * seconds
+            target = min(max(target, self.frequency - step), self.frequency + step)
+        target = round(min(max(target, MIN_CHANGE_SPEED_FREQUENCY), MAX_CHANGE_SPEED_FREQUENCY), 3)
+        self.history.append(ns, error, target)
+        if target == self.frequency:
+            return None
+
+        command = self.slave.change_speed(target)
+        if not command:
+            self.rejected += 1
+            return None
+        if self.send is not None:
+            self.send(command)
+        self.frequency = target
+        self.commands += 1
+        return command
+
+    def _advance_slave(self, ns):
+        """
+        Move the worked out slave position on to a time at the frequency last sent
+        """
+        if self._slave_ns is not None:
+            self.slave_position += self.frequency * (ns - self._slave_ns) / 1e9
+        self._slave_ns = ns
@@ -0,0 +1,384 @@
+"""
+Pulse Train Hat Groups
+======================
+
+.. module:: pthat.groups
+   :platform: Mac, Linux, Windows
+   :synopsis: Drive several PTHats, or several axes of one PTHat, as one unit.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'Board', :class:'BoardGroup' and :class:'AxisGroup' classes.
+
+A :class:'BoardGroup' opens a :class:'pthat.connection.Connection' for each PTHat. Every connection has its own writer
+and reader threads, so the boards are driven in parallel and a slow reply from one board never holds up another. Group
+operations send a command to every board first and only then wait for the replies, so a group operation takes one
+round trip however many boards there are.
+
+.. code-block:: python
+
+   from pthat.groups import BoardGroup
+
+   with BoardGroup({"left": "/dev/ttyUSB0", "right": "/dev/ttyUSB1"}) as group:
+       for board in group:
+           board.request(board.axis("X").set_axis(frequency=1000.0, pulse_count=0, direction=0))
+       group.start_all()
+       print(f"Start skew {group.start_skew.last}ns")
+       print(group.gather_pulse_counts("X"))
+       group.stop_all()
+
+An :class:'AxisGroup' drives the axes of one PTHat on one connection. The set axis commands of all the axes are written
+in a single write and the group commands, such as start all, are sent back one completed reply for each axis. Each
+group operation returns one future that is resolved once every axis has replied.
+
+.. code-block:: python
+
+   from pthat.connection import Connection
+   from pthat.groups import AxisGroup
+
+   with Connection(serial_device="/dev/ttyS0") as connection:
+       axes = AxisGroup(connection)
+       axes.set_axes({"X": {"frequency": 1000.0, "pulse_count": 4000},
+                      "Y": {"frequency": 500.0, "pulse_count": 2000, "direction": 1}}).result()
+       axes.start_all().result()
+"""
+import threading
+from concurrent.futures import Future
+
+from pthat.clock import get_clock
+from pthat.connection import Connection
+from pthat.pthat import ADC, AUX, PWM, Axis
+from pthat.stats import RunningStats
+from pthat.telemetry import parse_pulse_count_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+class Board:
+    """
+    .. class:: Board
+
+    One PTHat of a :class:'BoardGroup'. Commands are built with the usual PTHat classes in test mode and sent through
+    the connection of the board, which gives them their command IDs.
+
+    :param name: name of the board in the group
+    :param connection: connection to the board
+    """
+    def __init__(self, name, connection):
+        """
+        Constructor
+        """
+        self.name = name
+        self.connection = connection
+        self._builders = {}
+
+    def __repr__(self):
+        return f"Board({self.name!r})"
+
+    def axis(self, axis):
+        """
+        :param axis: X, Y, Z or E
+        :returns: the object used to build the commands of an axis of this board
+        :rtype: pthat.pthat.Axis
+        """
+        return self._builder(Axis, axis)
+
+    def adc(self, adc_number):
+        """
+        :param adc_number: 1 or 2
+        :returns: the object used to build the commands of an ADC of this board
+        :rtype: pthat.pthat.ADC
+        """
+        return self._builder(ADC, adc_number)
+
+    def aux(self, aux_number):
+        """
+        :param aux_number: 1, 2 or 3
+        :returns: the object used to build the commands of an AUX output of this board
+        :rtype: pthat.pthat.AUX
+        """
+        return self._builder(AUX, aux_number)
+
+    def pwm(self, axis):
+        """
+        :param axis: X or Y
+        :returns: the object used to build the commands of a PWM channel of this board
+        :rtype: pthat.pthat.PWM
+        """
+        return self._builder(PWM, axis)
+
+    def submit(self, command, received_only=False):
+        """
+        Send a command to this board without waiting, see :meth:'pthat.connection.Connection.submit'
+        """
+        return self.connection.submit(command, received_only)
+
+    def request(self, command, received_only=False, timeout=None):
+        """
+        Send a command to this board and wait for it, see :meth:'pthat.connection.Connection.request'
+        """
+        return self.connection.request(command, received_only, timeout)
+
+    def _builder(self, cls, key):
+        """
+        Get the test mode object of a class, creating it the first time
+        """
+        builder = self._builders.get((cls, key))
+        if builder is None:
+            builder = cls(key, test_mode=True)
+            self._builders[(cls, key)] = builder
+        return builder
+
+
+class BoardGroup:
+    """
+    .. class:: BoardGroup
+
+    Several PTHats driven as one unit.
+
+    :param boards: dict of board name to the serial device path of the board, or to an open serial port or serial like
+                   object
+    :param baud_rate: serial port baud rate of the boards opened from a device path - default 115200
+    :param clock: clock used to time the replies - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, boards, baud_rate=115200, clock=None):
+        """
+        Constructor
+        """
+        if not boards:
+            raise ValueError("A board group needs at least one board")
+
+        self.clock = get_clock() if clock is None else clock
+        self.boards = {}
+        """
+        Dict of board name to :class:'Board'
+        """
+        self.start_skew = RunningStats("start skew")
+        """
+        Statistics of the time in nanoseconds between the first and the last board acknowledging a start
+        """
+        try:
+            for name, port in boards.items():
+                if isinstance(port, str):
+                    connection = Connection(serial_device=port, baud_rate=baud_rate, clock=self.clock)
+                else:
+                    connection = Connection(serial_port=port, clock=self.clock)
+                self.boards[name] = Board(name, connection)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.boards.values())
+
+    def __len__(self):
+        return len(self.boards)
+
+    def __getitem__(self, name):
+        return self.boards[name]
+
+    def broadcast(self, commands, received_only=False, timeout=None):
+        """
+        Send commands to every board and wait for them all. Every command is sent before any reply is waited on.
+
+        :param commands: a command string to send to every board, or a dict of board name to command string
+        :param received_only: only wait for the received replies - default False
+        :param timeout: seconds to wait for each board - default None to wait for ever
+        :returns: dict of board name to :class:'pthat.pipeline.InFlightCommand'
+        :rtype: dict
+        """
+        if isinstance(commands, str):
+            commands = {name: commands for name in self.boards}
+        futures = {name: self.boards[name].submit(command, received_only) for name, command in commands.items()}
+        return {name: future.result(timeout) for name, future in futures.items()}
+
+    def start_all(self, timeout=None):
+        """
+        Start all the axes of every board and measure how far apart the boards acknowledged the start. Returns once
+        every board has sent back its received reply.
+
+        :param timeout: seconds to wait for each board - default None to wait for ever
+        :returns: dict of board name to the start command
+        :rtype: dict
+        """
+        commands = {board.name: board.axis("X").start_all() for board in self}
+        started = self.broadcast(commands, received_only=True, timeout=timeout)
+        received = [entry.received_ns for entry in started.values()]
+        self.start_skew.add(max(received) - min(received))
+        return started
+
+    def stop_all(self, reset=False):
+        """
+        Stop every board straight away through the priority lane of its connection. Every board is sent its stop
+        before anything waits.
+
+        :param reset: reset the boards instead of stopping all the axes - default False
+        """
+        for board in self:
+            board.connection.emergency_stop(reset)
+
+    def gather_pulse_counts(self, axes="XYZE", timeout=None):
+        """
+        Get the current pulse count of axes on every board. The requests to all the boards are sent together.
+
+        :param axes: axis letters to get - default XYZE
+        :param timeout: seconds to wait for each reply - default None to wait for ever
+        :returns: dict of (board name, axis) to (direction, pulse count)
+        :rtype: dict
+        """
+        futures = {(board.name, axis): board.submit(board.axis(axis).get_current_pulse_count())
+                   for board in self for axis in axes}
+        counts = {}
+        for key, future in futures.items():
+            parsed = parse_pulse_count_reply(future.result(timeout).result or "")
+            counts[key] = None if parsed is None else parsed[1:]
+        return counts
+
+    def close(self):
+        """
+        Close the connections to every board
+        """
+        for board in self.boards.values():
+            board.connection.close()
+
+
+class AxisGroup:
+    """
+    .. class:: AxisGroup
+
+    The axes of one PTHat driven as one unit on a :class:'pthat.connection.Connection'. The group commands expect a
+    completed reply from each axis set up through the group, so every axis that is started by a start all should be set
+    up with :meth:'set_axes'.
+
+    :param connection: connection to the PTHat
+    :param axes: axis letters in the group - default XYZE
+    """
+    def __init__(self, connection, axes="XYZE"):
+        """
+        Constructor
+        """
+        if not axes or any(axis not in "XYZE" for axis in axes):
+            raise ValueError(f"Invalid axes {axes}. Must be some of X, Y, Z and E")
+
+        self.connection = connection
+        self.axes = {axis: Axis(axis, test_mode=True) for axis in axes}
+        """
+        Dict of axis letter to the object used to build the commands of that axis
+        """
+        self.configured = set()
+        """
+        Letters of the axes set up with a pulse train through the group
+        """
+        self._all = Axis(axes[0], test_mode=True)   # builds the group commands, which track started and paused
+        self._running = set()
+
+    def __getitem__(self, axis):
+        return self.axes[axis]
+
+    def set_axes(self, settings, timeout=None):
+        """
+        Set up several axes with their set axis commands written in a single write
+
+        :param settings: dict of axis letter to a dict of the keyword arguments of :meth:'pthat.pthat.Axis.set_axis'
+        :param timeout: seconds to wait for enough free command IDs - default None to wait for ever
+        :returns: future resolved with the list of :class:'pthat.pipeline.InFlightCommand' once every axis has
+                  completed
+        :rtype: concurrent.futures.Future
+        """
+        commands = []
+        for axis, values in settings.items():
+            if axis not in self.axes:
+                raise ValueError(f"Axis {axis} is not in the group")
+            command = self.axes[axis].set_axis(**values)
+            if not command:
+                raise ValueError(f"Invalid settings for axis {axis}: {values}")
+            commands.append(command)
+
+        futures = self.connection.submit_many(commands, timeout=timeout)
+        for axis in settings:
+            if self.axes[axis].frequency > 0:
+                self.configured.add(axis)
+            else:
+                self.configured.discard(axis)
+        return _gather(futures)
+
+    def start_all(self, received_only=False):
+        """
+        Start every axis set up through the group
+
+        :param received_only: resolve the future on the received reply instead of once every axis has finished
+                              - default False
+        :returns: future resolved with the :class:'pthat.pipeline.InFlightCommand' of the start
+        :rtype: concurrent.futures.Future
+        """
+        if not self.configured:
+            raise ValueError("No axis of the group has been set up with a frequency")
+        self._running = set(self.configured)
+        return self.connection.submit(self._all.start_all(), received_only, completions=len(self._running))
+
+    def stop_all(self):
+        """
+        Stop every axis. The stop is written straight away and the future of the start is resolved as the axes finish.
+
+        :returns: future resolved with the :class:'pthat.pipeline.InFlightCommand' of the stop once it is received
+        :rtype: concurrent.futures.Future
+        """
+        command = self._all.stop_all()
+        self._running = set()
+        return self.connection.submit(command)
+
+    def pause_all(self):
+        """
+        Pause every running axis
+
+        :returns: future resolved with the :class:'pthat.pipeline.InFlightCommand' of the pause once every axis has
+                  paused
+        :rtype: concurrent.futures.Future
+        """
+        return self.connection.submit(self._all.pause_all(), completions=max(len(self._running), 1))
+
+    def resume_all(self):
+        """
+        Resume every paused axis
+
+        :returns: future resolved with the :class:'pthat.pipeline.InFlightCommand' of the resume once every axis has
+                  resumed
+        :rtype: concurrent.futures.Future
+        """
+        return self.connection.submit(self._all.resume_all(), completions=max(len(self._running), 1))
+
+
+def _gather(futures):
+    """
+    Future resolved with the list of results of futures once they are all done, or with the first exception
+    """
+    gathered = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(index, future):
+        with lock:
+            if gathered.done():
+                return
+            if future.cancelled():
+                gathered.set_exception(ConnectionError("Command cancelled"))
+            elif future.exception() is not None:
+                gathered.set_exception(future.exception())
+            else:
+                results[index] = future.result()
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    gathered.set_result(results)
+
+    if not futures:
+        gathered.set_result(results)
+    for index, future in enumerate(futures):
+        future.add_done_callback(lambda f, i=index: done(i, f))
+    return gathered
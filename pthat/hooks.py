@@ -0,0 +1,364 @@
+"""
+Pulse Train Hat Hooks
+=====================
+
+.. module:: pthat.hooks
+   :platform: Mac, Linux, Windows
+   :synopsis: Functions called on every command sent, reply read and setting that fails validation.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'HookRegistry', :class:'CommandCounters', :class:'CommandTiming' and :class:'StructuredLog'
+classes and the :data:'registry' used by the library.
+
+There are four hooks. The pre send and post send hooks are called around every write of commands to the serial port
+by :meth:'pthat.pthat.PTHat.send_command', :meth:'pthat.pthat.PTHat.send_priority_command' and the writer of
+:class:'pthat.connection.Connection'. The on reply hooks are called with every reply read by
+:meth:'pthat.pthat.PTHat.get_response' and the reader of the connection. The on validate failure hooks are called when
+a command method finds a setting that is not valid.
+
+Hooks are functions kept in a tuple for each hook in :data:'registry'. An empty tuple is false, so when no function is
+added the library only tests one attribute and does nothing else. Functions can be added and removed at any time from
+any thread, so profiling can be turned on in a running program without restarting it.
+
+* pre_send(source, data) - source is the PTHat object or connection and data the bytes about to be written
+* post_send(source, data, ns) - ns is the time the write took in nanoseconds
+* on_reply(source, reply) - reply is the reply string
+* on_validate_failure(source, message) - message says which setting is not valid
+
+:class:'CommandCounters', :class:'CommandTiming' and :class:'StructuredLog' are ready made consumers. A consumer is an
+object with methods named after the hooks, and :meth:'HookRegistry.attach' adds every one of them it has.
+
+.. code-block:: python
+
+   from pthat.hooks import CommandCounters, CommandTiming, registry
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", serial_device="/dev/ttyS0")
+   counters = registry.attach(CommandCounters())
+   timing = registry.attach(CommandTiming())
+   ...
+   print(counters.commands, timing.round_trip)
+   registry.detach(timing)
+"""
+import logging
+import threading
+
+from pthat.clock import get_clock
+from pthat.stats import RunningStats
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+HOOKS = ("pre_send", "post_send", "on_reply", "on_validate_failure")
+"""
+Names of the hooks
+"""
+
+
+class HookRegistry:
+    """
+    .. class:: HookRegistry
+
+    Tuples of the functions of each hook.
+    """
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.pre_send = ()
+        """
+        Functions called with the source and the bytes before they are written
+        """
+        self.post_send = ()
+        """
+        Functions called with the source, the bytes and the nanoseconds the write took after they were written
+        """
+        self.on_reply = ()
+        """
+        Functions called with the source and each reply read
+        """
+        self.on_validate_failure = ()
+        """
+        Functions called with the source and the message when a setting is not valid
+        """
+        self.sending = False
+        """
+        True when there are pre send or post send functions, tested before every write
+        """
+        self._lock = threading.Lock()   # held while a tuple is replaced
+
+    def add(self, hook, function):
+        """
+        Add a function to a hook
+
+        :param hook: pre_send, post_send, on_reply or on_validate_failure
+        :param function: function to call
+        """
+        self._check(hook)
+        with self._lock:
+            setattr(self, hook, getattr(self, hook) + (function,))
+            self.sending = bool(self.pre_send or self.post_send)
+
+    def remove(self, hook, function):
+        """
+        Remove a function from a hook, nothing is done if it was not added
+
+        :param hook: pre_send, post_send, on_reply or on_validate_failure
+        :param function: function to remove
+        """
+        self._check(hook)
+        with self._lock:
+            setattr(self, hook, tuple(f for f in getattr(self, hook) if f != function))
+            self.sending = bool(self.pre_send or self.post_send)
+
+    def attach(self, consumer):
+        """
+        Add the methods of a consumer named after the hooks
+
+        :param consumer: object with one or more of the pre_send, post_send, on_reply and on_validate_failure methods
+        :returns: the consumer
+        """
+        for hook in HOOKS:
+            function = getattr(consumer, hook, None)
+            if function is not None:
+                self.add(hook, function)
+        return consumer
+
+    def detach(self, consumer):
+        """
+        Remove the methods of a consumer added with :meth:'attach'
+
+        :param consumer: the consumer
+        """
+        for hook in HOOKS:
+            function = getattr(consumer, hook, None)
+            if function is not None:
+                self.remove(hook, function)
+
+    def clear(self):
+        """
+        Remove every function from every hook
+        """
+        with self._lock:
+            for hook in HOOKS:
+                setattr(self, hook, ())
+            self.sending = False
+
+    def send(self, source, write, data, clock):
+        """
+        Write data with the pre send and post send functions called around it. Only called when :attr:'sending' is
+        True.
+
+        :param source: the PTHat object or connection writing
+        :param write: function that writes the bytes
+        :param data: bytes to write
+        :param clock: clock used to time the write
+        :returns: what write returned
+        """
+        for function in self.pre_send:
+            function(source, data)
+        start = clock.perf_counter_ns()
+        written = write(data)
+        elapsed = clock.perf_counter_ns() - start
+        for function in self.post_send:
+            function(source, data, elapsed)
+        return written
+
+    def reply(self, source, reply):
+        """
+        Call the on reply functions
+
+        :param source: the PTHat object or connection that read the reply
+        :param reply: the reply string
+        """
+        for function in self.on_reply:
+            function(source, reply)
+
+    def validate_failed(self, source, message):
+        """
+        Call the on validate failure functions
+
+        :param source: the PTHat object whose setting is not valid
+        :param message: message saying which setting is not valid
+        """
+        for function in self.on_validate_failure:
+            function(source, message)
+
+    @staticmethod
+    def _check(hook):
+        if hook not in HOOKS:
+            raise ValueError(f"Invalid hook {hook}. Must be one of {', '.join(HOOKS)}")
+
+
+registry = HookRegistry()
+"""
+The hook registry used by the library
+"""
+
+
+def _frames(data):
+    """
+    The commands in the bytes of one write as strings
+    """
+    return [frame.decode("ascii", "replace") + "*" for frame in data.split(b"*") if frame]
+
+
+class CommandCounters:
+    """
+    .. class:: CommandCounters
+
+    Counts the commands, bytes, replies and validation failures.
+    """
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.commands = {}
+        """
+        Dict of command code, bytes 4-5 such as CX, to the number sent
+        """
+        self.replies = {}
+        """
+        Dict of reply type, the first character such as R or C, to the number read
+        """
+        self.writes = 0
+        """
+        Number of writes
+        """
+        self.bytes_sent = 0
+        """
+        Number of bytes written
+        """
+        self.failures = 0
+        """
+        Number of settings that failed validation
+        """
+
+    def pre_send(self, source, data):
+        """
+        Count a write and the commands in it
+        """
+        self.writes += 1
+        self.bytes_sent += len(data)
+        for command in _frames(data):
+            code = command[3:5] if len(command) > 5 else command[:-1]
+            self.commands[code] = self.commands.get(code, 0) + 1
+
+    def on_reply(self, source, reply):
+        """
+        Count a reply by its type
+        """
+        self.replies[reply[:1]] = self.replies.get(reply[:1], 0) + 1
+
+    def on_validate_failure(self, source, message):
+        """
+        Count a validation failure
+        """
+        self.failures += 1
+
+
+class CommandTiming:
+    """
+    .. class:: CommandTiming
+
+    Times the writes and the round trip from each command being written until its received and completed replies.
+
+    :param clock: clock used for the round trips - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, clock=None):
+        """
+        Constructor
+        """
+        self.clock = get_clock() if clock is None else clock
+        self.write_time = RunningStats("write time")
+        """
+        Statistics of the nanoseconds each write took
+        """
+        self.round_trip = RunningStats("received round trip")
+        """
+        Statistics of the nanoseconds from a command being written until its received reply was read
+        """
+        self.completion = RunningStats("completed round trip")
+        """
+        Statistics of the nanoseconds from a command being written until its completed reply was read
+        """
+        self._sent = {}     # (type, ID, code) of the commands written to the monotonic time they were written
+
+    def post_send(self, source, data, ns):
+        """
+        Add the time of a write and remember when its commands were written
+        """
+        self.write_time.add(ns)
+        now = self.clock.monotonic_ns()
+        for command in _frames(data):
+            if len(command) > 5:
+                self._sent[command[:5]] = now
+
+    def on_reply(self, source, reply):
+        """
+        Add the round trip of a received or completed reply to a command that was timed
+        """
+        if reply[:1] not in ("R", "C") or len(reply) < 6:
+            return
+        sent = self._sent.get(reply[1:6])
+        if sent is None:
+            return
+        elapsed = self.clock.monotonic_ns() - sent
+        if reply[0] == "R":
+            self.round_trip.add(elapsed)
+        else:
+            self.completion.add(elapsed)
+            del self._sent[reply[1:6]]
+
+
+class StructuredLog:
+    """
+    .. class:: StructuredLog
+
+    Logs every hook call with the fields in the extra of the log record, so a formatter or handler can write them out
+    as JSON or key=value pairs.
+
+    :param logger: logger to use - default the pthat logger
+    :param level: level of the sends and replies - default logging.DEBUG
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        """
+        Constructor
+        """
+        self.logger = logging.getLogger("pthat") if logger is None else logger
+        self.level = level
+
+    def pre_send(self, source, data):
+        """
+        Log the bytes about to be written
+        """
+        if self.logger.isEnabledFor(self.level):
+            command = data.decode("ascii", "replace")
+            self.logger.log(self.level, "event=pre_send command=%s", command,
+                            extra={"event": "pre_send", "source": type(source).__name__, "command": command})
+
+    def post_send(self, source, data, ns):
+        """
+        Log the bytes written and how long the write took
+        """
+        if self.logger.isEnabledFor(self.level):
+            command = data.decode("ascii", "replace")
+            self.logger.log(self.level, "event=post_send command=%s ns=%d", command, ns,
+                            extra={"event": "post_send", "source": type(source).__name__, "command": command,
+                                   "ns": ns})
+
+    def on_reply(self, source, reply):
+        """
+        Log a reply
+        """
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "event=on_reply reply=%s", reply,
+                            extra={"event": "on_reply", "source": type(source).__name__, "reply": reply})
+
+    def on_validate_failure(self, source, message):
+        """
+        Log a validation failure as a warning
+        """
+        self.logger.warning("event=on_validate_failure message=%s", message,
+                            extra={"event": "on_validate_failure", "source": type(source).__name__,
+                                   "failure": message})
@@ -0,0 +1,286 @@
+"""
+Pulse Train Hat IO Port Watcher
+===============================
+
+.. module:: pthat.io_watcher
+   :platform: Mac, Linux, Windows
+   :synopsis: Poll the IO port status and call functions on the edges of the inputs.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'IOPortWatcher' class.
+
+The IO port status command LI is sent back as L11111*, the emergency stop input followed by the X, Y, Z and E limit
+inputs. An :class:'IOPortWatcher' sends the command at a fixed rate, turns the reply into an integer with one bit for
+each input and compares it with the last one. Functions are registered for the rising or falling edges of a mask of
+inputs and are kept in a table indexed by bit, so only the inputs that changed are looked at and nothing is done when
+nothing changed. An edge can also send the stop all command straight away, before any function is called.
+
+A reply can be lost, for example thrown away with the output buffer by a stop all or read by other code. When no
+reply has arrived max_wait seconds after the command was written it is counted in :attr:'IOPortWatcher.lost' and the
+command is written again, so the watcher never stops polling.
+
+The watcher can also use IO port status replies read by other code, passed to :meth:'IOPortWatcher.add_reply', so the
+status can be read only when the serial port has nothing else to do.
+
+An edge happened somewhere between the two readings either side of it. The time from halfway between them until the
+functions were called is kept in :attr:'IOPortWatcher.latency'.
+
+.. code-block:: python
+
+   from pthat.io_watcher import INPUT_EMERGENCY_STOP, INPUT_X_LIMIT, IOPortWatcher
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", serial_device="/dev/ttyS0")
+   watcher = IOPortWatcher(xaxis, rate=100.0, stop_on_falling=INPUT_EMERGENCY_STOP)
+   watcher.on_rising(INPUT_X_LIMIT, lambda bit, level, ns: print("X limit hit"))
+   watcher.run(duration=60)
+   print(watcher.latency)
+"""
+from pthat.clock import get_clock
+from pthat.pthat import PTHat
+from pthat.stats import RunningStats
+from pthat.telemetry import parse_port_status_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+INPUT_E_LIMIT = 0b00001
+"""
+Bit of the E limit input
+"""
+INPUT_Z_LIMIT = 0b00010
+"""
+Bit of the Z limit input
+"""
+INPUT_Y_LIMIT = 0b00100
+"""
+Bit of the Y limit input
+"""
+INPUT_X_LIMIT = 0b01000
+"""
+Bit of the X limit input
+"""
+INPUT_EMERGENCY_STOP = 0b10000
+"""
+Bit of the emergency stop input
+"""
+ALL_INPUTS = 0b11111
+"""
+Bits of every input
+"""
+
+
+class IOPortWatcher:
+    """
+    .. class:: IOPortWatcher
+
+    Polls the IO port status and calls functions when inputs change.
+
+    :param pthat: PTHat, Axis, ADC, AUX or PWM object whose serial port is used
+    :param rate: polls a second - default 50.0
+    :param idle_only: only poll when the serial port has nothing waiting to be written - default False
+    :param stop_on_rising: mask of inputs whose rising edge sends stop all straight away - default 0 for none
+    :param stop_on_falling: mask of inputs whose falling edge sends stop all straight away - default 0 for none
+    :param on_reply: function called with every reply read that is not an IO port status - default None to drop them
+    :param max_wait: seconds to wait for a reply before the command is taken as lost and written again - default 0.1
+    :param clock: clock used for the timing - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, pthat, rate=50.0, idle_only=False, stop_on_rising=0, stop_on_falling=0, on_reply=None,
+                 max_wait=0.1, clock=None):
+        """
+        Constructor
+        """
+        if rate <= 0:
+            raise ValueError(f"Invalid rate {rate}. Must be greater than 0")
+        if max_wait <= 0:
+            raise ValueError(f"Invalid max wait {max_wait}. Must be greater than 0")
+
+        self.pthat = pthat
+        self.rate = rate
+        self.idle_only = idle_only
+        self.stop_on_rising = stop_on_rising & ALL_INPUTS
+        self.stop_on_falling = stop_on_falling & ALL_INPUTS
+        self.on_reply = on_reply
+        self.max_wait = max_wait
+        self.clock = get_clock() if clock is None else clock
+        self.inputs = None
+        """
+        Inputs from the last reading, bit 4 = ES, bit 3 = X, bit 2 = Y, bit 1 = Z and bit 0 = E limit input, or None
+        before the first reading
+        """
+        self.latency = RunningStats("edge to callback latency")
+        """
+        Statistics of the time in nanoseconds from halfway between the readings either side of an edge until its
+        functions were called
+        """
+        self.polls = 0
+        """
+        Number of IO port status readings
+        """
+        self.edges = 0
+        """
+        Number of input edges seen
+        """
+        self.stops = 0
+        """
+        Number of times stop all was sent
+        """
+        self.lost = 0
+        """
+        Number of IO port status commands that were not answered within max_wait
+        """
+        self._request = PTHat(test_mode=True).get_io_port_status().encode("ascii")
+        self._rising = [[] for bit in range(5)]     # functions for each input bit, indexed by bit number
+        self._falling = [[] for bit in range(5)]
+        self._sent_ns = None
+        self._last_ns = None
+
+    def on_rising(self, mask, callback):
+        """
+        Call a function when any of the inputs in mask goes from 0 to 1
+
+        :param mask: bits of the inputs, such as INPUT_X_LIMIT | INPUT_Y_LIMIT
+        :param callback: function called with the input bit, the new level and the monotonic time in nanoseconds of
+                         the reading
+        """
+        self._register(self._rising, mask, callback)
+
+    def on_falling(self, mask, callback):
+        """
+        Call a function when any of the inputs in mask goes from 1 to 0
+
+        :param mask: bits of the inputs, such as INPUT_EMERGENCY_STOP
+        :param callback: function called with the input bit, the new level and the monotonic time in nanoseconds of
+                         the reading
+        """
+        self._register(self._falling, mask, callback)
+
+    def request(self):
+        """
+        Write the IO port status command, unless the last one has not been answered yet or idle_only is on and the
+        serial port is busy. A command not answered within max_wait is counted as lost and written again.
+
+        :returns: True if the command was written
+        :rtype: bool
+        """
+        if self._sent_ns is not None:
+            if self.clock.monotonic_ns() - self._sent_ns < self.max_wait * 1e9:
+                return False
+            self.lost += 1
+            self._sent_ns = None
+        if self.idle_only and getattr(self.pthat.serial, "out_waiting", 0):
+            return False
+        self.pthat.serial.write(self._request)
+        self._sent_ns = self.clock.monotonic_ns()
+        return True
+
+    def read_replies(self):
+        """
+        Read every reply that has arrived without waiting
+
+        :returns: number of IO port status readings read
+        :rtype: int
+        """
+        serial = self.pthat.serial
+        count = 0
+        while serial.in_waiting:
+            data = serial.read_until(b"*")
+            if not data:
+                break
+            resp = data.decode("ascii", "replace")
+            if self.add_reply(resp):
+                count += 1
+            elif self.on_reply is not None:
+                self.on_reply(resp)
+        return count
+
+    def add_reply(self, resp, ns=None):
+        """
+        Use a single reply
+
+        :param resp: a single response string
+        :param ns: monotonic time in nanoseconds the reply was read - default now
+        :returns: True if the reply was an IO port status, otherwise False
+        :rtype: bool
+        """
+        inputs = parse_port_status_reply(resp)
+        if inputs is None:
+            return False
+
+        ns = self.clock.monotonic_ns() if ns is None else ns
+        # The inputs were read by the PTHat somewhere between the command being written and the reply arriving
+        sampled = ns if self._sent_ns is None else (self._sent_ns + ns) // 2
+        self._sent_ns = None
+        self.update(inputs, sampled)
+        return True
+
+    def update(self, inputs, ns=None):
+        """
+        Compare a reading with the last one and act on the edges
+
+        :param inputs: the inputs as an integer
+        :param ns: monotonic time in nanoseconds the inputs were read - default now
+        """
+        ns = self.clock.monotonic_ns() if ns is None else ns
+        previous, last_ns = self.inputs, self._last_ns
+        self.inputs = inputs
+        self._last_ns = ns
+        self.polls += 1
+        if previous is None:
+            return
+        changed = inputs ^ previous
+        if not changed:
+            return
+
+        rising = changed & inputs
+        falling = changed & previous
+        if rising & self.stop_on_rising or falling & self.stop_on_falling:
+            self.pthat.emergency_stop()
+            self.stops += 1
+        self._dispatch(self._rising, rising, 1, ns)
+        self._dispatch(self._falling, falling, 0, ns)
+        self.edges += bin(changed).count("1")
+        self.latency.add(self.clock.monotonic_ns() - (last_ns + ns) // 2)
+
+    def run(self, duration=None, should_stop=None):
+        """
+        Poll at the fixed rate
+
+        :param duration: seconds to run for - default None to run until should_stop returns True
+        :param should_stop: function called between polls, the run ends when it returns True - default None
+        """
+        period = int(1e9 / self.rate)
+        due = self.clock.monotonic_ns()
+        end = None if duration is None else due + int(duration * 1e9)
+        while (end is None or due < end) and not (should_stop is not None and should_stop()):
+            self.request()
+            due += period
+            while True:
+                self.read_replies()
+                remaining = due - self.clock.monotonic_ns()
+                if remaining <= 0:
+                    break
+                self.clock.sleep(min(remaining, 200000) / 1e9)
+        self.read_replies()
+
+    @staticmethod
+    def _register(table, mask, callback):
+        """
+        Add a function to the table entry of every bit in mask
+        """
+        if not mask & ALL_INPUTS:
+            raise ValueError(f"Invalid mask {mask}. Must have at least one of the five input bits set")
+        for bit in range(5):
+            if mask & (1 << bit):
+                table[bit].append(callback)
+
+    @staticmethod
+    def _dispatch(table, bits, level, ns):
+        """
+        Call the functions of every bit set in bits
+        """
+        while bits:
+            lowest = bits & -bits
+            for callback in table[lowest.bit_length() - 1]:
+                callback(lowest, level, ns)
+            bits ^= lowest
@@ -0,0 +1,166 @@
+"""
+Pulse Train Hat Feed Override
+=============================
+
+.. module:: pthat.override
+   :platform: Mac, Linux, Windows
+   :synopsis: Scale the frequency of commands by a live feed override as they are written.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'FeedOverride' class.
+
+A feed override runs a job faster or slower than it was programmed, for example from a knob turned by the operator.
+Rather than building the program again, a :class:'FeedOverride' rewrites the frequency of the set axis CX and change
+speed QX commands as they leave the queue, so the program keeps the frequencies it was built with and a command takes
+the factor that is set when it is written. Buffered commands are scaled the same way when they are sent to the buffer.
+
+The override also keeps track of the axes that are moving, from the start commands written and the start and stop
+completed replies. Setting a new factor with :meth:'FeedOverride.set' builds a change speed command for each of them,
+with its programmed frequency, that is scaled on its way out like any other command.
+
+:class:'pthat.connection.Connection' scales every command its writer thread writes when it has an override.
+
+.. code-block:: python
+
+   from pthat.connection import Connection
+   from pthat.override import FeedOverride
+   from pthat.pthat import Axis
+
+   connection = Connection(serial_device="/dev/ttyS0", override=FeedOverride())
+   xaxis = Axis("X", test_mode=True)
+   connection.submit(xaxis.set_axis(frequency=1000.0, pulse_count=100000))
+   connection.submit(xaxis.start(), received_only=True)
+   ...
+   # The operator turned the knob to 120%, X changes speed to 1200.0
+   connection.set_feed_override(1.2)
+"""
+import threading
+
+from pthat.gearing import MAX_CHANGE_SPEED_FREQUENCY
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+MIN_FEED_OVERRIDE = 0.5
+"""
+Lowest feed override factor, 50%
+"""
+MAX_FEED_OVERRIDE = 1.5
+"""
+Highest feed override factor, 150%
+"""
+
+MAX_SET_AXIS_FREQUENCY = 500000.0
+"""
+Highest frequency of the set axis command
+"""
+
+_AXES = b"XYZE"
+
+
+class FeedOverride:
+    """
+    .. class:: FeedOverride
+
+    Scales the frequency of set axis and change speed commands by a factor.
+
+    :param factor: feed override factor, 1.0 for the programmed speed - default 1.0
+    :param minimum: lowest factor allowed - default 0.5
+    :param maximum: highest factor allowed - default 1.5
+    """
+    def __init__(self, factor=1.0, minimum=MIN_FEED_OVERRIDE, maximum=MAX_FEED_OVERRIDE):
+        """
+        Constructor
+        """
+        if not 0 < minimum <= maximum:
+            raise ValueError(f"Invalid limits {minimum} and {maximum}. Must be greater than 0 and in order")
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = self._validate(factor)
+        """
+        Current feed override factor
+        """
+        self.programmed = {}
+        """
+        Dict of axis to the frequency it was last programmed with, before scaling
+        """
+        self.moving = set()
+        """
+        Axes started and not yet completed or stopped
+        """
+        self.scaled = 0
+        """
+        Number of commands whose frequency was scaled
+        """
+        self._lock = threading.Lock()   # held while the programmed frequencies or moving axes are used
+
+    def set(self, factor, command_type="I", command_id=0):
+        """
+        Change the factor
+
+        :param factor: new feed override factor
+        :param command_type: type of the change speed commands, I = instant, B = buffered - default I
+        :param command_id: command ID of the change speed commands, 0-99 - default 0
+        :returns: list of change speed commands, with their programmed frequency, for the axes that are moving. They
+                  are scaled by the new factor when they are written. Axes whose programmed or new frequency is above
+                  the highest change speed frequency are left out, as change speed can not reach them.
+        :rtype: list
+        """
+        self.factor = self._validate(factor)
+        highest = MAX_CHANGE_SPEED_FREQUENCY / max(self.factor, 1.0)
+        with self._lock:
+            return [f"{command_type}{command_id:02}Q{axis}{self.programmed[axis]:010.3f}*"
+                    for axis in sorted(self.moving, key="XYZE".index) if 0 < self.programmed.get(axis, 0) <= highest]
+
+    def scale(self, data):
+        """
+        Scale the set axis and change speed commands in the bytes of a write and keep track of the axes started
+
+        :param data: one or more commands as bytes
+        :returns: the commands with the frequencies scaled
+        :rtype: bytes
+        """
+        factor = self.factor
+        frames = data.split(b"*")
+        changed = False
+        with self._lock:
+            for index, frame in enumerate(frames):
+                if len(frame) < 5:
+                    if frame == b"N":
+                        self.moving.clear()
+                    continue
+                code, letter = frame[3:4], frame[4:5]
+                if code == b"S":
+                    if letter == b"A":
+                        self.moving.update(axis for axis, frequency in self.programmed.items() if frequency > 0)
+                    elif letter in _AXES:
+                        self.moving.add(letter.decode("ascii"))
+                elif code in b"CQ" and letter in _AXES and len(frame) >= 15:
+                    programmed = float(frame[5:15])
+                    self.programmed[letter.decode("ascii")] = programmed
+                    if factor != 1.0:
+                        highest = MAX_SET_AXIS_FREQUENCY if code == b"C" else MAX_CHANGE_SPEED_FREQUENCY
+                        frequency = min(programmed * factor, highest)
+                        frames[index] = b"%s%010.3f%s" % (frame[:5], frequency, frame[15:])
+                        self.scaled += 1
+                        changed = True
+        return b"*".join(frames) if changed else data
+
+    def add_reply(self, resp):
+        """
+        Use a reply to keep track of the axes that have stopped
+
+        :param resp: a single response string
+        """
+        if len(resp) >= 6 and resp[0] == "C" and resp[4] in "ST" and resp[5] in "XYZE":
+            with self._lock:
+                self.moving.discard(resp[5])
+
+    def _validate(self, factor):
+        """
+        Check a factor is within the limits
+        """
+        if not self.minimum <= factor <= self.maximum:
+            raise ValueError(f"Invalid feed override {factor}. Must be between {self.minimum} and {self.maximum}")
+        return factor
@@ -0,0 +1,341 @@
+"""
+Pulse Train Hat Command Pipelining
+==================================
+
+.. module:: pthat.pipeline
+   :platform: Mac, Linux, Windows
+   :synopsis: Send several instant commands without waiting for each reply.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'InFlightCommand', :class:'CommandIDAllocator' and :class:'Pipeline' classes.
+
+The command ID in bytes 2-3 of a command is sent back in its replies. When every command on a connection has a
+different ID the replies can be matched to their commands, so the next command can be sent without waiting for the
+reply of the one before it. The :class:'CommandIDAllocator' hands out the IDs 0-99 of one connection in turn and keeps
+a table of the commands in flight keyed by ID. An ID is handed out again once its command has completed.
+
+The :class:'Pipeline' puts an ID from the allocator into each command, writes the commands back to back and matches
+the replies as they arrive. A setup sequence then takes one round trip instead of one per command.
+
+.. code-block:: python
+
+   from pthat.pipeline import Pipeline
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", serial_device="/dev/ttyS0")
+   yaxis = Axis("Y", serial_port=xaxis.serial)
+   pipeline = Pipeline(xaxis)
+
+   commands = pipeline.run([xaxis.set_axis(frequency=1000.0, pulse_count=2000, direction=0),
+                            yaxis.set_axis(frequency=500.0, pulse_count=1000, direction=1),
+                            xaxis.get_io_port_status()])
+   print(commands[2].result)
+"""
+from collections import deque
+
+from pthat.clock import get_clock
+from pthat.stats import RunningStats
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+# Commands that send back a result reply between their received and completed replies - byte 4-5, or byte 5 for XP
+_RESULT_CODES = ("LI", "FW", "D1", "D2")
+_RESULT_PREFIXES = ("L", "D1", "D2", "XP", "YP", "ZP", "EP")   # start of every result reply but the firmware version
+
+
+def _is_result_of(code, resp):
+    """
+    Check if a reply is the result of a command with the code, LI results start with L, the ADC and pulse count
+    results with the code itself and the firmware version is anything else
+    """
+    if code == "FW":
+        return not resp.startswith(_RESULT_PREFIXES)
+    return resp.startswith("L" if code == "LI" else code)
+
+
+class InFlightCommand:
+    """
+    .. class:: InFlightCommand
+
+    A command that has been sent and the replies matched to it so far.
+
+    :param command_id: the command ID 0-99
+    :param command: the command string
+    :param sent_ns: monotonic time in nanoseconds the command was sent
+    """
+    def __init__(self, command_id, command, sent_ns):
+        """
+        Constructor
+        """
+        self.command_id = command_id
+        self.command = command
+        self.code = command[3:5]
+        """
+        Bytes 4-5 of the command, for example CX or SA
+        """
+        self.sent_ns = sent_ns
+        self.received_ns = None
+        """
+        Monotonic time in nanoseconds the received reply was read or None
+        """
+        self.completed_ns = None
+        """
+        Monotonic time in nanoseconds the completed reply was read or None
+        """
+        self.result = None
+        """
+        The result reply of commands such as LI, FW, D1 and D2 or None
+        """
+        self.replies = []
+        """
+        Every reply matched to this command
+        """
+        self.completions = 1
+        """
+        Number of completed replies still to come. Group commands such as SA and PA are sent back a completed reply
+        for each axis, so set it to the number of axes to wait for them all.
+        """
+
+    def __repr__(self):
+        return f"InFlightCommand({self.command_id}, {self.command!r})"
+
+    @property
+    def received(self):
+        """
+        True once the received reply has been read
+        """
+        return self.received_ns is not None
+
+    @property
+    def completed(self):
+        """
+        True once the command has completed and its ID has been handed back
+        """
+        return self.completed_ns is not None
+
+    @property
+    def expects_result(self):
+        """
+        True if the command sends back a result reply that has not been read yet
+        """
+        if self.result is not None:
+            return False
+        return self.code in _RESULT_CODES or (self.code[1:] == "P" and self.code[0] in "XYZE")
+
+
+class CommandIDAllocator:
+    """
+    .. class:: CommandIDAllocator
+
+    Hands out the command IDs of one connection and keeps a table of the commands in flight. Free IDs are kept in a
+    queue, so an ID that has just been handed back is the last one to be used again. This gives late replies to a
+    command the longest possible time to arrive before its ID is reused.
+
+    Most commands complete with their completed reply. The stop commands complete with their received reply, as the
+    completed reply of a stop carries the ID of the start command. A pause completes with its D reply. When completed
+    replies have been turned off, set complete_on_received so every command completes with its received reply.
+
+    :param first_id: first ID to hand out - default 0
+    :param last_id: last ID to hand out - default 99
+    :param complete_on_received: complete every command when its received reply arrives - default False
+    :param clock: clock used to time the commands - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, first_id=0, last_id=99, complete_on_received=False, clock=None):
+        """
+        Constructor
+        """
+        if not 0 <= first_id <= last_id <= 99:
+            raise ValueError(f"Invalid command ID range {first_id}-{last_id}. Must be within 0-99")
+
+        self.complete_on_received = complete_on_received
+        self.clock = get_clock() if clock is None else clock
+        self.in_flight = {}
+        """
+        Dict of command ID to :class:'InFlightCommand' for the commands that have not completed
+        """
+        self.round_trip = RunningStats("round trip")
+        """
+        Statistics of the time in nanoseconds from sending a command until it completed
+        """
+        self._free = deque(range(first_id, last_id + 1))
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    @property
+    def available(self):
+        """
+        Number of IDs that can be handed out
+        """
+        return len(self._free)
+
+    def assign(self, command):
+        """
+        Put the next free ID into a command and add it to the in flight table. Commands without an ID such as the
+        reset and buffer commands are passed through and not tracked.
+
+        :param command: command string with any ID in bytes 2-3
+        :returns: the command with the new ID and its :class:'InFlightCommand', which is None if the command has no ID,
+                  or None if every ID is in flight
+        :rtype: tuple
+        """
+        if len(command) < 6 or command[0] not in "IB" or not command[1:3].isdigit():
+            return command, None
+        if not self._free:
+            return None
+
+        command_id = self._free.popleft()
+        command = f"{command[0]}{command_id:02}{command[3:]}"
+        entry = InFlightCommand(command_id, command, self.clock.monotonic_ns())
+        self.in_flight[command_id] = entry
+        return command, entry
+
+    def release(self, command_id):
+        """
+        Hand an ID back without waiting for its command to complete, for example after a timeout
+
+        :param command_id: the command ID
+        """
+        if self.in_flight.pop(command_id, None) is not None:
+            self._free.append(command_id)
+
+    def handle_reply(self, resp):
+        """
+        Match a reply to the command in flight it belongs to. Received, completed and pause replies are matched by
+        their ID. A result reply has no ID, so it goes to the command with the same code that was received first and is
+        still waiting for its result. A pulse count sent by auto count pulse out is only left unmatched when no pulse
+        count request of its axis is waiting, otherwise it is taken for the result of that request.
+
+        :param resp: a single response string
+        :returns: the command the reply belongs to or None if it was not matched, for example a pulse count sent by
+                  auto count pulse out
+        :rtype: InFlightCommand
+        """
+        if len(resp) >= 7 and resp[0] in "RCD" and resp[1] in "IB" and resp[2:4].isdigit():
+            entry = self.in_flight.get(int(resp[2:4]))
+            if entry is None or resp[4] != entry.code[0]:
+                return None
+
+            now = self.clock.monotonic_ns()
+            entry.replies.append(resp)
+            if resp[0] == "R":
+                entry.received_ns = now
+                if self.complete_on_received or entry.code[0] == "T":
+                    self._complete(entry, now)
+            elif resp[0] == "C" or entry.code[0] == "P":
+                entry.completions -= 1
+                if entry.completions <= 0:
+                    self._complete(entry, now)
+            return entry
+
+        waiting = [entry for entry in self.in_flight.values()
+                   if entry.received and entry.expects_result and _is_result_of(entry.code, resp)]
+        if waiting:
+            entry = min(waiting, key=lambda candidate: candidate.received_ns)
+            entry.result = resp
+            entry.replies.append(resp)
+            return entry
+        return None
+
+    def _complete(self, entry, now):
+        """
+        Mark a command completed and hand its ID back
+        """
+        entry.completed_ns = now
+        self.round_trip.add(now - entry.sent_ns)
+        self.release(entry.command_id)
+
+
+class Pipeline:
+    """
+    .. class:: Pipeline
+
+    Sends commands on one connection with IDs from a :class:'CommandIDAllocator' without waiting for the replies of
+    the commands before them. Replies that are not matched to a command, such as auto count pulse counts, are kept in
+    :attr:'unmatched' so they can still be parsed or fed to a :class:'pthat.telemetry.Telemetry'.
+
+    :param pthat: PTHat, Axis, ADC, AUX or PWM object used to send the commands and read the replies
+    :param allocator: allocator of the connection - default a new allocator for the whole 0-99 range
+    """
+    def __init__(self, pthat, allocator=None):
+        """
+        Constructor
+        """
+        self.pthat = pthat
+        self.allocator = CommandIDAllocator(clock=pthat.clock) if allocator is None else allocator
+        self.unmatched = []
+        """
+        Replies read that did not belong to a command in flight
+        """
+
+    def send(self, command):
+        """
+        Give a command the next free ID and send it. When every ID is in flight the replies are read until one is
+        handed back.
+
+        :param command: command string, such as one returned by a command method with auto_send_command off
+        :returns: the command in flight or None if it has no ID or no ID was handed back before the read timeout
+        :rtype: InFlightCommand
+        """
+        assigned = self.allocator.assign(command)
+        while assigned is None:
+            if not self.read_reply():
+                if self.pthat.debug:
+                    print(f"No command ID free to send {command}")
+                return None
+            assigned = self.allocator.assign(command)
+
+        command, entry = assigned
+        self.pthat.send_command(command)
+        return entry
+
+    def read_reply(self):
+        """
+        Read one reply and match it
+
+        :returns: the reply or None if nothing arrived before the read timeout
+        :rtype: str
+        """
+        resp = self.pthat.get_response()
+        if resp is not None and self.allocator.handle_reply(resp) is None:
+            self.unmatched.append(resp)
+        return resp
+
+    def poll(self):
+        """
+        Read and match the replies that have already arrived, without waiting
+        """
+        serial_port = self.pthat.serial
+        while serial_port.in_waiting:
+            if self.read_reply() is None:
+                break
+
+    def wait(self, commands, received_only=False):
+        """
+        Read replies until every command has completed, or has been received if received_only is true
+
+        :param commands: list of commands in flight, None entries are skipped
+        :param received_only: only wait for the received replies - default False
+        :returns: True if every command got there, False if the read timed out first
+        :rtype: bool
+        """
+        pending = [c for c in commands if c is not None]
+        while pending:
+            pending = [c for c in pending
+                       if not (c.received if received_only else c.completed) or c.expects_result]
+            if pending and self.read_reply() is None:
+                return False
+        return True
+
+    def run(self, commands):
+        """
+        Send a list of commands back to back and then wait for them all to complete
+
+        :param commands: list of command strings
+        :returns: the commands in flight in the same order, None for commands without an ID
+        :rtype: list
+        """
+        entries = [self.send(command) for command in commands]
+        self.wait(entries)
+        return entries
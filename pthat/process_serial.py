@@ -0,0 +1,365 @@
+"""
+Pulse Train Hat Serial Process
+==============================
+
+.. module:: pthat.process_serial
+   :platform: Mac, Linux, Windows
+   :synopsis: Run the serial port I/O in a separate process.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'ProcessSerial' class.
+
+Long running work in the main process, such as planning a job with NumPy, holds the GIL. While it does, nothing reads
+the serial port and replies such as the auto count pulse counts can be lost when the operating system buffer fills.
+
+A :class:'ProcessSerial' starts a child process that opens the serial port and does nothing but copy bytes. Commands
+and replies are passed through two single producer, single consumer byte rings in one
+:mod:'multiprocessing.shared_memory' block, so nothing is pickled on the way. The child process has its own GIL and
+keeps reading the serial port whatever the main process is doing.
+
+It is a serial like object, so it is passed as the serial_port of the PTHat classes and the API stays the same.
+
+**Shared memory layout**
+
++-----------------+---------------------------------------------------------------------------------------------------+
+| Section         | Contents                                                                                          |
++=================+===================================================================================================+
+| Command ring    | bytes written, bytes read and discard up to positions (32 bytes), written by the main process     |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Reply ring      | bytes written, bytes read (32 bytes), written by the child process                                |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Command data    | capacity bytes                                                                                    |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Reply data      | capacity bytes                                                                                    |
++-----------------+---------------------------------------------------------------------------------------------------+
+
+.. code-block:: python
+
+   from pthat.process_serial import ProcessSerial
+   from pthat.pthat import Axis
+
+   port = ProcessSerial(serial_device="/dev/ttyS0")
+   xaxis = Axis("X", command_id=1, serial_port=port)
+   xaxis.auto_send_command = True
+   ...
+   port.close()
+"""
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+
+import serial
+
+from pthat.clock import get_clock
+from pthat.telemetry_bus import attach_shared_memory, create_shared_memory
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+RING_HEADER = struct.Struct("<QQQ8x")
+POSITION = struct.Struct("<Q")
+_WRITTEN, _READ, _DISCARD = 0, 8, 16    # offsets of the positions in a ring header
+
+
+class _ByteRing:
+    """
+    Single producer, single consumer byte ring in shared memory. Positions count every byte ever written or read, so
+    the ring is empty when they are equal and each side only ever changes its own position.
+    """
+    def __init__(self, buf, header_offset, data_offset, capacity):
+        self.buf = buf
+        self.header = header_offset
+        self.data = data_offset
+        self.capacity = capacity
+
+    def position(self, which):
+        return POSITION.unpack_from(self.buf, self.header + which)[0]
+
+    def set_position(self, which, value):
+        POSITION.pack_into(self.buf, self.header + which, value)
+
+    def available(self):
+        """
+        Bytes that can be read
+        """
+        return self.position(_WRITTEN) - self.position(_READ)
+
+    def write(self, data):
+        """
+        Copy as much of data into the ring as fits
+
+        :returns: number of bytes written
+        """
+        written = self.position(_WRITTEN)
+        count = min(len(data), self.capacity - (written - self.position(_READ)))
+        start = written % self.capacity
+        first = min(count, self.capacity - start)
+        self.buf[self.data + start:self.data + start + first] = data[:first]
+        if count > first:
+            self.buf[self.data:self.data + count - first] = data[first:count]
+        # The data is in place before the reader is told about it
+        self.set_position(_WRITTEN, written + count)
+        return count
+
+    def read(self, size=None):
+        """
+        Take up to size bytes out of the ring
+        """
+        read = self.position(_READ)
+        count = self.position(_WRITTEN) - read
+        if size is not None:
+            count = min(count, size)
+        start = read % self.capacity
+        first = min(count, self.capacity - start)
+        data = bytes(self.buf[self.data + start:self.data + start + first])
+        if count > first:
+            data += bytes(self.buf[self.data:self.data + count - first])
+        self.set_position(_READ, read + count)
+        return data
+
+
+def _rings(buf, capacity):
+    """
+    The command ring and the reply ring of a shared memory block
+    """
+    header = RING_HEADER.size
+    return (_ByteRing(buf, 0, 2 * header, capacity),
+            _ByteRing(buf, header, 2 * header + capacity, capacity))
+
+
+def _serve(name, capacity, serial_device, baud_rate, simulate, command_ready, reply_ready, stop, status):
+    """
+    Body of the child process. One thread writes commands to the serial port and the other reads replies from it.
+    """
+    shm = attach_shared_memory(name)
+    commands, replies = _rings(shm.buf, capacity)
+    try:
+        if simulate:
+            from pthat.simulator import SimulatedSerial
+            port = SimulatedSerial(baud_rate=baud_rate, timeout=0.05)
+        else:
+            import serial
+            port = serial.Serial(port=serial_device, baudrate=baud_rate, timeout=0.05, write_timeout=2)
+    except Exception as e:
+        status.put(str(e))
+        shm.close()
+        return
+    status.put(None)
+
+    def write_commands():
+        while not stop.is_set():
+            command_ready.clear()
+            discard = commands.position(_DISCARD)
+            if discard > commands.position(_READ):
+                commands.set_position(_READ, discard)
+                port.reset_output_buffer()
+            if commands.available():
+                port.write(commands.read())
+            else:
+                command_ready.wait(0.05)
+
+    writer = threading.Thread(target=write_commands, daemon=True)
+    writer.start()
+    while not stop.is_set():
+        data = port.read_until(b"*")
+        while data:
+            count = replies.write(data)
+            data = data[count:]
+            if data:
+                time.sleep(0.0001)   # the main process has not read the replies yet
+        reply_ready.set()
+    writer.join()
+    port.close()
+    shm.close()
+
+
+class ProcessSerial:
+    """
+    .. class:: ProcessSerial
+
+    Serial like object that does the serial port I/O in a child process.
+
+    :param serial_device: path to the serial device - default /dev/ttyS0
+    :param baud_rate: serial port baud rate - default 115200
+    :param timeout: read timeout in seconds - default 2
+    :param capacity: size in bytes of each of the command and reply rings - default 65536
+    :param simulate: open a :class:'pthat.simulator.SimulatedSerial' in the child process instead of the serial
+                     device - default False
+    :param start_method: multiprocessing start method - default spawn
+    :param clock: clock used for the read timeout - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, serial_device="/dev/ttyS0", baud_rate=115200, timeout=2, capacity=65536, simulate=False,
+                 start_method="spawn", clock=None):
+        """
+        Constructor
+        """
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity {capacity}. Must be at least 1")
+
+        self.serial_device = serial_device
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.clock = get_clock() if clock is None else clock
+        self.is_open = False
+        self._shm = create_shared_memory(2 * RING_HEADER.size + 2 * capacity)
+        self._shm.buf[:2 * RING_HEADER.size] = bytes(2 * RING_HEADER.size)
+        self._commands, self._replies = _rings(self._shm.buf, capacity)
+        self._pending = bytearray()
+        self._lock = threading.Lock()
+
+        context = multiprocessing.get_context(start_method)
+        self._command_ready = context.Event()
+        self._reply_ready = context.Event()
+        self._stop = context.Event()
+        status = context.Queue()
+        self._process = context.Process(target=_serve, name="pthat-serial", daemon=True,
+                                        args=(self._shm.name, capacity, serial_device, baud_rate, simulate,
+                                              self._command_ready, self._reply_ready, self._stop, status))
+        self._process.start()
+        error = self._wait_for_status(status)
+        if error is not None:
+            self._process.join(5)
+            self._release()
+            raise serial.SerialException(f"Error opening serial port {serial_device}: {error}")
+        self.is_open = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def in_waiting(self):
+        """
+        Number of reply bytes that can be read without waiting
+        """
+        return len(self._pending) + self._replies.available()
+
+    @property
+    def out_waiting(self):
+        """
+        Number of command bytes the child process has not written to the serial port yet
+        """
+        return self._commands.available()
+
+    def write(self, data):
+        """
+        Pass data to the child process to write to the serial port
+
+        :param data: bytes to write
+        :returns: number of bytes written
+        :rtype: int
+        """
+        data = bytes(data)
+        with self._lock:
+            sent = 0
+            while True:
+                sent += self._commands.write(data[sent:])
+                self._command_ready.set()
+                if sent == len(data):
+                    return sent
+                if not self._process.is_alive():
+                    raise serial.SerialException("The serial process has exited")
+                time.sleep(0.0001)   # the ring is full until the child process catches up
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Read replies up to and including expected, waiting up to the timeout for more to arrive
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        deadline = None if self.timeout is None else self.clock.monotonic_ns() + int(self.timeout * 1e9)
+        while True:
+            # Clear the doorbell before looking so a reply that arrives in between still wakes the wait
+            self._reply_ready.clear()
+            self._pending += self._replies.read()
+            end = self._pending.find(expected)
+            if end >= 0 or (size is not None and len(self._pending) >= size):
+                end = len(self._pending) if end < 0 else end + len(expected)
+                break
+            remaining = None if deadline is None else (deadline - self.clock.monotonic_ns()) / 1e9
+            if remaining is not None and remaining <= 0:
+                end = len(self._pending)
+                break
+            self._reply_ready.wait(remaining)
+
+        if size is not None:
+            end = min(end, size)
+        data = bytes(self._pending[:end])
+        del self._pending[:end]
+        return data
+
+    def read(self, size=1):
+        """
+        Read up to size bytes of replies that have arrived
+
+        :param size: number of bytes
+        :returns: bytes read
+        :rtype: bytes
+        """
+        self._pending += self._replies.read()
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def flush(self):
+        """
+        Wait until the child process has written every command to the serial port
+        """
+        while self._commands.available() and self._process.is_alive():
+            time.sleep(0.0001)
+
+    def reset_input_buffer(self):
+        """
+        Drop replies that have not been read
+        """
+        self._replies.read()
+        self._pending.clear()
+
+    def reset_output_buffer(self):
+        """
+        Tell the child process to drop the commands it has not written yet and the serial port output buffer
+        """
+        self._commands.set_position(_DISCARD, self._commands.position(_WRITTEN))
+        self._command_ready.set()
+
+    def close(self):
+        """
+        Stop the child process and free the shared memory
+        """
+        if self.is_open:
+            self.is_open = False
+            self._stop.set()
+            self._command_ready.set()
+            self._process.join(5)
+            self._release()
+
+    def _wait_for_status(self, status):
+        """
+        Wait for the child process to report if it opened the serial port, or to die before it does
+        """
+        while True:
+            try:
+                return status.get(timeout=0.1)
+            except queue.Empty:
+                if self._process.is_alive():
+                    continue
+            # The report may have arrived just before the child process exited
+            try:
+                return status.get(timeout=0.5)
+            except queue.Empty:
+                return f"the serial process exited with code {self._process.exitcode}"
+
+    def _release(self):
+        """
+        Free the shared memory block
+        """
+        self._commands = self._replies = None
+        self._shm.close()
+        self._shm.unlink()
@@ -0,0 +1,337 @@
+"""
+Pulse Train Hat Cycle Time Profiler
+===================================
+
+.. module:: pthat.profiler
+   :platform: Mac, Linux, Windows
+   :synopsis: Split the wall time of a job into waiting for replies, host compute and serial transmit time.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'CycleProfiler' and :class:'ProfilingSerial' classes.
+
+A :class:'ProfilingSerial' wraps the serial port of a :class:'pthat.pthat.PTHat' object, the same way as
+:class:'pthat.session.RecordingSerial', and timestamps every write made by send_command and every read made by
+get_response. A :class:'CycleProfiler' turns the timestamps into time spent in each category:
+
+* transmit - the bytes written going out on the wire, worked out from their length at the baud rate
+* received - waiting for a received reply, or for the result of a command such as an ADC reading
+* completed - waiting for a completed reply, which is mostly waiting for motion to finish
+* compute - the host doing something else between reads and writes
+* idle - reads that ended without a reply and were not followed by one before the end of the segment
+
+Time spent in a read is put down to the reply it ended with. Reads that time out add their time to the next reply.
+While the bytes of a write are still going out, time in a read is put down to transmit. The time in the write call
+itself is transmit as well.
+
+The job is split into segments with :meth:'CycleProfiler.segment'. The result can be printed with
+:meth:'CycleProfiler.report', saved as folded stacks for a flame graph with :meth:'CycleProfiler.folded' or saved as a
+Chrome trace event timeline with :meth:'CycleProfiler.save_chrome_trace' that can be opened in chrome://tracing or
+Perfetto.
+
+.. code-block:: python
+
+   from pthat.profiler import CycleProfiler
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", command_id=1, serial_device="/dev/ttyS0")
+   profiler = CycleProfiler(baud_rate=xaxis.baud_rate)
+   profiler.attach(xaxis)
+   with profiler.segment("set up"):
+       xaxis.send_command(xaxis.set_axis(frequency=1000.0, pulse_count=2000))
+       while "CI01CX*" not in xaxis.get_all_responses():
+           pass
+   with profiler.segment("move"):
+       xaxis.send_command(xaxis.start())
+       while "CI01SX*" not in xaxis.get_all_responses():
+           pass
+   print(profiler.report())
+   profiler.save_chrome_trace("job.json")
+"""
+import contextlib
+import json
+
+from pthat.clock import get_clock
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+CATEGORIES = ("transmit", "received", "completed", "compute", "idle")
+"""
+Categories the time of each segment is split into
+"""
+DEFAULT_SEGMENT = "job"
+"""
+Segment used outside of :meth:'CycleProfiler.segment'
+"""
+
+_THREADS = {"segments": 1, "host": 2, "wire": 3}   # Chrome trace thread of each row of the timeline
+
+
+class CycleProfiler:
+    """
+    .. class:: CycleProfiler
+
+    Works out where the wall time of a job goes.
+
+    :param baud_rate: serial port baud rate used to work out the transmit time - default 115200
+    :param trace: keep the events for the Chrome trace - default True
+    :param clock: clock used for the timestamps - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, baud_rate=115200, trace=True, clock=None):
+        """
+        Constructor
+        """
+        if baud_rate <= 0:
+            raise ValueError(f"Invalid baud rate {baud_rate}. Must be greater than 0")
+
+        self.baud_rate = baud_rate
+        self.trace = trace
+        self.clock = get_clock() if clock is None else clock
+        self.times = {}
+        """
+        Dict of segment name to a dict of category to nanoseconds, in the order the segments were first used
+        """
+        self.events = []
+        """
+        Chrome trace events
+        """
+        self.current = DEFAULT_SEGMENT
+        """
+        Name of the segment the time is put down to
+        """
+        self._byte_ns = 10 * 1e9 / baud_rate
+        self._start_ns = None
+        self._last_ns = None          # end of the last read, write or segment change
+        self._wire_free_ns = 0        # when the bytes written so far have all gone out
+        self._waiting = 0             # nanoseconds of reads not yet put down to a reply
+        self._waiting_since = None
+
+    def attach(self, pthat):
+        """
+        Wrap the serial port of a PTHat object so its reads and writes are profiled. Several objects that share one
+        serial port can be attached to the same profiler.
+
+        :param pthat: PTHat, Axis, ADC, AUX or PWM object
+        :returns: the profiling serial port
+        :rtype: ProfilingSerial
+        """
+        if not isinstance(pthat.serial, ProfilingSerial):
+            pthat.serial = ProfilingSerial(pthat.serial, self)
+        return pthat.serial
+
+    @contextlib.contextmanager
+    def segment(self, name):
+        """
+        Put the time down to a named segment of the job while in the with block
+
+        :param name: segment name
+        """
+        previous = self.current
+        self._switch(name)
+        start = self._now()
+        try:
+            yield self
+        finally:
+            self._event(name, "segment", start, self._now(), "segments")
+            self._switch(previous)
+
+    def totals(self):
+        """
+        :returns: dict of category to nanoseconds over every segment
+        :rtype: dict
+        """
+        return {category: sum(times.get(category, 0) for times in self.times.values()) for category in CATEGORIES}
+
+    def folded(self):
+        """
+        Folded stacks of segment;category and microseconds, one a line, as used by flamegraph.pl and speedscope
+
+        :returns: the folded stacks
+        :rtype: str
+        """
+        return "".join(f"{segment};{category} {ns // 1000}\n" for segment, times in self.times.items()
+                       for category, ns in times.items() if ns // 1000 > 0)
+
+    def report(self, width=40):
+        """
+        A table of the time in each segment and category, with bars showing the share of the whole job
+
+        :param width: characters of the longest bar - default 40
+        :returns: the table
+        :rtype: str
+        """
+        self._flush_waiting()
+        total = sum(sum(times.values()) for times in self.times.values()) or 1
+        lines = []
+        for segment, times in self.times.items():
+            segment_ns = sum(times.values())
+            lines.append(f"{segment} {segment_ns / 1e6:.3f}ms {100.0 * segment_ns / total:.1f}%")
+            for category in CATEGORIES:
+                ns = times.get(category, 0)
+                if ns:
+                    bar = "#" * max(1, round(width * ns / total))
+                    lines.append(f"  {category:<10} {ns / 1e6:10.3f}ms {100.0 * ns / total:5.1f}% {bar}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """
+        :returns: the events as a Chrome trace event dict
+        :rtype: dict
+        """
+        names = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                 for name, tid in _THREADS.items()]
+        return {"traceEvents": names + self.events, "displayTimeUnit": "ns"}
+
+    def save_chrome_trace(self, path):
+        """
+        Save the events as a Chrome trace event JSON file
+
+        :param path: file path
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def reset(self):
+        """
+        Throw away everything profiled so far
+        """
+        self.times = {}
+        self.events = []
+        self._start_ns = self._last_ns = self._waiting_since = None
+        self._wire_free_ns = 0
+        self._waiting = 0
+
+    def written(self, data, start, end):
+        """
+        Add a write to the profile, called by :class:'ProfilingSerial'
+
+        :param data: bytes written
+        :param start: perf counter nanoseconds the write started
+        :param end: perf counter nanoseconds the write returned
+        """
+        self._compute(start)
+        self._wire_free_ns = max(self._wire_free_ns, start) + int(len(data) * self._byte_ns)
+        self._add("transmit", end - start)
+        self._event(data.decode("ascii", "replace"), "write", start, end, "host")
+        self._event(data.decode("ascii", "replace"), "wire", start, self._wire_free_ns, "wire")
+        self._last_ns = end
+
+    def read(self, data, start, end):
+        """
+        Add a read to the profile, called by :class:'ProfilingSerial'
+
+        :param data: bytes read
+        :param start: perf counter nanoseconds the read started
+        :param end: perf counter nanoseconds the read returned
+        """
+        self._compute(start)
+        transmit = max(0, min(end, self._wire_free_ns) - start)
+        self._add("transmit", transmit)
+        self._waiting += end - start - transmit
+        if self._waiting_since is None:
+            self._waiting_since = start
+        if data:
+            category = "completed" if data[:1] == b"C" else "received"
+            self._add(category, self._waiting)
+            self._event(data.decode("ascii", "replace"), category, self._waiting_since, end, "host")
+            self._waiting = 0
+            self._waiting_since = None
+        self._last_ns = end
+
+    def _now(self):
+        now = self.clock.perf_counter_ns()
+        if self._start_ns is None:
+            self._start_ns = self._last_ns = now
+        return now
+
+    def _switch(self, name):
+        """
+        Put the time so far down to the current segment and carry on with another
+        """
+        self._compute(self._now())
+        self._flush_waiting()
+        self.current = name
+
+    def _compute(self, now):
+        """
+        Put the time since the last read or write down to host compute
+        """
+        if self._start_ns is None:
+            self._start_ns = self._last_ns = now
+        if now > self._last_ns:
+            self._add("compute", now - self._last_ns)
+            self._event("compute", "compute", self._last_ns, now, "host")
+        self._last_ns = max(self._last_ns, now)
+
+    def _flush_waiting(self):
+        """
+        Put reads that were not followed by a reply down to idle
+        """
+        if self._waiting:
+            self._add("idle", self._waiting)
+            self._event("idle", "idle", self._waiting_since, self._last_ns, "host")
+        self._waiting = 0
+        self._waiting_since = None
+
+    def _add(self, category, ns):
+        if ns > 0:
+            times = self.times.setdefault(self.current, {})
+            times[category] = times.get(category, 0) + ns
+
+    def _event(self, name, category, start, end, thread):
+        """
+        Add a complete event to the trace, with times in microseconds from the first timestamp
+        """
+        if self.trace and end > start:
+            self.events.append({"name": name, "cat": category, "ph": "X", "pid": 1, "tid": _THREADS[thread],
+                                "ts": (start - self._start_ns) / 1000, "dur": (end - start) / 1000,
+                                "args": {"segment": self.current}})
+
+
+class ProfilingSerial:
+    """
+    .. class:: ProfilingSerial
+
+    Serial like object that passes everything to another serial port and times the reads and writes.
+
+    :param serial_port: the serial port to wrap
+    :param profiler: the cycle profiler
+    """
+    def __init__(self, serial_port, profiler):
+        """
+        Constructor
+        """
+        self.serial_port = serial_port
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.serial_port, name)
+
+    def write(self, data):
+        """
+        Write data to the serial port and time it
+
+        :param data: bytes to write
+        :returns: number of bytes written
+        :rtype: int
+        """
+        clock = self.profiler.clock
+        start = clock.perf_counter_ns()
+        written = self.serial_port.write(data)
+        self.profiler.written(bytes(data), start, clock.perf_counter_ns())
+        return written
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Read from the serial port and time how long it waited
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        clock = self.profiler.clock
+        start = clock.perf_counter_ns()
+        data = self.serial_port.read_until(expected, size)
+        self.profiler.read(data, start, clock.perf_counter_ns())
+        return data
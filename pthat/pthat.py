@@ -68,6 +68,11 @@ the supporting classes extend the PTHat class.
 """
 import serial
 
+from pthat.clock import get_clock
+from pthat.coalesce import discard_output
+from pthat.hooks import registry
+from pthat.stats import RunningStats
+
 __license__ = "Apache V2"
 __docformat__ = 'reStructuredText'
 
@@ -88,6 +93,8 @@ class PTHat:
        :type baud_rate: int, optional
        :param test_mode: if true then serial commands will not actually be sent - defaults to False
        :type test_mode: boolean, optional
+       :param serial_port: an open serial port or serial like object to use instead of opening serial_device
+       :type serial_port: class:`serial.Serial`, optional
     """
     # Properties
     _version = "1.0.1"  # Version of this API
@@ -121,7 +128,19 @@ class PTHat:
     """
     serial = None
     """
-    The path to the serial device such as /dev/ttyS0. This can be set directly.
+    The serial port object opened on serial_device or passed in as serial_port. This can be set directly, for example
+    to wrap it with a :class:'pthat.session.RecordingSerial'.
+    """
+    clock = None
+    """
+    Clock used to time the priority commands. Set to the clock from :func:'pthat.clock.get_clock' when the object is
+    created. This can be set directly.
+    """
+    priority_latency = None
+    """
+    | Statistics of the time in nanoseconds from calling a priority command such as :meth:'emergency_stop' until the
+      serial port reported it written.
+    | A :class:'pthat.stats.RunningStats' object created for each instance.
     """
 
     _motor_enabled = False   # Specifies if the motor is enabled or not. Do not set this as it is set internally
@@ -131,6 +150,7 @@ class PTHat:
 
     __buffer_value = 0000   # Value sent in Byte 2-5 for all buffer commands
     __response_string = ""  # response string from PTHat
+    __owns_serial = False   # if the serial port was opened by this instance and should be closed by it
 
     # Generic commands
     __request_port_status_command = "LI"  # Request IO Port Status Command
@@ -140,12 +160,15 @@ class PTHat:
     __completed_command_on_off_replies_command = "G"  # Turn on/off Completed Command Replies
     __request_firmware_version_command = "FW"  # Request firmware version command
     __reset_pthat_command = "N"  # Reset the PTHat
+    __emergency_stop_bytes = b"I00TA*"   # Pre-encoded instant stop all axis command for the priority lane
+    __emergency_reset_bytes = b"N*"      # Pre-encoded reset command for the priority lane
 
     __initiate_buffer_command = "H"    # Initiate the buffer command
     __start_buffer_command = "Z"       # Start the buffer command
     __buffer_loop_start_command = "W"  # Buffer loop start command
 
-    def __init__(self, command_type="I", command_id=0, serial_device="/dev/ttyS0", baud_rate=115200, test_mode=False):
+    def __init__(self, command_type="I", command_id=0, serial_device="/dev/ttyS0", baud_rate=115200, test_mode=False,
+                 serial_port=None):
         """
         Constructor
         """
@@ -156,19 +179,25 @@ class PTHat:
         self.serial_device = serial_device  # default to /dev/ttyS0
         self.baud_rate = baud_rate  # default baud rate
         self.test_mode = test_mode
+        self.clock = get_clock()
+        self.priority_latency = RunningStats("priority latency")
 
-        if not test_mode:
-            self.__serial = self.init_serial_interface()  # create serial port object and open it
-            self.serial = self.__serial
+        if serial_port is not None:
+            self.serial = serial_port   # use the serial port passed in, it is closed by whoever opened it
+        elif not test_mode:
+            self.serial = self.init_serial_interface()  # create serial port object and open it
+            self.__owns_serial = True
 
     def __del__(self):
         """
         Destructor
         """
+        # a serial port passed in may be shared with other objects or processes, so it is left to whoever opened it
+        if not self.__owns_serial or not self.serial.is_open:
+            return
         # send command to stop all and then close the serial device
         self.reset()
-        if not self.test_mode:
-            self.__serial.close()
+        self.serial.close()
 
     @property
     def motor_enabled(self):
@@ -259,7 +288,67 @@ class PTHat:
         .. todo: make asynchronous
         """
         if not self.test_mode:
-            self.__serial.write(bytes(command, 'utf-8'))
+            if registry.sending:
+                registry.send(self, self.serial.write, bytes(command, 'utf-8'), self.clock)
+            else:
+                self.serial.write(bytes(command, 'utf-8'))
+
+    def send_priority_command(self, command, discard_pending=True):
+        """
+        This method writes a command straight to the serial port ahead of anything else waiting to be sent. It is used
+        for the stop and reset commands so they do not sit behind a buffered program or a stream of speed changes.
+
+        When discard_pending is true, bytes still waiting in the serial port output buffer are thrown away first. If a
+        command was cut short by this, the command end character is sent before the priority command so the PTHat
+        rejects the partial command instead of joining it to the priority command. The write is then flushed and the
+        time taken is added to :attr:'priority_latency'.
+
+        :param command: command to send as a string or bytes
+        :param discard_pending: throw away the bytes waiting in the output buffer first - default True
+        :returns: time from the call until the command was written in nanoseconds, None in test mode
+        :rtype: int
+        """
+        start = self.clock.perf_counter_ns()
+        if self.test_mode:
+            return None
+
+        if isinstance(command, str):
+            command = command.encode("utf-8")
+
+        port = self.serial
+        if discard_pending:
+            command = discard_output(port, command)
+        if registry.sending:
+            registry.send(self, port.write, command, self.clock)
+        else:
+            port.write(command)
+        port.flush()
+
+        latency = self.clock.perf_counter_ns() - start
+        self.priority_latency.add(latency)
+        if self.debug:
+            print(f"Priority command {command} written in {latency}ns")
+        return latency
+
+    def emergency_stop(self, reset=False):
+        """
+        Stop all axes right away using the pre-encoded instant stop all command I00TA* or the reset command N*. Unlike
+        the stop methods of :class:'Axis' this does not depend on auto_send_command or on what this object thinks is
+        running. Anything waiting in the serial port output buffer is thrown away first as described in
+        :meth:'send_priority_command'.
+
+        The stop all command ramps the axes down. The reset command stops the pulse trains straight away and puts
+        the PTHat back to its turn on state.
+
+        :param reset: send the reset command instead of stop all - default False
+        :returns: the command that was sent
+        :rtype: str
+        """
+        command = self.__emergency_reset_bytes if reset else self.__emergency_stop_bytes
+        if self.debug:
+            print(f"PTHat emergency stop command: {command.decode()}")
+        self.send_priority_command(command)
+        return command.decode()
 
     def get_all_responses(self):
         """
@@ -290,11 +379,13 @@ class PTHat:
         resp_string = None
 
         # read serial buffer in bytes
-        response_bytes = self.__serial.read_until(self._command_end.encode())
+        response_bytes = self.serial.read_until(self._command_end.encode())
 
         if response_bytes is not None and len(response_bytes) > 0:
             # convert bytes to string
             resp_string = response_bytes.decode()
+            if registry.on_reply:
+                registry.reply(self, resp_string)
 
         return resp_string
 
@@ -432,14 +523,14 @@ class PTHat:
             return False
 
         if not period == "W" and not period == "M":
-            print(f"Invalid period {period}")
+            self._validation_failed(f"Invalid period {period}")
             return False
 
         if delay is not None:
             self.wait_delay = delay
 
         if not self._validate_values(self.wait_delay, 0, 9999):
-            print(f"Invalid wait delay {delay}")
+            self._validation_failed(f"Invalid wait delay {delay}")
             return False
 
         command = f"{self.command_type}{self.command_id:02}{self.__set_wait_delay_command}{period}" \
@@ -791,6 +882,7 @@ class PTHat:
         """
         Resets the PTHAT back to turn on state and resets all pulse generators.
         Can be used in an emergency to close everything down and stop the pulse trains.
+        When auto_send_command is set the command is sent with :meth:'send_priority_command'.
 
         :returns: the command to send to the serial port
         :rtype: str
@@ -829,7 +921,7 @@ class PTHat:
         if self.debug:
             print(f"PTHat reset command: {command}")
         if self.auto_send_command:
-            self.send_command(command=command)
+            self.send_priority_command(command=self.__emergency_reset_bytes)
 
         self.wait_delay = 0
         self.command_type = "I"
@@ -1117,17 +1209,27 @@ class PTHat:
         :rtype: bool
         """
         if not self.command_type == "I" and not self.command_type == "B":
-            if self.debug:
-                print(f"Invalid command type {self.command_type}")
+            self._validation_failed(f"Invalid command type {self.command_type}", show=self.debug)
             return False
 
         if not self._validate_values(self.command_id, 0, 99):
-            if self.debug:
-                print(f"Invalid command ID {self.command_id}")
+            self._validation_failed(f"Invalid command ID {self.command_id}", show=self.debug)
             return False
 
         return True
 
+    def _validation_failed(self, message, show=True):
+        """
+        Report a setting that is not valid to the on validate failure hooks
+
+        :param message: message saying which setting is not valid
+        :param show: print the message - default True
+        """
+        if show:
+            print(message)
+        if registry.on_validate_failure:
+            registry.validate_failed(self, message)
+
     def _validate_values(self, value, start, end):
         """
         Check an value against start and end to make sure it is between them
@@ -1156,6 +1258,7 @@ class Axis(PTHat):
     :param serial_device: serial device - default /dev/ttyS0
     :param baud_rate: serial port baud rate - default 115200
     :param test_mode: if true then serial commands will not actually be sent - default False
+    :param serial_port: an open serial port or serial like object to use instead of opening serial_device - default None
     """
     # Properties
     axis = "X"
@@ -1265,12 +1368,12 @@ class Axis(PTHat):
     __enable_disable_limit_switches_command = "K"  # enable/disable limit switches command
 
     def __init__(self, axis, command_type="I", command_id=0, serial_device="/dev/ttyS0", baud_rate=115200,
-                 test_mode=False):
+                 test_mode=False, serial_port=None):
         """
         Constructor
         """
         super().__init__(command_type=command_type, command_id=command_id, serial_device=serial_device,
-                         baud_rate=baud_rate, test_mode=test_mode)
+                         baud_rate=baud_rate, test_mode=test_mode, serial_port=serial_port)
         if str(axis).upper() == "X" or str(axis).upper() == "Y" or str(axis).upper() == "Z" or \
                 str(axis).upper() == "E" or str(axis).upper() == "A":
             self.axis = str(axis).upper()
@@ -1398,39 +1501,39 @@ class Axis(PTHat):
             self.enable_line_polarity = enable_line_polarity
 
         if not self._validate_values(self.frequency, 0.0, 500000.0):
-            print(f"Invalid frequency {self.frequency}")
+            self._validation_failed(f"Invalid frequency {self.frequency}")
             return False
 
         if not self._validate_values(self.pulse_count, 0, 4294967295):
-            print(f"Invalid pulse count {self.pulse_count}")
+            self._validation_failed(f"Invalid pulse count {self.pulse_count}")
             return False
 
         if not self._validate_values(self.ramp_divide, 0, 255):
-            print(f"Invalid ramp divide {self.ramp_divide}")
+            self._validation_failed(f"Invalid ramp divide {self.ramp_divide}")
             return False
 
         if not self._validate_values(self.ramp_pause, 0, 255):
-            print(f"Invalid ramp pause {self.ramp_pause}")
+            self._validation_failed(f"Invalid ramp pause {self.ramp_pause}")
             return False
 
         if not self._validate_values(self.link_to_adc, 0, 2):
-            print(f"Invalid link to ADC {self.link_to_adc}")
+            self._validation_failed(f"Invalid link to ADC {self.link_to_adc}")
             return False
 
         if not self._validate_values(self.direction, 0, 1):
-            print(f"Invalid direction: {self.direction}")
+            self._validation_failed(f"Invalid direction: {self.direction}")
             return False
 
         if not self._validate_values(self.start_ramp, 0, 1):
-            print(f"Invalid start ramp: {self.start_ramp}")
+            self._validation_failed(f"Invalid start ramp: {self.start_ramp}")
             return False
 
         if not self._validate_values(self.finish_ramp, 0, 1):
-            print(f"Invalid finish ramp: {self.finish_ramp}")
+            self._validation_failed(f"Invalid finish ramp: {self.finish_ramp}")
             return False
 
         if not self._validate_values(self.enable_line_polarity, 0, 1):
-            print(f"Invalid enable line polarity {self.enable_line_polarity}")
+            self._validation_failed(f"Invalid enable line polarity {self.enable_line_polarity}")
             return False
 
         command = f"{self.command_type}{self.command_id:02}{self.__axis_config_command}{self.axis}" \
@@ -1590,7 +1693,7 @@ class Axis(PTHat):
             self.pulse_count_change_direction = pulse_count
 
         if not self._validate_values(self.pulse_count_change_direction, 0000000000, 4294967295):
-            print(f"Invalid pulse count to change direction on {self.pulse_count_change_direction}")
+            self._validation_failed(f"Invalid pulse count to change direction on {self.pulse_count_change_direction}")
             return False
 
         command = f"{self.command_type}{self.command_id:02}{self.__auto_direction_change_command}{self.axis}" \
@@ -1717,23 +1820,27 @@ I01JX00000064001111
             self.enable_disable_e_pulse_count_replies = ereplies
 
         if not self._validate_values(self.pulse_counts_sent_back, 0000000000, 4294967295):
-            print(f"Invalid pulse count to send back on {self.pulse_counts_sent_back}")
+            self._validation_failed(f"Invalid pulse count to send back on {self.pulse_counts_sent_back}")
             return False
 
         if not self._validate_values(self.enable_disable_x_pulse_count_replies, 0, 1):
-            print(f"Invalid enable disable X pulse count replies {self.enable_disable_x_pulse_count_replies}")
+            self._validation_failed(f"Invalid enable disable X pulse count replies "
+                                    f"{self.enable_disable_x_pulse_count_replies}")
             return False
 
         if not self._validate_values(self.enable_disable_y_pulse_count_replies, 0, 1):
-            print(f"Invalid enable disable Y pulse count replies {self.enable_disable_y_pulse_count_replies}")
+            self._validation_failed(f"Invalid enable disable Y pulse count replies "
+                                    f"{self.enable_disable_y_pulse_count_replies}")
             return False
 
         if not self._validate_values(self.enable_disable_z_pulse_count_replies, 0, 1):
-            print(f"Invalid enable disable Z pulse count replies {self.enable_disable_z_pulse_count_replies}")
+            self._validation_failed(f"Invalid enable disable Z pulse count replies "
+                                    f"{self.enable_disable_z_pulse_count_replies}")
             return False
 
         if not self._validate_values(self.enable_disable_e_pulse_count_replies, 0, 1):
-            print(f"Invalid enable disable E pulse count replies {self.enable_disable_e_pulse_count_replies}")
+            self._validation_failed(f"Invalid enable disable E pulse count replies "
+                                    f"{self.enable_disable_e_pulse_count_replies}")
             return False
 
         command = f"{self.command_type}{self.command_id:02}{self.__auto_count_pulse_out_command}{self.axis}" \
@@ -1878,7 +1985,8 @@ I01JX00000064001111
         """
         Stop one of the pulse trains from running. This is a controlled stop, in that the Axis will ramp down
         and not just stop to protect the motors. If you want to use a sudden stop then we recommend a external
-        Emergency Stop button that cuts the power or send a Reset command.
+        Emergency Stop button that cuts the power or send a Reset command. When auto_send_command is set an instant stop is sent with
+        :meth:'send_priority_command'.
 
         :returns: the command to send to the serial port
         :rtype: str
@@ -1934,7 +2042,8 @@ I01JX00000064001111
         """
         Stop all of the pulse trains from running. This is a controlled stop, in that the Axis will ramp down
         and not just stop to protect the motors. If you want to use a sudden stop then we recommend a external
-        Emergency Stop button that cuts the power or send a Reset command.
+        Emergency Stop button that cuts the power or send a Reset command. When auto_send_command is set an instant stop all is sent with
+        :meth:'send_priority_command', throwing away anything else waiting to be sent.
 
         :returns: the command to send to the serial port
         :rtype: str
@@ -2001,7 +2110,12 @@ I01JX00000064001111
             if self.debug:
                 print(f"Axis stop command: {command}")
             if self.auto_send_command:
-                self.send_command(command=command)
+                if command[0] == "I":
+                    # Stopping all axes throws away whatever else is waiting to be sent
+                    self.send_priority_command(command=command,
+                                               discard_pending=command[3:5] == self.__stop_all_axis_command)
+                else:
+                    self.send_command(command=command)
 
             self.__started = False
 
@@ -2228,19 +2342,19 @@ I01JX00000064001111
             self.pause_all_return_e_pulse_count = return_e_pulse_cnt
 
         if not self._validate_values(self.pause_all_return_x_pulse_count, 0, 1):
-            print(f"Invalid pause all return X pulse count {self.pause_all_return_x_pulse_count}")
+            self._validation_failed(f"Invalid pause all return X pulse count {self.pause_all_return_x_pulse_count}")
             return False
 
         if not self._validate_values(self.pause_all_return_y_pulse_count, 0, 1):
-            print(f"Invalid pause all return Y pulse count {self.pause_all_return_y_pulse_count}")
+            self._validation_failed(f"Invalid pause all return Y pulse count {self.pause_all_return_y_pulse_count}")
             return False
 
         if not self._validate_values(self.pause_all_return_z_pulse_count, 0, 1):
-            print(f"Invalid pause all return Z pulse count {self.pause_all_return_z_pulse_count}")
+            self._validation_failed(f"Invalid pause all return Z pulse count {self.pause_all_return_z_pulse_count}")
             return False
 
         if not self._validate_values(self.pause_all_return_e_pulse_count, 0, 1):
-            print(f"Invalid pause all return E pulse count {self.pause_all_return_e_pulse_count}")
+            self._validation_failed(f"Invalid pause all return E pulse count {self.pause_all_return_e_pulse_count}")
             return False
 
         if not self.__paused:
@@ -2447,19 +2561,19 @@ I01JX00000064001111
             self.pause_all_return_e_pulse_count = return_e_pulse_cnt
 
         if not self._validate_values(self.pause_all_return_x_pulse_count, 0, 1):
-            print(f"Invalid pause all return X pulse count {self.pause_all_return_x_pulse_count}")
+            self._validation_failed(f"Invalid pause all return X pulse count {self.pause_all_return_x_pulse_count}")
             return False
 
         if not self._validate_values(self.pause_all_return_y_pulse_count, 0, 1):
-            print(f"Invalid pause all return Y pulse count {self.pause_all_return_y_pulse_count}")
+            self._validation_failed(f"Invalid pause all return Y pulse count {self.pause_all_return_y_pulse_count}")
             return False
 
         if not self._validate_values(self.pause_all_return_z_pulse_count, 0, 1):
-            print(f"Invalid pause all return Z pulse count {self.pause_all_return_z_pulse_count}")
+            self._validation_failed(f"Invalid pause all return Z pulse count {self.pause_all_return_z_pulse_count}")
             return False
 
         if not self._validate_values(self.pause_all_return_e_pulse_count, 0, 1):
-            print(f"Invalid pause all return E pulse count {self.pause_all_return_e_pulse_count}")
+            self._validation_failed(f"Invalid pause all return E pulse count {self.pause_all_return_e_pulse_count}")
             return False
 
         if self.__paused:
@@ -2599,7 +2713,7 @@ I01JX00000064001111
             return False
 
         if not self._validate_values(self.frequency, 0.0, 125000.0):
-            print(f"Invalid frequency {self.frequency}. Must be between 0.0 and 125000.0")
+            self._validation_failed(f"Invalid frequency {self.frequency}. Must be between 0.0 and 125000.0")
             return False
 
         command = f"{self.command_type}{self.command_id:02}{self.__change_axis_speed_command}{self.axis}" \
@@ -2900,8 +3014,7 @@ I01JX00000064001111
         :rtype: bool
         """
         if not self.axis == "X" and not self.axis == "Y" and not self.axis == "Z" and not self.axis == "E":
-            if self.debug:
-                print(f"Invalid axis {self.axis}")
+            self._validation_failed(f"Invalid axis {self.axis}", show=self.debug)
             return False
 
         return super()._validate_command()
@@ -2920,6 +3033,7 @@ class ADC(PTHat):
     :param serial_device: serial device - default /dev/ttyS0
     :param baud_rate: serial port baud rate - default 115200
     :param test_mode: if true then serial commands will not actually be sent - default False
+    :param serial_port: an open serial port or serial like object to use instead of opening serial_device - default None
     """
     # Properties
     adc_number = 1
@@ -2931,12 +3045,12 @@ class ADC(PTHat):
     __request_adc_reading_command = "D"  # Request current ADC value - D1 = ADC1 Result, D2 = ADC2 Result
 
     def __init__(self, adc_number, command_type="I", command_id=0, serial_device="/dev/ttyS0", baud_rate=115200,
-                 test_mode=False):
+                 test_mode=False, serial_port=None):
         """
         Constructor
         """
         super().__init__(command_type=command_type, command_id=command_id, serial_device=serial_device,
-                         baud_rate=baud_rate, test_mode=test_mode)
+                         baud_rate=baud_rate, test_mode=test_mode, serial_port=serial_port)
         if self._validate_values(adc_number, 1, 2):
             if self.debug:
                 print(f"Valid ADC number {self.adc_number}.")
@@ -2998,7 +3112,7 @@ class ADC(PTHat):
             self.adc_number = adc_number
 
         if not self._validate_values(self.adc_number, 1, 2):
-            print(f"Invalid ADC number {self.adc_number}. Should be 1 or 2")
+            self._validation_failed(f"Invalid ADC number {self.adc_number}. Should be 1 or 2")
             return False
 
         command = f"{self.command_type}{self.command_id:02}{self.__request_adc_reading_command}{self.adc_number}" \
@@ -3031,6 +3145,7 @@ class AUX(PTHat):
     :param serial_device: serial device - default /dev/ttyS0
     :param baud_rate: serial port baud rate - default 115200
     :param test_mode: if true then serial commands will not actually be sent - default False
+    :param serial_port: an open serial port or serial like object to use instead of opening serial_device - default None
     """
     # Properties
     aux_number = 1
@@ -3042,12 +3157,12 @@ class AUX(PTHat):
     __set_on_off_aux_output_command = "A"  # Set on/off AUX output command - A1 = Set AUX1, A2 = Set AUX2, A3 = Set AUX3
 
     def __init__(self, aux_number, command_type="I", command_id=0, serial_device="/dev/ttyS0", baud_rate=115200,
-                 test_mode=False):
+                 test_mode=False, serial_port=None):
         """
         Constructor
         """
         super().__init__(command_type=command_type, command_id=command_id, serial_device=serial_device,
-                         baud_rate=baud_rate, test_mode=test_mode)
+                         baud_rate=baud_rate, test_mode=test_mode, serial_port=serial_port)
         if self._validate_values(aux_number, 1, 3):
             if self.debug:
                 print(f"Valid AUX number {self.aux_number}.")
@@ -3112,7 +3227,7 @@ class AUX(PTHat):
             self.aux_number = aux_number
 
         if not self._validate_values(self.aux_number, 1, 3):
-            print(f"Invalid AUX number {self.aux_number}. Should be between 1 and 3")
+            self._validation_failed(f"Invalid AUX number {self.aux_number}. Should be between 1 and 3")
 
         command = f"{self.command_type}{self.command_id:02}{self.__set_on_off_aux_output_command}{self.aux_number}1" \
                   f"{self._command_end}"
@@ -3179,7 +3294,7 @@ class AUX(PTHat):
             self.aux_number = aux_number
 
         if not self._validate_values(self.aux_number, 1, 3):
-            print(f"Invalid AUX number {self.aux_number}. Should be between 1 and 3")
+            self._validation_failed(f"Invalid AUX number {self.aux_number}. Should be between 1 and 3")
 
         command = f"{self.command_type}{self.command_id:02}{self.__set_on_off_aux_output_command}{self.aux_number}0" \
                   f"{self._command_end}"
@@ -3214,6 +3329,7 @@ class PWM(PTHat):
     :param serial_device: serial device - default /dev/ttyS0
     :param baud_rate: serial port baud rate - default 115200
     :param test_mode: if true then serial commands will not actually be sent - default False
+    :param serial_port: an open serial port or serial like object to use instead of opening serial_device - default None
     """
     # Properties
     axis = "X"
@@ -3255,12 +3371,12 @@ class PWM(PTHat):
     __set_both_pwm_channels_command = "UA"  # Sets both PWM channels in one command - UA= Set X-Axis and Y-Axis
 
     def __init__(self, axis, command_type="I", command_id=0, serial_device="/dev/ttyS0", baud_rate=115200,
-                 test_mode=False):
+                 test_mode=False, serial_port=None):
         """
         Constructor
         """
         super().__init__(command_type=command_type, command_id=command_id, serial_device=serial_device,
-                         baud_rate=baud_rate, test_mode=test_mode)
+                         baud_rate=baud_rate, test_mode=test_mode, serial_port=serial_port)
         if str(axis).upper() == "X" or str(axis).upper() == "Y" or str(axis).upper() == "A":
             self.axis = axis.upper()
         else:
@@ -3325,7 +3441,7 @@ class PWM(PTHat):
             return False
 
         if not self.axis == "X" and not self.axis == "Y":
-            print(f"Invalid axis {self.axis}. Should be X or Y")
+            self._validation_failed(f"Invalid axis {self.axis}. Should be X or Y")
             return False
 
         if frequency is not None:
@@ -3335,17 +3451,18 @@ class PWM(PTHat):
             self.duty_cycle = duty_cycle
 
         if not self._validate_values(self.frequency, 0, 1000000):
-            print(f"Invalid frequency {self.frequency}. Should be between 0 and 1000000")
+            self._validation_failed(f"Invalid frequency {self.frequency}. Should be between 0 and 1000000")
             return False
 
         if not self._validate_values(self.duty_cycle, 0, 100):
-            print(f"Invalid duty cycle {self.duty_cycle}. Should be between 0 and 100")
+            self._validation_failed(f"Invalid duty cycle {self.duty_cycle}. Should be between 0 and 100")
             return False
 
-        self.duty_cycle = self.duty_cycle * 100
+        # The duty cycle is sent in hundredths of a percent
+        duty_cycle = round(self.duty_cycle * 100)
 
         command = f"{self.command_type}{self.command_id:02}{self.__set_pwm_channel_command}{self.axis}" \
-                  f"{self.frequency:07}{self.duty_cycle:05}{self._command_end}"
+                  f"{self.frequency:07}{duty_cycle:05}{self._command_end}"
         if self.debug:
             print(f"set_channel command: {command}")
         if self.auto_send_command:
@@ -3449,26 +3566,27 @@ class PWM(PTHat):
             self.duty_cycle_y = duty_cycley
 
         if not self._validate_values(self.frequency_x, 0, 1000000):
-            print(f"Invalid frequency X {self.frequency_x}. Should be between 0 and 1000000")
+            self._validation_failed(f"Invalid frequency X {self.frequency_x}. Should be between 0 and 1000000")
             return False
 
         if not self._validate_values(self.frequency_y, 0, 1000000):
-            print(f"Invalid frequency Y {self.frequency_y}. Should be between 0 and 1000000")
+            self._validation_failed(f"Invalid frequency Y {self.frequency_y}. Should be between 0 and 1000000")
             return False
 
         if not self._validate_values(self.duty_cycle_x, 0, 100):
-            print(f"Invalid duty cycle X {self.duty_cycle_x}. Should be between 0 and 100")
+            self._validation_failed(f"Invalid duty cycle X {self.duty_cycle_x}. Should be between 0 and 100")
             return False
 
         if not self._validate_values(self.duty_cycle_y, 0, 100):
-            print(f"Invalid duty cycle Y {self.duty_cycle_y}. Should be between 0 and 100")
+            self._validation_failed(f"Invalid duty cycle Y {self.duty_cycle_y}. Should be between 0 and 100")
             return False
 
-        self.duty_cycle_x = self.duty_cycle_x * 100
-        self.duty_cycle_y = self.duty_cycle_y * 100
+        # The duty cycles are sent in hundredths of a percent
+        duty_cycle_x = round(self.duty_cycle_x * 100)
+        duty_cycle_y = round(self.duty_cycle_y * 100)
 
         command = f"{self.command_type}{self.command_id:02}{self.__set_both_pwm_channels_command}" \
-                  f"{self.frequency_x:07}{self.duty_cycle_x:05}{self.frequency_y:07}{self.duty_cycle_y:05}" \
+                  f"{self.frequency_x:07}{duty_cycle_x:05}{self.frequency_y:07}{duty_cycle_y:05}" \
                   f"{self._command_end}"
         if self.debug:
             print(f"set_both_channels command: {command}")
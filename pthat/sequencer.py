@@ -0,0 +1,207 @@
+"""
+Pulse Train Hat AUX Sequencer
+=============================
+
+.. module:: pthat.sequencer
+   :platform: Mac, Linux, Windows
+   :synopsis: Compile AUX output pulse patterns into buffered programs timed by the firmware.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'AUXSequencer' class and the :func:'wait_delay_commands' function.
+
+Switching the AUX outputs with instant commands and waiting on the host with time.sleep gives pulses that are as
+accurate as the host scheduler. An :class:'AUXSequencer' takes pulse trains for the AUX outputs, each a pulse width,
+a period and a repeat count, and compiles them into a buffered program of AUX output commands with wait delay commands
+between them. The PTHat runs the program from its buffer, so the timing is done by the firmware.
+
+Times are in microseconds. A wait of less than 10000 microseconds is one WM command and a longer wait is a WW command
+in milliseconds, followed by a WM command for the rest. Switches of several outputs at the same time are sent one after
+the other with no wait between them.
+
+A pattern with a cycle time is sent with the buffer loop start command, so it repeats until a stop is sent. Every
+buffered command takes the PTHat some time to run. Setting command_time takes it off the waits so the cycle keeps its
+length.
+
+.. code-block:: python
+
+   from pthat.pthat import AUX
+   from pthat.sequencer import AUXSequencer
+
+   aux = AUX(1, serial_device="/dev/ttyS0")
+
+   # Camera trigger: 2ms pulse on AUX1 every 50ms, glue gun on AUX2 for 20ms starting 10ms into each cycle
+   sequencer = AUXSequencer(cycle=50000)
+   sequencer.add_pulses(1, width=2000, period=50000)
+   sequencer.add_pulses(2, width=20000, period=50000, delay=10000)
+   sequencer.send(aux)
+   ...
+   aux.emergency_stop()
+"""
+from pthat.pthat import AUX, PTHat
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+BUFFER_CAPACITY = 2000
+"""
+Number of commands the buffer holds with firmware V5.3 upwards, earlier firmware holds 100
+"""
+MAX_WAIT = 9999
+"""
+Longest delay of a single wait delay command, in milliseconds for WW or microseconds for WM
+"""
+
+
+def wait_delay_commands(microseconds, command_type="B", command_id=0):
+    """
+    Build the wait delay commands for a delay. A delay of less than 10000 microseconds is one WM command and a longer
+    one is WW commands in milliseconds, followed by a WM command for the rest.
+
+    :param microseconds: length of the delay in microseconds, nothing is built for 0 or less
+    :param command_type: type of command, I = instant, B = buffered - default B
+    :param command_id: command ID, 0-99 - default 0
+    :returns: list of commands
+    :rtype: list
+    """
+    builder = PTHat(command_type=command_type, command_id=command_id, test_mode=True)
+    commands = []
+    if microseconds >= 10000:
+        milliseconds = microseconds // 1000
+        while milliseconds > 0:
+            chunk = min(milliseconds, MAX_WAIT)
+            commands.append(builder.set_wait_delay("W", chunk))
+            milliseconds -= chunk
+        microseconds %= 1000
+    if microseconds > 0:
+        commands.append(builder.set_wait_delay("M", microseconds))
+    return commands
+
+
+class AUXSequencer:
+    """
+    .. class:: AUXSequencer
+
+    Builds a buffered program that switches the AUX outputs in a pattern.
+
+    :param cycle: length of the pattern in microseconds, it is repeated with the buffer loop start until stopped
+                  - default None to run the pattern once
+    :param command_time: microseconds the PTHat takes to run each buffered command, taken off the waits - default 0
+    :param capacity: number of commands the buffer holds - default 2000
+    """
+    def __init__(self, cycle=None, command_time=0, capacity=BUFFER_CAPACITY):
+        """
+        Constructor
+        """
+        if cycle is not None and cycle <= 0:
+            raise ValueError(f"Invalid cycle {cycle}. Must be greater than 0")
+        if command_time < 0:
+            raise ValueError(f"Invalid command time {command_time}. Must be 0 or more")
+
+        self.cycle = cycle
+        self.command_time = command_time
+        self.capacity = capacity
+        self._switches = {}     # time in microseconds to dict of AUX number to level
+
+    def add_pulses(self, aux_number, width, period=None, count=1, delay=0):
+        """
+        Add a pulse train on an AUX output
+
+        :param aux_number: AUX number, 1-3
+        :param width: microseconds the output is on for each pulse
+        :param period: microseconds from the start of one pulse to the start of the next - default None for the cycle
+                       time, or for a single pulse
+        :param count: number of pulses, None for as many as fit in the cycle - default 1
+        :param delay: microseconds from the start of the pattern to the first pulse - default 0
+        """
+        if aux_number not in (1, 2, 3):
+            raise ValueError(f"Invalid AUX number {aux_number}. Must be 1, 2 or 3")
+        period = self.cycle if period is None else period
+        if width <= 0 or delay < 0 or (period is not None and period <= width):
+            raise ValueError("The width must be greater than 0 and less than the period")
+        if count is None:
+            if self.cycle is None or period is None:
+                raise ValueError("The count can only be left out when there is a cycle time")
+            count = max(1, (self.cycle - delay - width) // period + 1)
+        elif count > 1 and period is None:
+            raise ValueError("A period is needed for more than one pulse")
+
+        for pulse in range(count):
+            start = delay + pulse * (period or 0)
+            self._switch(start, aux_number, 1)
+            self._switch(start + width, aux_number, 0)
+
+    def compile(self):
+        """
+        Build the buffered program
+
+        :returns: the buffered AUX output and wait delay commands, without the buffer commands
+        :rtype: list
+        """
+        if not self._switches:
+            raise ValueError("There are no pulses to compile")
+        end = max(self._switches)
+        if self.cycle is not None and end > self.cycle:
+            raise ValueError(f"The pattern takes {end} microseconds, longer than the cycle of {self.cycle}")
+
+        auxes = {aux_number: AUX(aux_number, command_type="B", test_mode=True) for aux_number in (1, 2, 3)}
+        program = []
+        now = 0
+        for at in sorted(self._switches):
+            program += wait_delay_commands(at - now - self.command_time * (self._pending(program) + 1))
+            now = at
+            for aux_number, level in sorted(self._switches[at].items()):
+                aux = auxes[aux_number]
+                program.append(aux.output_on() if level else aux.output_off())
+        if self.cycle is not None:
+            program += wait_delay_commands(self.cycle - now - self.command_time * (self._pending(program) + 1))
+
+        if len(program) + 2 > self.capacity:
+            raise ValueError(f"The program needs {len(program) + 2} commands, more than the buffer holds")
+        return program
+
+    def program(self):
+        """
+        Build the whole program to send, starting with the initiate buffer command and ending with the buffer start
+        or buffer loop start command
+
+        :returns: list of commands
+        :rtype: list
+        """
+        buffer = PTHat(test_mode=True)
+        start = buffer.start_buffer() if self.cycle is None else buffer.start_buffer_loop()
+        return [buffer.initiate_buffer()] + self.compile() + [start]
+
+    def send(self, pthat):
+        """
+        Write the whole program in one write
+
+        :param pthat: PTHat, Axis, ADC, AUX or PWM object whose serial port is used
+        :returns: list of the commands written
+        :rtype: list
+        """
+        commands = self.program()
+        pthat.serial.write("".join(commands).encode("ascii"))
+        return commands
+
+    def _switch(self, at, aux_number, level):
+        """
+        Add an output switch, where switching an output on and off at the same time leaves it as it was
+        """
+        switches = self._switches.setdefault(at, {})
+        if switches.get(aux_number, level) != level:
+            del switches[aux_number]
+            if not switches:
+                del self._switches[at]
+        else:
+            switches[aux_number] = level
+
+    def _pending(self, program):
+        """
+        Number of commands since the last wait, whose run time is taken off the next wait along with that of the wait
+        """
+        count = 0
+        for command in reversed(program):
+            if command[3] == "W":
+                break
+            count += 1
+        return count
@@ -0,0 +1,386 @@
+"""
+Pulse Train Hat Session Recording
+=================================
+
+.. module:: pthat.session
+   :platform: Mac, Linux, Windows
+   :synopsis: Record the serial traffic of a session and replay it without the PTHat.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'Session', :class:'SessionRecorder', :class:'RecordingSerial' and :class:'ReplaySerial'
+classes.
+
+A :class:'RecordingSerial' wraps the serial port of a :class:'pthat.pthat.PTHat' object. Every command written by
+send_command and every reply read by get_response is passed to a :class:'SessionRecorder' with a monotonic timestamp in
+nanoseconds and saved to a session file.
+
+A :class:'ReplaySerial' is a serial like object that plays the replies of a session back. A reply is only handed out
+once the commands that were sent before it in the recording have been written, either at the original timing or as
+fast as possible. Passing it as the serial_port of the PTHat classes runs the host side of a job again without the
+hardware, so it can be profiled or used in regression tests.
+
+**Session file**
+
+One event per line after a # comment header line. Each line is the timestamp in nanoseconds, > for data written to
+the PTHat or < for a reply read from it, and the data itself. A backslash in the data is written as two backslashes and
+any byte that is not printable ASCII, such as a line end, as a \\xNN escape, so the data loads back exactly as it was
+recorded.
+
+.. code-block:: text
+
+   # pthat session 1
+   1200340011 > I01CX001000.000000000100011110001001*
+   1200398544 < RI01CX*
+   1200462730 < CI01CX*
+
+.. code-block:: python
+
+   from pthat.pthat import Axis
+   from pthat.session import ReplaySerial, SessionRecorder
+
+   # Record
+   xaxis = Axis("X", command_id=1, serial_device="/dev/ttyS0")
+   with SessionRecorder("job.session") as recorder:
+       recorder.attach(xaxis)
+       ...
+
+   # Replay
+   replay = ReplaySerial("job.session", realtime=False)
+   xaxis = Axis("X", command_id=1, serial_port=replay)
+   ...
+   print(replay.mismatches)
+"""
+from pthat.clock import get_clock
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+SESSION_HEADER = "# pthat session 1"
+SENT = ">"
+"""
+Direction of an event written to the PTHat
+"""
+RECEIVED = "<"
+"""
+Direction of an event read from the PTHat
+"""
+
+
+def _escape(data):
+    """
+    The data of an event as printable ASCII with a backslash escape for every other byte
+    """
+    return "".join("\\\\" if b == 0x5c else chr(b) if 0x20 <= b < 0x7f else f"\\x{b:02x}" for b in data)
+
+
+class Session:
+    """
+    .. class:: Session
+
+    A list of (ns, direction, data) events, where direction is :data:'SENT' or :data:'RECEIVED' and data is bytes.
+
+    :param events: list of events - default empty
+    """
+    def __init__(self, events=None):
+        """
+        Constructor
+        """
+        self.events = [] if events is None else events
+
+    def __len__(self):
+        return len(self.events)
+
+    def commands(self):
+        """
+        :returns: the data of every sent event
+        :rtype: list
+        """
+        return [data for ns, direction, data in self.events if direction == SENT]
+
+    def replies(self):
+        """
+        :returns: the data of every received event
+        :rtype: list
+        """
+        return [data for ns, direction, data in self.events if direction == RECEIVED]
+
+    def save(self, path):
+        """
+        Save the session to a file
+
+        :param path: path of the session file
+        """
+        with open(path, "w", encoding="ascii") as f:
+            f.write(SESSION_HEADER + "\n")
+            for ns, direction, data in self.events:
+                f.write(f"{ns} {direction} {_escape(data)}\n")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a session from a file
+
+        :param path: path of the session file
+        :returns: the session
+        :rtype: Session
+        """
+        events = []
+        with open(path, "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("#") or not line.strip():
+                    continue
+                ns, direction, data = line.rstrip("\n").split(" ", 2)
+                if "\\" in data:
+                    data = data.encode("ascii").decode("unicode_escape")
+                events.append((int(ns), direction, data.encode("latin-1")))
+        return cls(events)
+
+
+class SessionRecorder:
+    """
+    .. class:: SessionRecorder
+
+    Collects the events of a session and saves them to a file when closed.
+
+    :param path: path of the session file to write when closed - default None to only keep the events in memory
+    :param clock: clock used to timestamp events - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, path=None, clock=None):
+        """
+        Constructor
+        """
+        self.path = path
+        self.clock = get_clock() if clock is None else clock
+        self.session = Session()
+        """
+        The recorded session
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, direction, data, ns=None):
+        """
+        Add an event to the session
+
+        :param direction: SENT or RECEIVED
+        :param data: bytes written or read
+        :param ns: timestamp in monotonic nanoseconds - default now
+        """
+        self.session.events.append((self.clock.monotonic_ns() if ns is None else ns, direction, bytes(data)))
+
+    def attach(self, pthat):
+        """
+        Wrap the serial port of a PTHat object so everything it sends and receives is recorded. Several objects that
+        share one serial port can be attached to the same recorder.
+
+        :param pthat: PTHat, Axis, ADC, AUX or PWM object
+        :returns: the recording serial port
+        :rtype: RecordingSerial
+        """
+        if not isinstance(pthat.serial, RecordingSerial):
+            pthat.serial = RecordingSerial(pthat.serial, self)
+        return pthat.serial
+
+    def close(self):
+        """
+        Save the session if a path was given
+        """
+        if self.path is not None:
+            self.session.save(self.path)
+
+
+class RecordingSerial:
+    """
+    .. class:: RecordingSerial
+
+    Serial like object that passes everything to another serial port and records it.
+
+    :param serial_port: the serial port to wrap
+    :param recorder: the session recorder
+    """
+    def __init__(self, serial_port, recorder):
+        """
+        Constructor
+        """
+        self.serial_port = serial_port
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.serial_port, name)
+
+    def write(self, data):
+        """
+        Record and write data to the serial port
+
+        :param data: bytes to write
+        :returns: number of bytes written
+        :rtype: int
+        """
+        self.recorder.record(SENT, data)
+        return self.serial_port.write(data)
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Read from the serial port and record what was read
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        data = self.serial_port.read_until(expected, size)
+        if data:
+            self.recorder.record(RECEIVED, data)
+        return data
+
+
+class ReplaySerial:
+    """
+    .. class:: ReplaySerial
+
+    Serial like object that plays back the replies of a recorded session.
+
+    Each reply is held back until as many commands have been written as had been sent before it in the recording.
+    In realtime mode the reply is then also held back until the same time has passed since that command as in the
+    recording, divided by speed. Otherwise it is handed out straight away.
+
+    :param session: a Session or the path of a session file
+    :param realtime: if true replay with the recorded timing, otherwise as fast as possible - default True
+    :param speed: realtime speed up factor, 2.0 replays twice as fast as recorded - default 1.0
+    :param clock: clock used to time the replies - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, session, realtime=True, speed=1.0, clock=None):
+        """
+        Constructor
+        """
+        if not isinstance(session, Session):
+            session = Session.load(session)
+
+        self.session = session
+        self.realtime = realtime
+        self.speed = speed
+        self.clock = get_clock() if clock is None else clock
+        self.is_open = True
+        self.sent = []
+        """
+        Data written to this serial port
+        """
+        self.mismatches = 0
+        """
+        Number of writes that did not match the command recorded at the same position
+        """
+
+        self._commands = session.commands()
+        self._replies = []  # (gate, offset_ns, data) - gate is the number of commands sent before the reply
+        sent = 0
+        last_sent_ns = session.events[0][0] if session.events else 0
+        for ns, direction, data in session.events:
+            if direction == SENT:
+                sent += 1
+                last_sent_ns = ns
+            else:
+                self._replies.append((sent, ns - last_sent_ns, data))
+        self._next_reply = 0
+        self._pending = b""
+        # when each command was written, index 0 is the start of the replay
+        self._anchors = [self.clock.monotonic_ns()]
+
+    @property
+    def in_waiting(self):
+        """
+        Number of bytes that can be read without waiting
+        """
+        count = len(self._pending)
+        now = self.clock.monotonic_ns()
+        for gate, offset_ns, data in self._replies[self._next_reply:]:
+            if not self._due(gate, offset_ns, now):
+                break
+            count += len(data)
+        return count
+
+    def write(self, data):
+        """
+        Take data written by the host and release the replies that followed it in the recording
+
+        :param data: bytes to write
+        :returns: number of bytes written
+        :rtype: int
+        """
+        data = bytes(data)
+        index = len(self.sent)
+        self.sent.append(data)
+        if index >= len(self._commands) or self._commands[index] != data:
+            self.mismatches += 1
+        self._anchors.append(self.clock.monotonic_ns())
+        return len(data)
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Read the next reply up to and including expected. An empty bytes object is returned when the next reply has
+        not been released by a write yet, as the PTHat would have been silent at that point.
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read
+        :rtype: bytes
+        """
+        while True:
+            end = self._pending.find(expected)
+            if end >= 0:
+                end += len(expected)
+                if size is not None:
+                    end = min(end, size)
+                data, self._pending = self._pending[:end], self._pending[end:]
+                return data
+            if size is not None and len(self._pending) >= size:
+                data, self._pending = self._pending[:size], self._pending[size:]
+                return data
+
+            if self._next_reply >= len(self._replies):
+                break
+            gate, offset_ns, data = self._replies[self._next_reply]
+            if gate >= len(self._anchors):
+                break
+            if self.realtime:
+                wait_ns = self._anchors[gate] + offset_ns / self.speed - self.clock.monotonic_ns()
+                if wait_ns > 0:
+                    self.clock.sleep(wait_ns / 1e9)
+            self._pending += data
+            self._next_reply += 1
+
+        data, self._pending = self._pending, b""
+        return data
+
+    def flush(self):
+        """
+        Nothing is buffered on the way out so there is nothing to flush
+        """
+
+    def reset_input_buffer(self):
+        """
+        Drop the part of a reply that has been released but not read yet
+        """
+        self._pending = b""
+
+    def reset_output_buffer(self):
+        """
+        Nothing is buffered on the way out so there is nothing to reset
+        """
+
+    def close(self):
+        """
+        Close the serial port
+        """
+        self.is_open = False
+
+    def _due(self, gate, offset_ns, now):
+        """
+        Check if a reply can be handed out now
+        """
+        if gate >= len(self._anchors):
+            return False
+        return not self.realtime or self._anchors[gate] + offset_ns / self.speed <= now
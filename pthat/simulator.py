@@ -0,0 +1,656 @@
+"""
+Pulse Train Hat Simulator
+=========================
+
+.. module:: pthat.simulator
+   :platform: Mac, Linux, Windows
+   :synopsis: Serial port that behaves like a PTHat for testing without the hardware.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'MotionProfile' and :class:'SimulatedSerial' classes.
+
+A :class:'SimulatedSerial' is a serial like object that takes the commands built by the :class:'pthat.pthat.PTHat'
+classes and sends back the replies the PTHat would. It models the time to send each command at the baud rate, the
+start and finish ramps, the pulse count of each axis while it runs, the auto count pulse out replies, wait delays and
+buffered commands including the buffer loop.
+
+All timing comes from a clock. With a :class:'pthat.clock.VirtualClock' reads that have to wait for a reply move the
+clock on instantly, so long motion programs run in a fraction of the time.
+
+.. code-block:: python
+
+   from pthat.clock import VirtualClock
+   from pthat.pthat import Axis
+   from pthat.simulator import SimulatedSerial
+
+   clock = VirtualClock()
+   xaxis = Axis("X", command_id=1, serial_port=SimulatedSerial(clock=clock))
+   xaxis.auto_send_command = True
+   xaxis.set_axis(frequency=1000.0, pulse_count=3600000, start_ramp=1, finish_ramp=1, ramp_divide=100,
+                  ramp_pause=10)
+   xaxis.start()
+   while "CI01SX*" not in xaxis.get_all_responses():
+       pass
+   print(f"Motion took {clock.monotonic_ns() / 1e9} seconds")
+"""
+import heapq
+import itertools
+import threading
+
+from pthat.clock import VirtualClock, get_clock
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+RAMP_TICK_S = 0.001
+"""
+Length in seconds of one ramp increment with a ramp pause of 0. Each increment lasts (ramp pause + 1) ticks. This is a
+model of the firmware ramp, adjust it to match measurements from a real PTHat.
+"""
+
+
+class MotionProfile:
+    """
+    .. class:: MotionProfile
+
+    Model of the pulse train of one axis from start to finish.
+
+    The start ramp goes up in ramp_divide increments of frequency / ramp_divide, each lasting (ramp_pause + 1) *
+    :data:'RAMP_TICK_S' seconds, and the finish ramp comes down the same way. If the pulse count is too small for both
+    ramps they are shortened and there is no time at full frequency. A pulse count of 0 runs until stopped and so
+    does a frequency of 0, without sending any pulses.
+
+    :param frequency: frequency in Hz
+    :param pulse_count: number of pulses, 0 to run until stopped
+    :param start_ramp: start ramp, 0 or 1 - default 0
+    :param finish_ramp: finish ramp, 0 or 1 - default 0
+    :param ramp_divide: ramp divide 0-255 - default 0
+    :param ramp_pause: ramp pause 0-255 - default 0
+    """
+    def __init__(self, frequency, pulse_count, start_ramp=0, finish_ramp=0, ramp_divide=0, ramp_pause=0):
+        """
+        Constructor
+        """
+        self.frequency = frequency
+        self.pulse_count = pulse_count
+        self.segments = []
+        """
+        List of (duration ns, frequency) segments. The last duration is None when running until stopped.
+        """
+
+        if frequency <= 0:
+            self.duration_ns = None     # a stopped pulse train never reaches its pulse count
+            return
+
+        step_ns = int((ramp_pause + 1) * RAMP_TICK_S * 1e9)
+        levels = [frequency * k / ramp_divide for k in range(1, ramp_divide)] if ramp_divide > 1 else []
+        up = [(step_ns, f) for f in levels] if start_ramp else []
+        down = [(step_ns, f) for f in reversed(levels)] if finish_ramp and pulse_count else []
+
+        if pulse_count == 0:
+            self.segments = up + [(None, frequency)]
+            self.duration_ns = None
+            return
+
+        ramp_pulses = sum(d * f for d, f in up + down) / 1e9
+        if ramp_pulses >= pulse_count:
+            scale = pulse_count / ramp_pulses
+            self.segments = [(int(d * scale), f) for d, f in up + down]
+        else:
+            cruise_ns = int((pulse_count - ramp_pulses) / frequency * 1e9)
+            self.segments = up + [(cruise_ns, frequency)] + down
+        self.duration_ns = sum(d for d, f in self.segments)
+
+    def pulses_at(self, elapsed_ns):
+        """
+        Get the number of pulses sent a time after the start
+
+        :param elapsed_ns: nanoseconds since the start
+        :returns: pulse count
+        :rtype: int
+        """
+        pulses = 0.0
+        for duration, frequency in self.segments:
+            if duration is None or elapsed_ns < duration:
+                pulses += frequency * elapsed_ns / 1e9
+                break
+            pulses += frequency * duration / 1e9
+            elapsed_ns -= duration
+        pulses = int(pulses + 1e-6)
+        return pulses if self.duration_ns is None else min(pulses, self.pulse_count)
+
+    def time_for_pulses(self, pulses):
+        """
+        Get the time after the start at which a pulse count is reached
+
+        :param pulses: pulse count
+        :returns: nanoseconds since the start or None if the pulse count is never reached
+        :rtype: int
+        """
+        if self.duration_ns is not None and pulses > self.pulse_count:
+            return None
+
+        elapsed = 0
+        for duration, frequency in self.segments:
+            segment_pulses = None if duration is None else frequency * duration / 1e9
+            if segment_pulses is None or pulses <= segment_pulses:
+                return elapsed + int(pulses / frequency * 1e9)
+            pulses -= segment_pulses
+            elapsed += duration
+        return self.duration_ns
+
+
+class _SimulatedAxis:
+    """
+    State of one simulated axis
+    """
+    def __init__(self):
+        self.frequency = 0.0
+        self.pulse_count = 0
+        self.direction = 0
+        self.start_ramp = 0
+        self.finish_ramp = 0
+        self.ramp_divide = 0
+        self.ramp_pause = 0
+        self.auto_count = 0         # send pulse counts back every this many pulses, 0 = off
+        self.auto_count_axes = ""   # axes to send back pulse counts for
+        self.auto_count_id = ""
+        self.target_pulses = 0      # pulse count of the current move, 0 = run until stopped
+        self.running = False
+        self.paused = False
+        self.start_id = ""          # type and ID of the start command, used in the completed reply
+        self.base_pulses = 0        # pulses sent before the current profile started
+        self.profile = None
+        self.profile_start_ns = 0
+        self.generation = 0         # bumped whenever scheduled events for this axis become stale
+
+    def pulses(self, now):
+        if self.running and not self.paused and self.profile is not None:
+            return self.base_pulses + self.profile.pulses_at(now - self.profile_start_ns)
+        return self.base_pulses
+
+
+class SimulatedSerial:
+    """
+    .. class:: SimulatedSerial
+
+    Serial like object that behaves like a PTHat.
+
+    :param clock: clock used for all timing - default the clock from :func:'pthat.clock.get_clock'
+    :param baud_rate: baud rate used to work out how long each command takes to send - default 115200
+    :param timeout: read timeout in seconds, None to wait until a reply is due - default 2
+    :param firmware: firmware version sent back for the FW command - default 5.3
+    """
+    command_ns = 1000
+    """
+    Nanoseconds the simulated firmware takes to process each command. This can be set directly.
+    """
+
+    def __init__(self, clock=None, baud_rate=115200, timeout=2, firmware="5.3"):
+        """
+        Constructor
+        """
+        self.clock = get_clock() if clock is None else clock
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.firmware = firmware
+        self.is_open = True
+        self.axes = {axis: _SimulatedAxis() for axis in "XYZE"}
+        """
+        Simulated axes by letter
+        """
+        self.adc_values = {1: 0, 2: 0}
+        """
+        Value returned for each ADC. A value can be a function taking the monotonic time in nanoseconds.
+        """
+        self.inputs = 0
+        """
+        IO port inputs returned for the LI command, bit 4 = ES down to bit 0 = E limit input
+        """
+        self.aux = {1: 0, 2: 0, 3: 0}
+        """
+        State of the AUX outputs
+        """
+        self.pwm = {"X": (0, 0), "Y": (0, 0)}
+        """
+        (frequency, duty cycle) of the PWM channels
+        """
+        self.log = []
+        """
+        (ns, command) for every command executed
+        """
+        self.received_replies = True
+        self.completed_replies = True
+
+        self._lock = threading.RLock()
+        self._arrived = threading.Condition(self._lock)
+        self._events = []
+        self._sequence = itertools.count()
+        self._input = b""
+        self._output = bytearray()
+        self._wire_free_ns = 0
+        self._buffer = []
+        self._buffer_running = False
+        self._buffer_loop = False
+        self._buffer_generation = 0
+
+    @property
+    def in_waiting(self):
+        """
+        Number of reply bytes that can be read without waiting
+        """
+        with self._lock:
+            self._poll()
+            return len(self._output)
+
+    @property
+    def out_waiting(self):
+        """
+        Number of bytes waiting to be sent, always 0
+        """
+        return 0
+
+    def pulse_count(self, axis):
+        """
+        Get the current pulse count of an axis
+
+        :param axis: X, Y, Z or E
+        :returns: pulse count
+        :rtype: int
+        """
+        with self._lock:
+            self._poll()
+            return self.axes[axis].pulses(self.clock.monotonic_ns())
+
+    def write(self, data):
+        """
+        Receive commands from the host
+
+        :param data: bytes to write
+        :returns: number of bytes written
+        :rtype: int
+        """
+        with self._lock:
+            now = self.clock.monotonic_ns()
+            self._poll()
+            self._input += bytes(data)
+            while True:
+                end = self._input.find(b"*")
+                if end < 0:
+                    break
+                frame, self._input = self._input[:end + 1], self._input[end + 1:]
+                start = max(now, self._wire_free_ns)
+                self._wire_free_ns = start + int(len(frame) * 10 * 1e9 / self.baud_rate)
+                self._receive(frame[:-1].decode("ascii", "replace"), self._wire_free_ns)
+            self._arrived.notify_all()
+        return len(data)
+
+    def read_until(self, expected=b"\n", size=None):
+        """
+        Read replies up to and including expected. Waits on the clock for the next reply until the read timeout.
+
+        :param expected: bytes to read up to
+        :param size: maximum number of bytes to read
+        :returns: bytes read, empty if the timeout passed first
+        :rtype: bytes
+        """
+        deadline = None if self.timeout is None else self.clock.monotonic_ns() + int(self.timeout * 1e9)
+        with self._lock:
+            while True:
+                self._poll()
+                end = self._output.find(expected)
+                if end >= 0 or (size is not None and len(self._output) >= size):
+                    end = len(self._output) if end < 0 else end + len(expected)
+                    if size is not None:
+                        end = min(end, size)
+                    data = bytes(self._output[:end])
+                    del self._output[:end]
+                    return data
+
+                now = self.clock.monotonic_ns()
+                due = self._events[0][0] if self._events else None
+                if due is not None and (deadline is None or due <= deadline):
+                    wait_until = due
+                elif deadline is not None and now < deadline:
+                    wait_until = deadline
+                else:
+                    # Nothing else can arrive before the timeout
+                    data = bytes(self._output)
+                    self._output.clear()
+                    return data
+
+                if isinstance(self.clock, VirtualClock):
+                    self.clock.advance_to(wait_until)
+                else:
+                    # Wake up early if another thread writes a command
+                    self._arrived.wait((wait_until - now) / 1e9)
+
+    def read(self, size=1):
+        """
+        Read up to size bytes of replies that are due
+
+        :param size: number of bytes
+        :returns: bytes read
+        :rtype: bytes
+        """
+        with self._lock:
+            self._poll()
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            return data
+
+    def flush(self):
+        """
+        Nothing is buffered on the way out so there is nothing to flush
+        """
+
+    def reset_input_buffer(self):
+        """
+        Drop replies that have not been read
+        """
+        with self._lock:
+            self._poll()
+            self._output.clear()
+
+    def reset_output_buffer(self):
+        """
+        Drop part of a command that has been written without its end character
+        """
+        with self._lock:
+            self._input = b""
+
+    def close(self):
+        """
+        Close the serial port
+        """
+        self.is_open = False
+
+    def _schedule(self, due_ns, action, axis=None):
+        """
+        Schedule a reply or a function to run at a time. Events for an axis are dropped if the axis generation has
+        changed by the time they are due.
+        """
+        generation = self._buffer_generation if axis == "buffer" else \
+            (self.axes[axis].generation if axis is not None else 0)
+        heapq.heappush(self._events, (due_ns, next(self._sequence), action, axis, generation))
+
+    def _poll(self):
+        """
+        Run all events that are due
+        """
+        now = self.clock.monotonic_ns()
+        while self._events and self._events[0][0] <= now:
+            due, sequence, action, axis, generation = heapq.heappop(self._events)
+            if axis == "buffer":
+                if generation != self._buffer_generation:
+                    continue
+            elif axis is not None and generation != self.axes[axis].generation:
+                continue
+            if isinstance(action, bytes):
+                self._output += action
+            else:
+                action(due)
+
+    def _reply(self, at_ns, reply, axis=None):
+        """
+        Schedule a reply, respecting the received and completed replies settings
+        """
+        if reply[0] == "R" and not self.received_replies:
+            return
+        if reply[0] == "C" and not self.completed_replies:
+            return
+        self._schedule(at_ns, f"{reply}*".encode("ascii"), axis)
+
+    def _receive(self, frame, at_ns):
+        """
+        Handle a command once it has arrived at the PTHat
+        """
+        if frame == "N":
+            self._reset()
+            return
+        if frame in ("H0000", "Z0000", "W0000"):
+            self._schedule(at_ns, f"RB{frame[0]}000*".encode("ascii"))
+            if frame[0] == "H":
+                self._buffer = []
+                self._stop_buffer()
+            elif self._buffer:
+                self._buffer_running = True
+                self._buffer_loop = frame[0] == "W"
+                self._schedule(at_ns, self._buffer_step(0), "buffer")
+            return
+
+        if len(frame) < 5:
+            return
+        self._reply(at_ns, f"R{frame[:3]}{frame[3:5]}")
+        if frame[0] == "B" and frame[3] != "T":
+            self._buffer.append(frame)
+            return
+        self._execute(frame, at_ns)
+
+    def _buffer_step(self, index):
+        """
+        Make the function that runs one buffered command and schedules the next
+        """
+        def step(at_ns):
+            block_ns = self._execute(self._buffer[index], at_ns) + self.command_ns
+            following = index + 1
+            if following == len(self._buffer):
+                if not self._buffer_loop:
+                    self._buffer_running = False
+                    return
+                following = 0
+            self._schedule(at_ns + block_ns, self._buffer_step(following), "buffer")
+        return step
+
+    def _stop_buffer(self):
+        self._buffer_running = False
+        self._buffer_generation += 1
+
+    def _reset(self):
+        """
+        Reset everything back to the power on state
+        """
+        for axis in self.axes.values():
+            axis.generation += 1
+        self.axes = {axis: _SimulatedAxis() for axis in "XYZE"}
+        self.aux = {1: 0, 2: 0, 3: 0}
+        self.pwm = {"X": (0, 0), "Y": (0, 0)}
+        self.received_replies = True
+        self.completed_replies = True
+        self._buffer = []
+        self._stop_buffer()
+        self._events = [e for e in self._events if isinstance(e[2], bytes) and e[3] is None]
+        heapq.heapify(self._events)
+
+    def _execute(self, frame, at_ns):
+        """
+        Run a command at a time
+
+        :returns: nanoseconds the command blocks the buffer for
+        """
+        self.log.append((at_ns, frame))
+        ident, code, body = frame[:3], frame[3:5], frame[5:]
+        completed = f"C{ident}{code}"
+        command = code[0]
+
+        if code in ("WW", "WM"):
+            delay_ns = int(body or 0) * (1000000 if code == "WW" else 1000)
+            self._reply(at_ns + delay_ns, completed)
+            return delay_ns
+
+        if command == "C" and code[1] in self.axes:
+            axis = self.axes[code[1]]
+            axis.frequency = float(body[0:10])
+            axis.pulse_count = int(body[10:20])
+            axis.direction = int(body[20])
+            axis.start_ramp = int(body[21])
+            axis.finish_ramp = int(body[22])
+            axis.ramp_divide = int(body[23:26])
+            axis.ramp_pause = int(body[26:29])
+        elif command == "J" and code[1] in self.axes:
+            axis = self.axes[code[1]]
+            axis.auto_count = int(body[0:10])
+            axis.auto_count_axes = "".join(a for a, flag in zip("XYZE", body[10:14]) if flag == "1")
+            axis.auto_count_id = ident
+        elif command == "S":
+            letters = [a for a in "XYZE" if self.axes[a].frequency > 0] if code[1] == "A" else [code[1]]
+            for letter in letters:
+                self._start(letter, ident, at_ns)
+            return 0
+        elif command == "T":
+            letters = "XYZE" if code[1] == "A" else code[1]
+            for letter in letters:
+                if self.axes[letter].running:
+                    self._finish(letter, at_ns)
+                    # The stop completed reply carries the type and ID of the start command, not of the stop
+                    self._reply(at_ns, f"C{self.axes[letter].start_id}T{letter}")
+            if code[1] == "A" or frame[0] == "B":
+                self._stop_buffer()
+            return 0
+        elif command == "P" and code[1] in "XYZEA":
+            self._pause_resume(ident, code[1], body, at_ns)
+            return 0
+        elif code[1] == "P" and code[0] in self.axes:
+            axis = self.axes[code[0]]
+            self._reply(at_ns, f"{code[0]}P{axis.direction}{axis.pulses(at_ns):010}")
+        elif command == "Q" and code[1] in self.axes:
+            self._change_speed(code[1], float(body), at_ns)
+        elif code in ("D1", "D2"):
+            value = self.adc_values[int(code[1])]
+            value = value(at_ns) if callable(value) else value
+            self._reply(at_ns, f"D{code[1]}{int(value):04}")
+        elif code == "LI":
+            self._reply(at_ns, f"L{self.inputs:05b}")
+        elif code == "FW":
+            self._reply(at_ns, self.firmware)
+        elif command == "A":
+            self.aux[int(code[1])] = int(body[0:1] or 0)
+        elif command == "U":
+            if code[1] == "A":
+                self.pwm["X"] = (int(body[0:7]), int(body[7:12]))
+                self.pwm["Y"] = (int(body[12:19]), int(body[19:24]))
+            else:
+                self.pwm[code[1]] = (int(body[0:7]), int(body[7:12]))
+        elif command == "R":
+            self.received_replies = code[1] == "1"
+        elif command == "G":
+            self.completed_replies = code[1] == "1"
+
+        self._reply(at_ns, completed)
+        return 0
+
+    def _start(self, letter, ident, at_ns):
+        """
+        Start the pulse train of an axis
+        """
+        axis = self.axes[letter]
+        if axis.running:
+            return
+        axis.running = True
+        axis.paused = False
+        axis.start_id = ident
+        axis.base_pulses = 0
+        axis.target_pulses = axis.pulse_count
+        self._run_profile(letter, MotionProfile(axis.frequency, axis.pulse_count, axis.start_ramp, axis.finish_ramp,
+                                                axis.ramp_divide, axis.ramp_pause), at_ns)
+
+    def _run_profile(self, letter, profile, at_ns):
+        """
+        Run a motion profile on an axis from a time and schedule its completion and auto count replies
+        """
+        axis = self.axes[letter]
+        axis.generation += 1
+        axis.profile = profile
+        axis.profile_start_ns = at_ns
+        if profile.duration_ns is not None:
+            self._schedule(at_ns + profile.duration_ns, lambda due: self._finish(letter, due), letter)
+        self._schedule_auto_count(letter, at_ns)
+
+    def _schedule_auto_count(self, letter, now):
+        """
+        Schedule the next auto count pulse out replies of an axis
+        """
+        axis = self.axes[letter]
+        if axis.auto_count <= 0 or not axis.running or axis.paused:
+            return
+        target = (axis.pulses(now) // axis.auto_count + 1) * axis.auto_count
+        if axis.target_pulses and target >= axis.target_pulses:
+            return      # the last one is sent when the axis finishes
+        elapsed = axis.profile.time_for_pulses(target - axis.base_pulses)
+        if elapsed is None:
+            return
+
+        def send(due):
+            self._send_auto_count(letter, target, due)
+            self._schedule_auto_count(letter, due)
+        self._schedule(max(now, axis.profile_start_ns + elapsed), send, letter)
+
+    def _send_auto_count(self, letter, pulses, at_ns):
+        """
+        Send the auto count pulse out replies of an axis
+        """
+        axis = self.axes[letter]
+        self._reply(at_ns, f"D{axis.auto_count_id}J{letter}")
+        for other in axis.auto_count_axes:
+            count = pulses if other == letter else self.axes[other].pulses(at_ns)
+            self._reply(at_ns, f"{other}P{self.axes[other].direction}{count:010}")
+
+    def _finish(self, letter, at_ns):
+        """
+        Finish the pulse train of an axis and send the start completed reply
+        """
+        axis = self.axes[letter]
+        axis.base_pulses = axis.pulses(at_ns)
+        if axis.auto_count > 0 and axis.base_pulses > 0 and axis.base_pulses % axis.auto_count == 0:
+            self._send_auto_count(letter, axis.base_pulses, at_ns)
+        axis.running = False
+        axis.paused = False
+        axis.profile = None
+        axis.generation += 1
+        self._reply(at_ns, f"C{axis.start_id}S{letter}")
+
+    def _pause_resume(self, ident, letter, body, at_ns):
+        """
+        Pause a running axis or resume a paused one
+        """
+        letters = [a for a in "XYZE" if self.axes[a].running] if letter == "A" else [letter]
+        for name in letters:
+            axis = self.axes[name]
+            if not axis.running:
+                continue
+            if not axis.paused:
+                axis.base_pulses = axis.pulses(at_ns)
+                axis.generation += 1
+                axis.paused = True
+                self._reply(at_ns, f"D{ident}P{name}")
+                for other, flag in zip("XYZE", body[0:4]):
+                    if flag == "1":
+                        other_axis = self.axes[other]
+                        self._reply(at_ns, f"{other}P{other_axis.direction}{other_axis.pulses(at_ns):010}")
+            else:
+                axis.paused = False
+                self._reply(at_ns, f"C{ident}P{name}")
+                self._run_remaining(name, at_ns)
+
+    def _change_speed(self, letter, frequency, at_ns):
+        """
+        Change the frequency of a running axis without a ramp
+        """
+        axis = self.axes[letter]
+        axis.frequency = frequency
+        if not axis.running or axis.paused:
+            return
+        axis.base_pulses = axis.pulses(at_ns)
+        self._run_remaining(letter, at_ns)
+
+    def _run_remaining(self, letter, at_ns):
+        """
+        Carry on with the rest of the current move at the axis frequency without a ramp
+        """
+        axis = self.axes[letter]
+        if axis.target_pulses == 0:
+            self._run_profile(letter, MotionProfile(axis.frequency, 0), at_ns)
+        elif axis.base_pulses >= axis.target_pulses:
+            self._finish(letter, at_ns)
+        else:
+            self._run_profile(letter, MotionProfile(axis.frequency, axis.target_pulses - axis.base_pulses), at_ns)
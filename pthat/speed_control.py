@@ -0,0 +1,309 @@
+"""
+Pulse Train Hat Speed Control
+=============================
+
+.. module:: pthat.speed_control
+   :platform: Mac, Linux, Windows
+   :synopsis: Closed loop control of the speed of an axis from an ADC reading.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'ADCSpeedControl' class and the :class:'LookupTable', :class:'PID' and
+:class:'LowPassFilter' classes used to build its transfer function.
+
+The link to ADC setting of the set axis command maps the ADC to the speed in the firmware, with a mapping that can not
+be changed. An :class:'ADCSpeedControl' does the mapping on the host instead. It polls the ADC at a fixed rate, passes
+each reading through an optional :class:'LowPassFilter' and then through a transfer function, such as a
+:class:'LookupTable' curve or a :class:'PID' controller, and sends a change speed command when the new speed differs
+from the last one sent by more than the deadband.
+
+The loop measures its own jitter, the time between when a poll was due and when it started, and the latency from
+requesting an ADC reading until the change speed command was written.
+
+.. code-block:: python
+
+   from pthat.pthat import ADC, Axis
+   from pthat.speed_control import ADCSpeedControl, LookupTable, LowPassFilter
+
+   xaxis = Axis("X", serial_device="/dev/ttyS0")
+   xaxis.auto_send_command = True
+   adc = ADC(1, serial_port=xaxis.serial)
+   adc.auto_send_command = True
+
+   curve = LookupTable([(0, 0.0), (200, 0.0), (800, 20000.0), (1023, 25000.0)])
+   control = ADCSpeedControl(adc, xaxis, curve, rate=50.0, deadband=50.0, low_pass=LowPassFilter(0.1))
+   control.run(duration=60)
+   print(control.jitter, control.latency)
+"""
+import bisect
+import math
+
+from pthat.clock import get_clock
+from pthat.gearing import MAX_CHANGE_SPEED_FREQUENCY, MIN_CHANGE_SPEED_FREQUENCY
+from pthat.stats import RunningStats
+from pthat.telemetry import parse_adc_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+class LookupTable:
+    """
+    .. class:: LookupTable
+
+    Transfer function made of points joined by straight lines. Inputs outside the points give the output of the
+    nearest point.
+
+    :param points: sequence of (input, output) pairs
+    """
+    def __init__(self, points):
+        """
+        Constructor
+        """
+        if not points:
+            raise ValueError("A lookup table needs at least one point")
+
+        points = sorted(points)
+        self.inputs = [float(x) for x, y in points]
+        self.outputs = [float(y) for x, y in points]
+
+    def __call__(self, value, seconds=None):
+        """
+        :param value: input value
+        :param seconds: not used, so a lookup table can be used wherever a :class:'PID' can
+        :returns: output for the input
+        :rtype: float
+        """
+        index = bisect.bisect_right(self.inputs, value)
+        if index == 0:
+            return self.outputs[0]
+        if index == len(self.inputs):
+            return self.outputs[-1]
+        x0, x1 = self.inputs[index - 1], self.inputs[index]
+        y0, y1 = self.outputs[index - 1], self.outputs[index]
+        return y0 + (y1 - y0) * (value - x0) / (x1 - x0)
+
+
+class PID:
+    """
+    .. class:: PID
+
+    PID controller transfer function. The output is the frequency that drives the input to the setpoint.
+
+    :param setpoint: input value to hold
+    :param kp: proportional gain - default 1.0
+    :param ki: integral gain - default 0.0
+    :param kd: derivative gain - default 0.0
+    :param bias: output when the error is 0 - default 0.0
+    :param output_min: lowest output, the integral stops growing when it is reached - default 0.0
+    :param output_max: highest output, the integral stops growing when it is reached - default 125000.0
+    """
+    def __init__(self, setpoint, kp=1.0, ki=0.0, kd=0.0, bias=0.0, output_min=MIN_CHANGE_SPEED_FREQUENCY,
+                 output_max=MAX_CHANGE_SPEED_FREQUENCY):
+        """
+        Constructor
+        """
+        self.setpoint = setpoint
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.bias = bias
+        self.output_min = output_min
+        self.output_max = output_max
+        self.integral = 0.0
+        self._last_error = None
+
+    def reset(self):
+        """
+        Clear the integral and derivative state
+        """
+        self.integral = 0.0
+        self._last_error = None
+
+    def __call__(self, value, seconds=None):
+        """
+        :param value: input value
+        :param seconds: seconds since the last input, None or 0 for the first one
+        :returns: output for the input
+        :rtype: float
+        """
+        error = self.setpoint - value
+        derivative = 0.0
+        if seconds:
+            if self._last_error is not None:
+                derivative = (error - self._last_error) / seconds
+            integral = self.integral + error * seconds
+        else:
+            integral = self.integral
+        self._last_error = error
+
+        output = self.bias + self.kp * error + self.ki * integral + self.kd * derivative
+        if self.output_min <= output <= self.output_max:
+            # Only integrate while the output is not saturated so the integral does not wind up
+            self.integral = integral
+        return min(max(output, self.output_min), self.output_max)
+
+
+class LowPassFilter:
+    """
+    .. class:: LowPassFilter
+
+    First order low pass filter for noisy readings.
+
+    :param time_constant: time constant of the filter in seconds
+    """
+    def __init__(self, time_constant):
+        """
+        Constructor
+        """
+        if time_constant <= 0:
+            raise ValueError(f"Invalid time constant {time_constant}. Must be greater than 0")
+
+        self.time_constant = time_constant
+        self.value = None
+        """
+        Filtered value or None before the first input
+        """
+
+    def reset(self):
+        """
+        Forget the filtered value
+        """
+        self.value = None
+
+    def __call__(self, value, seconds=None):
+        """
+        :param value: input value
+        :param seconds: seconds since the last input, None or 0 for the first one
+        :returns: filtered value
+        :rtype: float
+        """
+        if self.value is None:
+            self.value = float(value)
+        elif seconds:
+            self.value += (value - self.value) * (1.0 - math.exp(-seconds / self.time_constant))
+        return self.value
+
+
+class ADCSpeedControl:
+    """
+    .. class:: ADCSpeedControl
+
+    Polls an ADC and changes the speed of an axis from the readings.
+
+    :param adc: the :class:'pthat.pthat.ADC' to read, with auto_send_command on
+    :param axis: the running :class:'pthat.pthat.Axis' to change the speed of, with auto_send_command on
+    :param transfer: function called with the filtered reading and the seconds since the last reading, returning the
+                     new frequency, such as a :class:'LookupTable' or a :class:'PID'
+    :param rate: polls a second - default 20.0
+    :param deadband: smallest change of frequency in Hz that is sent - default 1.0
+    :param low_pass: :class:'LowPassFilter' for the readings - default None for no filter
+    :param on_reply: function called with every reply read that is not the ADC reading - default None to drop them
+    :param clock: clock used for the poll timing - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, adc, axis, transfer, rate=20.0, deadband=1.0, low_pass=None, on_reply=None, clock=None):
+        """
+        Constructor
+        """
+        if rate <= 0:
+            raise ValueError(f"Invalid rate {rate}. Must be greater than 0")
+        if deadband < 0:
+            raise ValueError(f"Invalid deadband {deadband}. Must be 0 or more")
+
+        self.adc = adc
+        self.axis = axis
+        self.transfer = transfer
+        self.rate = rate
+        self.deadband = deadband
+        self.low_pass = low_pass
+        self.on_reply = on_reply
+        self.clock = get_clock() if clock is None else clock
+        self.frequency = None
+        """
+        Frequency last sent to the axis or None before the first one
+        """
+        self.reading = None
+        """
+        Last ADC reading
+        """
+        self.jitter = RunningStats("poll jitter")
+        """
+        Statistics of the time in nanoseconds between when a poll was due and when it started
+        """
+        self.latency = RunningStats("ADC to speed latency")
+        """
+        Statistics of the time in nanoseconds from requesting an ADC reading until the change speed was written
+        """
+        self.polls = 0
+        """
+        Number of ADC readings taken
+        """
+        self.overruns = 0
+        """
+        Number of polls started after the next one was already due
+        """
+        self.commands = 0
+        """
+        Number of change speed commands sent
+        """
+        self._last_ns = None
+
+    def poll(self):
+        """
+        Take one ADC reading and change the speed if needed
+
+        :returns: the change speed command sent or None if the speed was not changed or no reading came back
+        :rtype: str
+        """
+        start = self.clock.perf_counter_ns()
+        self.adc.get_reading()
+        while True:
+            resp = self.adc.get_response()
+            if resp is None:
+                return None
+            parsed = parse_adc_reply(resp)
+            if parsed is not None and parsed[0] == self.adc.adc_number:
+                break
+            if self.on_reply is not None:
+                self.on_reply(resp)
+
+        now = self.clock.monotonic_ns()
+        seconds = None if self._last_ns is None else (now - self._last_ns) / 1e9
+        self._last_ns = now
+        self.polls += 1
+        self.reading = parsed[1]
+        value = self.reading if self.low_pass is None else self.low_pass(self.reading, seconds)
+        frequency = round(min(max(self.transfer(value, seconds), MIN_CHANGE_SPEED_FREQUENCY),
+                              MAX_CHANGE_SPEED_FREQUENCY), 3)
+        if self.frequency is not None and abs(frequency - self.frequency) < self.deadband:
+            return None
+
+        command = self.axis.change_speed(frequency)
+        if not command:
+            return None
+        self.frequency = frequency
+        self.commands += 1
+        self.latency.add(self.clock.perf_counter_ns() - start)
+        return command
+
+    def run(self, duration=None, should_stop=None):
+        """
+        Poll at the fixed rate. A poll that runs past the time the next one was due is counted as an overrun and the
+        polls it missed are skipped rather than run late.
+
+        :param duration: seconds to run for - default None to run until should_stop returns True
+        :param should_stop: function called before every poll, the loop ends when it returns True - default None
+        """
+        period = int(1e9 / self.rate)
+        start = self.clock.monotonic_ns()
+        end = None if duration is None else start + int(duration * 1e9)
+        due = start
+        while (end is None or due < end) and not (should_stop is not None and should_stop()):
+            self.clock.sleep((due - self.clock.monotonic_ns()) / 1e9)
+            now = self.clock.monotonic_ns()
+            self.jitter.add(now - due)
+            self.poll()
+            due += period
+            finished = self.clock.monotonic_ns()
+            if finished > due:
+                self.overruns += 1
+                due += (finished - due) // period * period + period
@@ -0,0 +1,165 @@
+"""
+Pulse Train Hat Speed Streaming
+===============================
+
+.. module:: pthat.speed_stream
+   :platform: Mac, Linux, Windows
+   :synopsis: Send change speed commands at a fixed rate with measured jitter.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'SpeedStream' class.
+
+Jog wheels and feed overrides send change speed commands many times a second. Waiting with time.sleep wakes up late by
+however long the operating system takes to schedule the thread, and building every command through
+:meth:'pthat.pthat.Axis.change_speed' costs more time again, so the update rate wobbles.
+
+A :class:'SpeedStream' keeps a deadline for every tick on the perf_counter_ns clock. It sleeps until shortly before
+the deadline and then spins until the deadline itself, which trades some CPU time for a wake up that is not late. The
+start of the change speed command is encoded once and only the frequency is formatted on each tick.
+
+Each tick the next frequency is taken from a generator, or from a function called with the tick number. None means
+keep the speed as it is and a frequency outside the firmware limits of change speed is not sent. For each tick the
+jitter, how late the command was written, is recorded. A tick that ends after the next deadline is an overrun, and
+when a tick ends after several deadlines the ticks that were missed are dropped rather than run late.
+
+.. code-block:: python
+
+   from pthat.pthat import Axis
+   from pthat.speed_stream import SpeedStream
+
+   xaxis = Axis("X", serial_device="/dev/ttyS0")
+   xaxis.auto_send_command = True
+   xaxis.set_axis(frequency=1000.0, pulse_count=0)
+   xaxis.start()
+
+   stream = SpeedStream(xaxis, rate=100.0)
+   stream.run(lambda tick: 1000.0 + 10.0 * (tick % 100), duration=10)
+   print(stream.jitter, stream.overruns, stream.drops)
+"""
+from pthat.clock import get_clock
+from pthat.gearing import MAX_CHANGE_SPEED_FREQUENCY, MIN_CHANGE_SPEED_FREQUENCY
+from pthat.pthat import Axis
+from pthat.stats import RunningStats
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+class SpeedStream:
+    """
+    .. class:: SpeedStream
+
+    Sends change speed commands to an axis at a fixed rate.
+
+    :param axis: the :class:'pthat.pthat.Axis' to change the speed of. Its serial port, command type and command ID
+                 are used.
+    :param rate: ticks a second - default 100.0
+    :param spin: seconds before each deadline to stop sleeping and spin, 0 to only sleep, which has to be used with a
+                 :class:'pthat.clock.VirtualClock' - default 0.001
+    :param clock: clock used for the deadlines - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, axis, rate=100.0, spin=0.001, clock=None):
+        """
+        Constructor
+        """
+        if rate <= 0:
+            raise ValueError(f"Invalid rate {rate}. Must be greater than 0")
+        if spin < 0:
+            raise ValueError(f"Invalid spin {spin}. Must be 0 or more")
+
+        self.axis = axis
+        self.rate = rate
+        self.spin = spin
+        self.clock = get_clock() if clock is None else clock
+        self.frequency = None
+        """
+        Frequency last sent or None
+        """
+        self.jitter = RunningStats("tick jitter")
+        """
+        Statistics of the time in nanoseconds between each deadline and the command being written
+        """
+        self.ticks = 0
+        """
+        Number of ticks run
+        """
+        self.written = 0
+        """
+        Number of change speed commands written
+        """
+        self.overruns = 0
+        """
+        Number of ticks that ended after the next deadline
+        """
+        self.drops = 0
+        """
+        Number of ticks not run as the ones before them ended too late
+        """
+        self.invalid = 0
+        """
+        Number of frequencies not sent as they were outside the change speed limits
+        """
+        builder = Axis(axis.axis, command_type=axis.command_type, command_id=axis.command_id, test_mode=True)
+        # Everything before the frequency, which is the last 11 characters with the command end
+        self._prefix = builder.change_speed(0.0)[:-11].encode("ascii")
+
+    def encode(self, frequency):
+        """
+        :param frequency: new frequency
+        :returns: the change speed command as bytes
+        :rtype: bytes
+        """
+        return b"%s%010.3f*" % (self._prefix, frequency)
+
+    def run(self, source, duration=None, should_stop=None):
+        """
+        Run the ticks until the duration is up, the source runs out or should_stop returns True
+
+        :param source: iterable of frequencies, such as a generator, or a function called with the tick number that
+                       returns the frequency. None keeps the speed as it is.
+        :param duration: seconds to run for - default None to run until the source runs out or should_stop
+        :param should_stop: function called before every tick, the run ends when it returns True - default None
+        """
+        next_frequency = source if callable(source) else iter(source).__next__
+        passes_tick = callable(source)
+        clock = self.clock
+        period = 1e9 / self.rate
+        spin = int(self.spin * 1e9)
+        serial = self.axis.serial
+        start = clock.perf_counter_ns()
+        end = None if duration is None else start + int(duration * 1e9)
+        tick = 0
+        while not (should_stop is not None and should_stop()):
+            deadline = start + int(tick * period)
+            if end is not None and deadline >= end:
+                break
+
+            remaining = deadline - clock.perf_counter_ns()
+            if remaining > spin:
+                clock.sleep((remaining - spin) / 1e9)
+            now = clock.perf_counter_ns()
+            while now < deadline:
+                now = clock.perf_counter_ns()
+
+            try:
+                frequency = next_frequency(tick) if passes_tick else next_frequency()
+            except StopIteration:
+                break
+            if frequency is not None and frequency != self.frequency:
+                if MIN_CHANGE_SPEED_FREQUENCY <= frequency <= MAX_CHANGE_SPEED_FREQUENCY:
+                    serial.write(self.encode(frequency))
+                    self.jitter.add(clock.perf_counter_ns() - deadline)
+                    self.frequency = frequency
+                    self.written += 1
+                else:
+                    self.invalid += 1
+            self.ticks += 1
+
+            tick += 1
+            finished = clock.perf_counter_ns()
+            next_deadline = start + int(tick * period)
+            if finished > next_deadline:
+                self.overruns += 1
+                missed = int((finished - next_deadline) // period)
+                self.drops += missed
+                tick += missed
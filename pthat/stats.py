@@ -0,0 +1,274 @@
+"""
+Pulse Train Hat Statistics
+==========================
+
+.. module:: pthat.stats
+   :platform: Mac, Linux, Windows
+   :synopsis: Running statistics for latency and timing measurements.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'RunningStats' and :class:'RollingStats' classes.
+
+Timing measurements such as how long a stop command took to reach the wire are added one at a time. The count, mean,
+minimum, maximum and standard deviation are kept up to date as values are added without storing the values, so a
+measurement can be taken on every command for as long as the program runs. :class:'RollingStats' keeps the same
+statistics over only the most recent values, for signals such as ADC readings where the old values no longer matter.
+
+.. code-block:: python
+
+   from pthat.pthat import Axis
+
+   xaxis = Axis("X", command_id=1, serial_device="/dev/ttyS0")
+   ...
+   xaxis.emergency_stop()
+   print(xaxis.priority_latency)
+"""
+import math
+from collections import deque
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+class RunningStats:
+    """
+    .. class:: RunningStats
+
+    Count, mean, minimum, maximum and standard deviation of a series of values, updated as each value is added.
+
+    :param name: name shown when the statistics are printed - default empty
+    :param unit: unit shown when the statistics are printed - default ns
+    """
+    def __init__(self, name="", unit="ns"):
+        """
+        Constructor
+        """
+        self.name = name
+        self.unit = unit
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        if self.count == 0:
+            return f"{self.name} n=0"
+        return f"{self.name} n={self.count} mean={self.mean:.1f}{self.unit} min={self.min}{self.unit} " \
+               f"max={self.max}{self.unit} std={self.stdev:.1f}{self.unit}"
+
+    def add(self, value):
+        """
+        Add a value
+
+        :param value: the measured value
+        """
+        self.count += 1
+        self.last = value
+        self.total += value
+        if self.count == 1:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+        # Welford's method keeps the variance stable without storing the values
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def reset(self):
+        """
+        Remove all values
+        """
+        self.count = 0
+        """
+        Number of values added
+        """
+        self.total = 0
+        """
+        Sum of the values added
+        """
+        self.last = None
+        """
+        The last value added or None
+        """
+        self.min = None
+        """
+        The smallest value added or None
+        """
+        self.max = None
+        """
+        The largest value added or None
+        """
+        self.mean = 0.0
+        """
+        Mean of the values added
+        """
+        self._m2 = 0.0
+
+    @property
+    def variance(self):
+        """
+        Sample variance of the values added, 0.0 when there are less than two
+
+        :rtype: float
+        """
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        """
+        Sample standard deviation of the values added, 0.0 when there are less than two
+
+        :rtype: float
+        """
+        return math.sqrt(self.variance)
+
+    def as_dict(self):
+        """
+        :returns: the statistics as a dict, for logging or reporting
+        :rtype: dict
+        """
+        return {"name": self.name, "unit": self.unit, "count": self.count, "mean": self.mean, "min": self.min,
+                "max": self.max, "stdev": self.stdev, "last": self.last}
+
+
+class RollingStats:
+    """
+    .. class:: RollingStats
+
+    Count, mean, minimum, maximum and standard deviation of the last window values. The mean and standard deviation
+    are kept as running sums and the minimum and maximum with monotonic queues, so adding a value takes the same time
+    on average whatever the window size.
+
+    :param window: number of values to keep
+    :param name: name shown when the statistics are printed - default empty
+    :param unit: unit shown when the statistics are printed - default empty
+    """
+    def __init__(self, window, name="", unit=""):
+        """
+        Constructor
+        """
+        if window < 1:
+            raise ValueError(f"Invalid window {window}. Must be at least 1")
+
+        self.window = window
+        self.name = name
+        self.unit = unit
+        self._values = deque()
+        self._mins = deque()    # (index, value) with increasing values, the front is the minimum
+        self._maxs = deque()    # (index, value) with decreasing values, the front is the maximum
+        self.reset()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        if not self._values:
+            return f"{self.name} n=0"
+        return f"{self.name} n={len(self)} mean={self.mean:.1f}{self.unit} min={self.min}{self.unit} " \
+               f"max={self.max}{self.unit} std={self.stdev:.1f}{self.unit}"
+
+    def add(self, value):
+        """
+        Add a value, dropping the oldest value once the window is full
+
+        :param value: the measured value
+        """
+        index = self._added
+        self._added += 1
+        self.last = value
+        self._values.append(value)
+        self._sum += value
+        self._sum_squares += value * value
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            self._sum -= old
+            self._sum_squares -= old * old
+
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((index, value))
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((index, value))
+        oldest = index - self.window
+        if self._mins[0][0] <= oldest:
+            self._mins.popleft()
+        if self._maxs[0][0] <= oldest:
+            self._maxs.popleft()
+
+    def reset(self):
+        """
+        Remove all values
+        """
+        self._values.clear()
+        self._mins.clear()
+        self._maxs.clear()
+        self._added = 0
+        self._sum = 0
+        self._sum_squares = 0
+        self.last = None
+        """
+        The last value added or None
+        """
+
+    @property
+    def count(self):
+        """
+        Number of values in the window
+        """
+        return len(self._values)
+
+    @property
+    def mean(self):
+        """
+        Mean of the values in the window, 0.0 when it is empty
+
+        :rtype: float
+        """
+        return self._sum / len(self._values) if self._values else 0.0
+
+    @property
+    def min(self):
+        """
+        The smallest value in the window or None
+        """
+        return self._mins[0][1] if self._mins else None
+
+    @property
+    def max(self):
+        """
+        The largest value in the window or None
+        """
+        return self._maxs[0][1] if self._maxs else None
+
+    @property
+    def variance(self):
+        """
+        Sample variance of the values in the window, 0.0 when there are less than two
+
+        :rtype: float
+        """
+        count = len(self._values)
+        if count < 2:
+            return 0.0
+        return max(0.0, (self._sum_squares - self._sum * self._sum / count) / (count - 1))
+
+    @property
+    def stdev(self):
+        """
+        Sample standard deviation of the values in the window, 0.0 when there are less than two
+
+        :rtype: float
+        """
+        return math.sqrt(self.variance)
+
+    def as_dict(self):
+        """
+        :returns: the statistics as a dict, for logging or reporting
+        :rtype: dict
+        """
+        return {"name": self.name, "unit": self.unit, "count": self.count, "mean": self.mean, "min": self.min,
+                "max": self.max, "stdev": self.stdev, "last": self.last}
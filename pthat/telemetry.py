@@ -0,0 +1,380 @@
+"""
+Pulse Train Hat Telemetry
+=========================
+
+.. module:: pthat.telemetry
+   :platform: Mac, Linux, Windows
+   :synopsis: Fixed capacity telemetry buffers for pulse count and ADC replies.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'RingBuffer' class and the :class:'PulseCountBuffer', :class:'ADCBuffer' and
+:class:'Telemetry' classes built on top of it.
+
+Replies such as the auto count pulse out replies (XP(D)XResult*) and the ADC replies come back from the PTHat as
+strings. Keeping them in a list means the list grows for as long as the motors run. The ring buffers here are
+preallocated once with :mod:'array' columns, so every sample is stored as plain machine values and no Python objects
+are kept per sample. When a buffer is full the oldest samples are overwritten.
+
+.. code-block:: python
+
+   from pthat.pthat import Axis
+   from pthat.telemetry import Telemetry
+
+   telemetry = Telemetry(capacity=10000)
+
+   xaxis = Axis("X", command_id=1, serial_device="/dev/ttyS0")
+   xaxis.auto_send_command = True
+   xaxis.set_auto_count_pulse_out(pulse_count=1000)
+   ...
+   telemetry.feed(xaxis.get_all_responses())
+
+   # Last 100 pulse counts and all ADC values from the last second
+   counts = telemetry.pulse_counts.last(100)
+   adc = telemetry.adc.since(telemetry.clock.monotonic_ns() - 1000000000)
+"""
+import array
+
+from pthat.clock import get_clock
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+AXES = "XYZE"
+"""
+Axis letters in the order they are stored in the telemetry buffers. The axis column holds the index into this string.
+"""
+
+
+def parse_pulse_count_reply(resp):
+    """
+    Parse a pulse count reply. Pulse count replies are sent back for the get current pulse count command, the pause
+    commands and the auto count pulse out command. They look like XP(D)XResult* where (D) is the direction of travel
+    and XResult is the pulse count 0000000000-4294967295.
+
+    :param resp: a single response string
+    :returns: a tuple of (axis index, direction, pulse count) or None if this is not a pulse count reply
+    :rtype: tuple
+    """
+    if len(resp) < 5 or resp[1] != "P" or resp[-1] != "*":
+        return None
+
+    axis = AXES.find(resp[0])
+    if axis < 0 or resp[2] not in "01":
+        return None
+
+    count = resp[3:-1]
+    if not count.isdigit():
+        return None
+
+    return axis, ord(resp[2]) - 48, int(count)
+
+
+def parse_adc_reply(resp):
+    """
+    Parse an ADC result reply. The ADC result comes back after the received reply for the get reading command as
+    D1Result* or D2Result* where Result is the ADC value.
+
+    :param resp: a single response string
+    :returns: a tuple of (ADC number, value) or None if this is not an ADC result reply
+    :rtype: tuple
+    """
+    if len(resp) < 4 or resp[0] != "D" or resp[1] not in "12" or resp[-1] != "*":
+        return None
+
+    value = resp[2:-1]
+    if not value.isdigit():
+        return None
+
+    return ord(resp[1]) - 48, int(value)
+
+
+def parse_port_status_reply(resp):
+    """
+    Parse an IO port status result reply. The result comes back after the received reply for the get IO port status
+    command as L11111* where the digits are the ES, X limit, Y limit, Z limit and E limit inputs.
+
+    :param resp: a single response string
+    :returns: the inputs as an integer, bit 4 = ES, bit 3 = X, bit 2 = Y, bit 1 = Z and bit 0 = E limit input, or None
+              if this is not a port status reply
+    :rtype: int
+    """
+    if len(resp) != 7 or resp[0] != "L" or resp[-1] != "*":
+        return None
+
+    bits = resp[1:6]
+    if bits.strip("01"):
+        return None
+
+    return int(bits, 2)
+
+
+class RingBuffer:
+    """
+    .. class:: RingBuffer
+
+    A fixed capacity ring buffer made of preallocated :mod:'array' columns. The first column must be the monotonic
+    timestamp in nanoseconds so time range queries can use a binary search. Once the buffer is full the oldest
+    samples are overwritten.
+
+    Queries return a dict of column name to a new :class:'array.array' in the order the samples were added. The
+    copies are done with array slicing so no Python objects are created per sample.
+
+    :param columns: sequence of (name, typecode) pairs, the first one being the timestamp
+    :param capacity: maximum number of samples to keep
+    """
+    def __init__(self, columns, capacity):
+        """
+        Constructor
+        """
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity {capacity}. Must be at least 1")
+
+        self.capacity = capacity
+        self.names = tuple(name for name, typecode in columns)
+        self._columns = tuple(array.array(typecode, bytes(array.array(typecode).itemsize * capacity))
+                              for name, typecode in columns)
+        self._next = 0      # physical index of the next sample to write
+        self._count = 0     # number of valid samples
+        self.overwritten = 0
+        """
+        Number of samples that have been overwritten because the buffer was full
+        """
+
+    def __len__(self):
+        return self._count
+
+    def append(self, *values):
+        """
+        Add a sample, overwriting the oldest sample when the buffer is full
+
+        :param values: one value per column in column order
+        """
+        index = self._next
+        for column, value in zip(self._columns, values):
+            column[index] = value
+        self._advance()
+
+    def clear(self):
+        """
+        Remove all samples. The storage is kept.
+        """
+        self._next = 0
+        self._count = 0
+        self.overwritten = 0
+
+    def latest(self):
+        """
+        Get the most recent sample
+
+        :returns: tuple of values in column order or None if the buffer is empty
+        :rtype: tuple
+        """
+        if self._count == 0:
+            return None
+        index = self._next - 1
+        return tuple(column[index] for column in self._columns)
+
+    def last(self, n):
+        """
+        Get the last n samples
+
+        :param n: number of samples
+        :returns: dict of column name to array of values, oldest first
+        :rtype: dict
+        """
+        n = max(0, min(n, self._count))
+        return self._window(self._count - n, self._count)
+
+    def between(self, start_ns, end_ns):
+        """
+        Get the samples with a timestamp in the range start_ns <= timestamp < end_ns
+
+        :param start_ns: start of the range in monotonic nanoseconds
+        :param end_ns: end of the range in monotonic nanoseconds
+        :returns: dict of column name to array of values, oldest first
+        :rtype: dict
+        """
+        return self._window(self._bisect(start_ns), self._bisect(end_ns))
+
+    def since(self, start_ns):
+        """
+        Get the samples with a timestamp at or after start_ns
+
+        :param start_ns: start of the range in monotonic nanoseconds
+        :returns: dict of column name to array of values, oldest first
+        :rtype: dict
+        """
+        return self._window(self._bisect(start_ns), self._count)
+
+    def _advance(self):
+        """
+        Move the write position on after a sample has been written
+        """
+        self._next += 1
+        if self._next == self.capacity:
+            self._next = 0
+        if self._count < self.capacity:
+            self._count += 1
+        else:
+            self.overwritten += 1
+
+    def _physical(self, logical):
+        """
+        Convert a logical index (0 = oldest sample) to the index in the column arrays
+        """
+        index = self._next - self._count + logical
+        return index + self.capacity if index < 0 else index
+
+    def _bisect(self, timestamp):
+        """
+        Find the logical index of the first sample with a timestamp at or after the one passed in
+        """
+        times = self._columns[0]
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if times[self._physical(mid)] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _window(self, start, stop):
+        """
+        Copy the samples between two logical indexes out of the columns
+        """
+        if start >= stop:
+            return {name: column[0:0] for name, column in zip(self.names, self._columns)}
+
+        first = self._physical(start)
+        last = self._physical(stop - 1) + 1
+        if first < last:
+            return {name: column[first:last] for name, column in zip(self.names, self._columns)}
+        return {name: column[first:] + column[:last] for name, column in zip(self.names, self._columns)}
+
+
+class PulseCountBuffer(RingBuffer):
+    """
+    .. class:: PulseCountBuffer
+
+    Ring buffer of pulse count replies. Columns are ns (monotonic nanoseconds), axis (index into :data:'AXES'),
+    direction and count.
+
+    :param capacity: maximum number of samples to keep - default 10000
+    :param clock: clock used to timestamp replies - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, capacity=10000, clock=None):
+        """
+        Constructor
+        """
+        super().__init__((("ns", "q"), ("axis", "b"), ("direction", "b"), ("count", "Q")), capacity)
+        self.clock = get_clock() if clock is None else clock
+
+    def add_reply(self, resp, ns=None):
+        """
+        Parse a pulse count reply and add it to the buffer
+
+        :param resp: a single response string
+        :param ns: timestamp in monotonic nanoseconds - default now
+        :returns: True if the reply was a pulse count reply and was added, otherwise False
+        :rtype: bool
+        """
+        parsed = parse_pulse_count_reply(resp)
+        if parsed is None:
+            return False
+
+        ns_col, axis_col, direction_col, count_col = self._columns
+        index = self._next
+        ns_col[index] = self.clock.monotonic_ns() if ns is None else ns
+        axis_col[index], direction_col[index], count_col[index] = parsed
+        self._advance()
+        return True
+
+
+class ADCBuffer(RingBuffer):
+    """
+    .. class:: ADCBuffer
+
+    Ring buffer of ADC result replies. Columns are ns (monotonic nanoseconds), adc (1 or 2) and value.
+
+    :param capacity: maximum number of samples to keep - default 10000
+    :param clock: clock used to timestamp replies - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, capacity=10000, clock=None):
+        """
+        Constructor
+        """
+        super().__init__((("ns", "q"), ("adc", "b"), ("value", "l")), capacity)
+        self.clock = get_clock() if clock is None else clock
+
+    def add_reply(self, resp, ns=None):
+        """
+        Parse an ADC result reply and add it to the buffer
+
+        :param resp: a single response string
+        :param ns: timestamp in monotonic nanoseconds - default now
+        :returns: True if the reply was an ADC result reply and was added, otherwise False
+        :rtype: bool
+        """
+        parsed = parse_adc_reply(resp)
+        if parsed is None:
+            return False
+
+        ns_col, adc_col, value_col = self._columns
+        index = self._next
+        ns_col[index] = self.clock.monotonic_ns() if ns is None else ns
+        adc_col[index], value_col[index] = parsed
+        self._advance()
+        return True
+
+
+class Telemetry:
+    """
+    .. class:: Telemetry
+
+    Holds one ring buffer per telemetry channel and routes replies to them.
+
+    :param capacity: maximum number of samples to keep per channel - default 10000
+    :param clock: clock used to timestamp replies - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, capacity=10000, clock=None):
+        """
+        Constructor
+        """
+        self.clock = get_clock() if clock is None else clock
+        self.pulse_counts = PulseCountBuffer(capacity, self.clock)
+        """
+        Pulse count replies
+        """
+        self.adc = ADCBuffer(capacity, self.clock)
+        """
+        ADC result replies
+        """
+
+    def add_reply(self, resp, ns=None):
+        """
+        Add a single reply to the buffer it belongs to
+
+        :param resp: a single response string
+        :param ns: timestamp in monotonic nanoseconds - default now
+        :returns: True if the reply was telemetry and was added, otherwise False
+        :rtype: bool
+        """
+        return self.pulse_counts.add_reply(resp, ns) or self.adc.add_reply(resp, ns)
+
+    def feed(self, responses):
+        """
+        Add a list of replies such as the one returned by get_all_responses. Replies that are not telemetry are
+        returned so they can still be parsed by the caller.
+
+        :param responses: list of responses
+        :returns: list of responses that were not telemetry
+        :rtype: list
+        """
+        others = []
+        if responses is not None:
+            ns = self.clock.monotonic_ns()
+            for resp in responses:
+                if not self.add_reply(resp, ns):
+                    others.append(resp)
+        return others
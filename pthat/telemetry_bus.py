@@ -0,0 +1,365 @@
+"""
+Pulse Train Hat Telemetry Bus
+=============================
+
+.. module:: pthat.telemetry_bus
+   :platform: Mac, Linux, Windows
+   :synopsis: Shared memory telemetry ring for one writer process and many reader processes.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'TelemetryBus' class.
+
+The process that owns the serial port decodes the pulse count, ADC and IO port status replies and publishes them into
+a :mod:'multiprocessing.shared_memory' block. Any number of other processes attach to the block by name and read the
+samples straight out of it, without a pipe, without the serial port and without the GIL of the writer.
+
+Every sample gets a sequence number, starting at 1. The ring keeps the last capacity samples in the same 16 byte
+records as the :mod:'pthat.telemetry_log' file, and a table holds the latest sample of each pulse count axis, ADC and
+the IO port status. A reader keeps the sequence number it has read up to and asks for everything after it. If the writer
+has gone round the ring since, the samples that were overwritten are counted as missed. The oldest sample in a full
+ring is the one the writer overwrites next, so it may be half written and is counted as missed too.
+
+With NumPy installed :meth:'TelemetryBus.records_view' and :meth:'TelemetryBus.latest_view' return NumPy views onto
+the shared memory without copying. The writer may change a view while it is being looked at, :meth:'TelemetryBus.read'
+and :meth:'TelemetryBus.latest' check the sequence numbers and return consistent copies.
+
+**Shared memory layout**
+
++-----------------+---------------------------------------------------------------------------------------------------+
+| Section         | Contents                                                                                          |
++=================+===================================================================================================+
+| Header          | magic PTHTBUS1, capacity, sequence number of the last sample written (64 bytes)                   |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Latest          | sequence, ns, kind, channel, direction, value for X, Y, Z, E pulse counts, ADC 1, ADC 2 and the   |
+|                 | IO port status (24 bytes each)                                                                    |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Records         | ns (int64), kind (uint8), channel (uint8), direction (uint8), pad, value (uint32) (16 bytes each) |
++-----------------+---------------------------------------------------------------------------------------------------+
+
+.. code-block:: python
+
+   # Process that owns the serial port
+   from pthat.telemetry_bus import TelemetryBus
+
+   bus = TelemetryBus("pthat-telemetry", capacity=65536)
+   while running:
+       bus.feed(xaxis.get_all_responses())
+
+   # Any number of analysis processes
+   from pthat.telemetry_bus import TelemetryBus
+   from pthat.telemetry_log import ADC
+
+   bus = TelemetryBus("pthat-telemetry", create=False)
+   sequence = 0
+   while True:
+       records, sequence = bus.read(sequence)
+       print(bus.latest(ADC, 1))
+"""
+import multiprocessing
+import struct
+from multiprocessing import shared_memory
+
+from pthat.clock import get_clock
+from pthat.telemetry_log import ADC, PORT_STATUS, PULSE_COUNT, RECORD, decode_reply
+
+try:
+    import numpy
+except ImportError:     # NumPy is optional, reads fall back to lists of tuples
+    numpy = None
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+BUS_MAGIC = b"PTHTBUS1"
+HEADER = struct.Struct("<8sQQ")
+HEADER_SIZE = 64
+SEQUENCE = struct.Struct("<Q")
+SEQUENCE_OFFSET = 16
+LATEST = struct.Struct("<QqBBBxI")
+LATEST_OFFSET = HEADER_SIZE
+LATEST_SLOTS = 7
+RECORDS_OFFSET = 256
+
+if numpy is not None:
+    LATEST_DTYPE = numpy.dtype([("sequence", "<u8"), ("ns", "<i8"), ("kind", "u1"), ("channel", "u1"),
+                                ("direction", "u1"), ("pad", "u1"), ("value", "<u4")])
+    RECORD_DTYPE = numpy.dtype([("ns", "<i8"), ("kind", "u1"), ("channel", "u1"), ("direction", "u1"),
+                                ("pad", "u1"), ("value", "<u4")])
+
+
+def _latest_slot(kind, channel):
+    """
+    Index into the latest table of a kind and channel, None if there is no slot for it
+    """
+    if kind == PULSE_COUNT and 0 <= channel <= 3:
+        return channel
+    if kind == ADC and 1 <= channel <= 2:
+        return 3 + channel
+    if kind == PORT_STATUS:
+        return 6
+    return None
+
+
+_created = set()    # names of the shared memory blocks created by this process
+
+
+def create_shared_memory(size, name=None):
+    """
+    Create a shared memory block owned by this process
+
+    :param size: size in bytes
+    :param name: name of the block - default None to let the system choose one
+    :returns: the new block
+    :rtype: multiprocessing.shared_memory.SharedMemory
+    """
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _created.add(shm._name)
+    return shm
+
+
+def attach_shared_memory(name):
+    """
+    Attach to a shared memory block created by another process without taking ownership of it. Only the process that
+    created the block frees it.
+
+    :param name: name of the shared memory block
+    :returns: the attached block
+    :rtype: multiprocessing.shared_memory.SharedMemory
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python 3.13 and later
+    except TypeError:
+        pass
+
+    shm = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None and shm._name not in _created:
+        # A separate program has its own resource tracker, which would free the block when the program exits. Child
+        # processes share the tracker of their parent and are left registered.
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except (ImportError, AttributeError, KeyError):
+            pass
+    return shm
+
+
+class TelemetryBus:
+    """
+    .. class:: TelemetryBus
+
+    Shared memory telemetry ring. The process that creates it is the only one that may publish to it.
+
+    :param name: name of the shared memory block - default None to let the system choose one when creating
+    :param capacity: number of samples kept in the ring when creating - default 65536
+    :param create: create the block and become its writer, or attach to an existing block as a reader - default True
+    :param clock: clock used to timestamp samples - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, name=None, capacity=65536, create=True, clock=None):
+        """
+        Constructor
+        """
+        self.clock = get_clock() if clock is None else clock
+        self.missed = 0
+        """
+        Number of samples a reader missed because the writer overwrote them before they were read
+        """
+
+        if create:
+            if capacity < 1:
+                raise ValueError(f"Invalid capacity {capacity}. Must be at least 1")
+            self._shm = create_shared_memory(RECORDS_OFFSET + capacity * RECORD.size, name)
+            self._shm.buf[:RECORDS_OFFSET] = bytes(RECORDS_OFFSET)
+            HEADER.pack_into(self._shm.buf, 0, BUS_MAGIC, capacity, 0)
+        else:
+            self._shm = attach_shared_memory(name)
+            magic, capacity, sequence = HEADER.unpack_from(self._shm.buf, 0)
+            if magic != BUS_MAGIC:
+                self._shm.close()
+                raise ValueError(f"{name} is not a telemetry bus")
+
+        self.writer = create
+        self.capacity = capacity
+        self._sequence = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def name(self):
+        """
+        Name of the shared memory block, pass it to the reader processes
+        """
+        return self._shm.name
+
+    @property
+    def sequence(self):
+        """
+        Sequence number of the last sample published, 0 if there are none
+        """
+        return SEQUENCE.unpack_from(self._shm.buf, SEQUENCE_OFFSET)[0]
+
+    def publish(self, resp, ns=None):
+        """
+        Decode a reply and publish it if it is telemetry
+
+        :param resp: a single response string
+        :param ns: timestamp in monotonic nanoseconds - default now
+        :returns: True if the reply was telemetry and was published, otherwise False
+        :rtype: bool
+        """
+        decoded = decode_reply(resp)
+        if decoded is None:
+            return False
+        self.publish_record(*decoded, ns=ns)
+        return True
+
+    def publish_record(self, kind, channel, direction, value, ns=None):
+        """
+        Publish a sample
+
+        :param kind: PULSE_COUNT, ADC or PORT_STATUS
+        :param channel: axis index or ADC number
+        :param direction: direction of travel for pulse counts, otherwise 0
+        :param value: pulse count, ADC value or IO port inputs
+        :param ns: timestamp in monotonic nanoseconds - default now
+        """
+        if not self.writer:
+            raise ValueError("Only the process that created the telemetry bus can publish to it")
+
+        if ns is None:
+            ns = self.clock.monotonic_ns()
+        buf = self._shm.buf
+        sequence = self._sequence + 1
+        RECORD.pack_into(buf, RECORDS_OFFSET + (self._sequence % self.capacity) * RECORD.size,
+                         ns, kind, channel, direction, value)
+
+        slot = _latest_slot(kind, channel)
+        if slot is not None:
+            # A sequence of 0 tells readers the slot is being written
+            offset = LATEST_OFFSET + slot * LATEST.size
+            LATEST.pack_into(buf, offset, 0, ns, kind, channel, direction, value)
+            SEQUENCE.pack_into(buf, offset, sequence)
+
+        # Publish the sample to the readers last
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, sequence)
+        self._sequence = sequence
+
+    def feed(self, responses):
+        """
+        Publish a list of replies such as the one returned by get_all_responses. Replies that are not telemetry are
+        returned so they can still be parsed by the caller.
+
+        :param responses: list of responses
+        :returns: list of responses that were not telemetry
+        :rtype: list
+        """
+        others = []
+        if responses is not None:
+            ns = self.clock.monotonic_ns()
+            for resp in responses:
+                if not self.publish(resp, ns):
+                    others.append(resp)
+        return others
+
+    def read(self, after=0):
+        """
+        Copy the samples published after a sequence number
+
+        :param after: sequence number already read up to - default 0 for everything still in the ring
+        :returns: tuple of (samples, sequence number read up to). Samples are a NumPy structured array or, without
+                  NumPy, a list of (ns, kind, channel, direction, value) tuples
+        :rtype: tuple
+        """
+        end = self.sequence
+        start = max(after, end - self.capacity)
+        data = self._copy(start, end)
+
+        # Samples the writer went round and overwrote while they were being copied are dropped, along with the one
+        # it may be writing over now, which is published only once it has been written
+        dropped = min(max(start, self.sequence + 1 - self.capacity) - start, end - start)
+        self.missed += start - after + dropped
+        data = data[dropped * RECORD.size:]
+
+        if numpy is not None:
+            return numpy.frombuffer(data, dtype=RECORD_DTYPE).copy(), end
+        return list(RECORD.iter_unpack(data)), end
+
+    def latest(self, kind, channel=0):
+        """
+        Get the latest sample of a pulse count axis, an ADC or the IO port status
+
+        :param kind: PULSE_COUNT, ADC or PORT_STATUS
+        :param channel: axis index 0-3 for pulse counts or ADC number 1-2 - default 0
+        :returns: tuple of (sequence, ns, direction, value) or None if nothing has been published for it
+        :rtype: tuple
+        """
+        slot = _latest_slot(kind, channel)
+        if slot is None:
+            raise ValueError(f"Invalid telemetry kind {kind} and channel {channel}")
+
+        offset = LATEST_OFFSET + slot * LATEST.size
+        while True:
+            sequence, ns, kind, channel, direction, value = LATEST.unpack_from(self._shm.buf, offset)
+            if sequence == 0:
+                if self._never_written(offset):
+                    return None
+                continue
+            if SEQUENCE.unpack_from(self._shm.buf, offset)[0] == sequence:
+                return sequence, ns, direction, value
+
+    def records_view(self):
+        """
+        Zero copy view of the whole ring in physical order. Sample n is at index (n - 1) % capacity.
+        Requires NumPy.
+
+        :rtype: numpy.ndarray
+        """
+        return numpy.frombuffer(self._shm.buf, dtype=RECORD_DTYPE, count=self.capacity, offset=RECORDS_OFFSET)
+
+    def latest_view(self):
+        """
+        Zero copy view of the latest table: X, Y, Z, E pulse counts, ADC 1, ADC 2 and IO port status. A sequence of 0
+        means nothing has been published for that slot yet. Requires NumPy.
+
+        :rtype: numpy.ndarray
+        """
+        return numpy.frombuffer(self._shm.buf, dtype=LATEST_DTYPE, count=LATEST_SLOTS, offset=LATEST_OFFSET)
+
+    def close(self):
+        """
+        Detach from the shared memory. Views returned by this object must be deleted first.
+        """
+        try:
+            self._shm.close()
+        except BufferError:
+            # A NumPy view is still using the memory, it is released when the view is deleted
+            pass
+
+    def unlink(self):
+        """
+        Free the shared memory block. Only the writer should call this, once every process has finished with it.
+        """
+        self._shm.unlink()
+
+    def _copy(self, start, end):
+        """
+        Copy the records of the samples after start up to end out of the ring
+        """
+        if start >= end:
+            return b""
+        buf = self._shm.buf
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return bytes(buf[RECORDS_OFFSET + first * RECORD.size:RECORDS_OFFSET + last * RECORD.size])
+        return bytes(buf[RECORDS_OFFSET + first * RECORD.size:RECORDS_OFFSET + self.capacity * RECORD.size]) + \
+            bytes(buf[RECORDS_OFFSET:RECORDS_OFFSET + (last - self.capacity) * RECORD.size])
+
+    def _never_written(self, offset):
+        """
+        Check if a latest slot is still all zeros
+        """
+        return not any(self._shm.buf[offset:offset + LATEST.size])
@@ -0,0 +1,397 @@
+"""
+Pulse Train Hat Telemetry Log
+=============================
+
+.. module:: pthat.telemetry_log
+   :platform: Mac, Linux, Windows
+   :synopsis: Append only binary telemetry log with a memory mapped columnar reader.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'TelemetryLogWriter' and :class:'TelemetryLogReader' classes.
+
+The writer takes the replies returned by get_all_responses, keeps the pulse count, ADC and IO port status replies and
+writes them to a binary file on a background thread so the serial loop is never held up by disk writes. Every reply is
+stored as a fixed size record so the file can be read back without any parsing.
+
+The reader memory maps the file. When NumPy is installed each column is returned as a NumPy view straight onto the
+mapped file, so even a full shift of telemetry loads instantly. Without NumPy the columns are copied into
+:class:'array.array' objects instead.
+
+**File layout**
+
++-----------------+---------------------------------------------------------------------------------------------------+
+| Section         | Contents                                                                                          |
++=================+===================================================================================================+
+| Header          | magic PTHTLOG1, version, record size, wall clock and monotonic time the log was opened (32 bytes) |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Records         | ns (int64), kind (uint8), channel (uint8), direction (uint8), pad, value (uint32) (16 bytes each) |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Chunk index     | first record, record count, first ns and last ns of each chunk of records (32 bytes each)         |
++-----------------+---------------------------------------------------------------------------------------------------+
+| Trailer         | byte offset of the chunk index, number of chunks, magic PTHTIDX1 (24 bytes)                       |
++-----------------+---------------------------------------------------------------------------------------------------+
+
+The chunk index and trailer are written when the log is closed. If the program stops before that, the reader still
+loads every complete record and builds the index itself.
+
+.. code-block:: python
+
+   from pthat.pthat import Axis
+   from pthat.telemetry_log import PULSE_COUNT, TelemetryLogReader, TelemetryLogWriter
+
+   xaxis = Axis("X", command_id=1, serial_device="/dev/ttyS0")
+
+   with TelemetryLogWriter("shift.ptlog") as log:
+       while running:
+           log.feed(xaxis.get_all_responses())
+
+   with TelemetryLogReader("shift.ptlog") as log:
+       counts = log.columns(kind=PULSE_COUNT)
+       print(counts["ns"], counts["value"])
+"""
+import array
+import mmap
+import os
+import queue
+import struct
+import threading
+
+from pthat.clock import get_clock
+from pthat.telemetry import parse_adc_reply, parse_port_status_reply, parse_pulse_count_reply
+
+try:
+    import numpy
+except ImportError:     # NumPy is optional, the reader falls back to array.array copies
+    numpy = None
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+PULSE_COUNT = 1
+"""
+Record kind for pulse count replies. Channel is the axis index (0=X, 1=Y, 2=Z, 3=E) and value is the pulse count.
+"""
+ADC = 2
+"""
+Record kind for ADC result replies. Channel is the ADC number and value is the ADC result.
+"""
+PORT_STATUS = 3
+"""
+Record kind for IO port status replies. Value holds the inputs, bit 4 = ES down to bit 0 = E limit input.
+"""
+
+LOG_MAGIC = b"PTHTLOG1"
+INDEX_MAGIC = b"PTHTIDX1"
+LOG_VERSION = 1
+HEADER = struct.Struct("<8sHHqq4x")
+RECORD = struct.Struct("<qBBBxI")
+INDEX_ENTRY = struct.Struct("<QQqq")
+TRAILER = struct.Struct("<QQ8s")
+COLUMNS = (("ns", "q"), ("kind", "B"), ("channel", "B"), ("direction", "B"), ("value", "I"))
+
+if numpy is not None:
+    RECORD_DTYPE = numpy.dtype([("ns", "<i8"), ("kind", "u1"), ("channel", "u1"), ("direction", "u1"),
+                                ("pad", "u1"), ("value", "<u4")])
+
+
+def decode_reply(resp):
+    """
+    Turn a reply into the (kind, channel, direction, value) fields of a log record
+
+    :param resp: a single response string
+    :returns: tuple of record fields or None if the reply is not telemetry
+    :rtype: tuple
+    """
+    parsed = parse_pulse_count_reply(resp)
+    if parsed is not None:
+        return (PULSE_COUNT,) + parsed
+
+    parsed = parse_adc_reply(resp)
+    if parsed is not None:
+        return ADC, parsed[0], 0, parsed[1]
+
+    parsed = parse_port_status_reply(resp)
+    if parsed is not None:
+        return PORT_STATUS, 0, 0, parsed
+
+    return None
+
+
+class TelemetryLogWriter:
+    """
+    .. class:: TelemetryLogWriter
+
+    Writes telemetry replies to an append only binary log on a background thread. Replies are queued with their
+    arrival time by :meth:'feed' or :meth:'add_reply' and decoded and written by the writer thread.
+
+    :param path: path of the log file to create. An existing file is replaced.
+    :param chunk_records: number of records per chunk in the chunk index - default 4096
+    :param flush_interval: seconds the writer waits for more replies before writing a partial chunk - default 1.0
+    :param clock: clock used to timestamp replies - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, path, chunk_records=4096, flush_interval=1.0, clock=None):
+        """
+        Constructor
+        """
+        if chunk_records < 1:
+            raise ValueError(f"Invalid chunk records {chunk_records}. Must be at least 1")
+
+        self.path = path
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        self.clock = get_clock() if clock is None else clock
+        self.records_written = 0
+        """
+        Number of records written to the file so far
+        """
+
+        self._queue = queue.SimpleQueue()
+        self._chunk = bytearray(RECORD.size * chunk_records)
+        self._chunk_count = 0
+        self._chunk_first_ns = 0
+        self._last_ns = 0
+        self._index = []
+        self._closed = False
+
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(LOG_MAGIC, LOG_VERSION, RECORD.size, self.clock.time_ns(),
+                                     self.clock.monotonic_ns()))
+
+        self._thread = threading.Thread(target=self._run, name="pthat-telemetry-log", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_reply(self, resp, ns=None):
+        """
+        Queue a single reply to be written. Replies that are not telemetry are dropped by the writer thread.
+
+        :param resp: a single response string
+        :param ns: timestamp in monotonic nanoseconds - default now
+        """
+        self._queue.put((self.clock.monotonic_ns() if ns is None else ns, resp))
+
+    def feed(self, responses):
+        """
+        Queue a list of replies such as the one returned by get_all_responses
+
+        :param responses: list of responses
+        """
+        if responses:
+            self._queue.put((self.clock.monotonic_ns(), responses))
+
+    def close(self):
+        """
+        Write everything still queued, write the chunk index and trailer and close the file
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """
+        Writer thread
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._write_chunk()
+                continue
+
+            if item is None:
+                break
+
+            ns, resp = item
+            if isinstance(resp, str):
+                self._add(ns, resp)
+            else:
+                for r in resp:
+                    self._add(ns, r)
+
+        self._write_chunk()
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.write(TRAILER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+
+    def _add(self, ns, resp):
+        """
+        Decode a reply and add it to the current chunk
+        """
+        fields = decode_reply(resp)
+        if fields is None:
+            return
+
+        if self._chunk_count == 0:
+            self._chunk_first_ns = ns
+        RECORD.pack_into(self._chunk, self._chunk_count * RECORD.size, ns, *fields)
+        self._chunk_count += 1
+        self._last_ns = ns
+        if self._chunk_count == self.chunk_records:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        """
+        Write the records in the current chunk and add it to the chunk index
+        """
+        if self._chunk_count == 0:
+            return
+
+        self._file.write(memoryview(self._chunk)[:self._chunk_count * RECORD.size])
+        self._file.flush()
+        self._index.append((self.records_written, self._chunk_count, self._chunk_first_ns, self._last_ns))
+        self.records_written += self._chunk_count
+        self._chunk_count = 0
+
+
+class TelemetryLogReader:
+    """
+    .. class:: TelemetryLogReader
+
+    Memory maps a telemetry log written by :class:'TelemetryLogWriter' and gives column access to the records.
+
+    :param path: path of the log file
+    """
+    def __init__(self, path):
+        """
+        Constructor
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a telemetry log")
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.wall_ns, self.monotonic_ns = HEADER.unpack_from(self._map, 0)
+        if magic != LOG_MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not a telemetry log")
+
+        self.chunks = []
+        """
+        Chunk index as a list of (first record, record count, first ns, last ns) tuples
+        """
+        end = size
+        if size >= HEADER.size + TRAILER.size:
+            index_offset, entries, index_magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+            if index_magic == INDEX_MAGIC:
+                end = index_offset
+                self.chunks = [INDEX_ENTRY.unpack_from(self._map, index_offset + i * INDEX_ENTRY.size)
+                               for i in range(entries)]
+
+        self.count = (end - HEADER.size) // RECORD.size
+        """
+        Number of records in the log
+        """
+        if not self.chunks and self.count > 0:
+            # The log was not closed so there is no index, treat all complete records as one chunk
+            self.chunks = [(0, self.count, self._ns_at(0), self._ns_at(self.count - 1))]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """
+        Close the memory map and the file. Any NumPy views returned by the reader must not be used after this.
+        """
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass    # NumPy views still reference the map, it is released when they are
+            self._map = None
+        self._file.close()
+
+    def records(self, start=0, stop=None):
+        """
+        Get the records as a NumPy structured array that is a view onto the file. Requires NumPy.
+
+        :param start: first record - default 0
+        :param stop: record to stop before - default the end of the log
+        :returns: structured array with ns, kind, channel, direction and value fields
+        :rtype: numpy.ndarray
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is required for records(), use columns() instead")
+
+        stop = self.count if stop is None else min(stop, self.count)
+        return numpy.frombuffer(self._map, dtype=RECORD_DTYPE, count=max(0, stop - start),
+                                offset=HEADER.size + start * RECORD.size)
+
+    def columns(self, kind=None, start=0, stop=None):
+        """
+        Get the records as one array per column. With NumPy the arrays are views onto the file unless kind is passed,
+        in which case the matching records are copied out.
+
+        :param kind: only return records of this kind, PULSE_COUNT, ADC or PORT_STATUS - default all kinds
+        :param start: first record - default 0
+        :param stop: record to stop before - default the end of the log
+        :returns: dict of column name to array
+        :rtype: dict
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        if numpy is not None:
+            records = self.records(start, stop)
+            if kind is not None:
+                records = records[records["kind"] == kind]
+            return {name: records[name] for name, typecode in COLUMNS}
+
+        result = {name: array.array(typecode) for name, typecode in COLUMNS}
+        columns = tuple(result.values())
+        for i in range(start, stop):
+            values = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+            if kind is None or values[1] == kind:
+                for column, value in zip(columns, values):
+                    column.append(value)
+        return result
+
+    def between(self, start_ns, end_ns, kind=None):
+        """
+        Get the columns of the records with start_ns <= ns < end_ns. The chunk index is used to find the records
+        so only the chunks in the range are touched.
+
+        :param start_ns: start of the range in monotonic nanoseconds
+        :param end_ns: end of the range in monotonic nanoseconds
+        :param kind: only return records of this kind - default all kinds
+        :returns: dict of column name to array
+        :rtype: dict
+        """
+        return self.columns(kind=kind, start=self._find(start_ns), stop=self._find(end_ns))
+
+    def _ns_at(self, i):
+        """
+        Get the timestamp of a record
+        """
+        return struct.unpack_from("<q", self._map, HEADER.size + i * RECORD.size)[0]
+
+    def _find(self, ns):
+        """
+        Find the first record with a timestamp at or after ns
+        """
+        for first, count, first_ns, last_ns in self.chunks:
+            if last_ns >= ns:
+                low, high = first, first + count
+                while low < high:
+                    mid = (low + high) // 2
+                    if self._ns_at(mid) < ns:
+                        low = mid + 1
+                    else:
+                        high = mid
+                return low
+        return self.count
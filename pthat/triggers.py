@@ -0,0 +1,204 @@
+"""
+Pulse Train Hat Position Triggers
+=================================
+
+.. module:: pthat.triggers
+   :platform: Mac, Linux, Windows
+   :synopsis: Send AUX and PWM commands when an axis reaches a pulse count.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'PositionTriggers' class.
+
+Rules of (axis, pulse count, action) are kept sorted by pulse count for each axis. The pulse counts sent back by the
+auto count pulse out command are fed to a :class:'PositionTriggers', which finds the rules crossed since the last pulse
+count of the axis with a binary search. The commands of every rule crossed are written together in one write, as bytes
+that were encoded when the rule was added, so nothing is built or validated when a rule fires. An action can also be a
+function.
+
+Each rule fires once a move. A pulse count lower than the last one means the axis was started again and all of its
+rules can fire again.
+
+The time the axis crossed a rule is worked out from the pulse counts either side of it. The time from then until the
+command was written is kept in :attr:'PositionTriggers.lag'. The auto count pulse out interval sets how late a rule can
+be, so it should be small compared to the distance between the rules.
+
+.. code-block:: python
+
+   from pthat.pthat import AUX, Axis
+   from pthat.triggers import PositionTriggers
+
+   xaxis = Axis("X", serial_device="/dev/ttyS0")
+   xaxis.auto_send_command = True
+   glue = AUX(1, test_mode=True)
+
+   triggers = PositionTriggers(xaxis)
+   triggers.add("X", 4000, glue.output_on())
+   triggers.add("X", 4800, glue.output_off())
+   xaxis.set_auto_count_pulse_out(pulse_count=50)
+   xaxis.set_axis(frequency=2000.0, pulse_count=10000)
+   xaxis.start()
+   while True:
+       triggers.read_replies()
+"""
+import bisect
+
+from pthat.clock import get_clock
+from pthat.stats import RunningStats
+from pthat.telemetry import AXES, parse_pulse_count_reply
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+class PositionTriggers:
+    """
+    .. class:: PositionTriggers
+
+    Fires actions when axes cross pulse counts.
+
+    :param pthat: PTHat, Axis, ADC, AUX or PWM object whose serial port is used to send the commands
+    :param on_reply: function called with every reply read that is not a pulse count - default None to drop them
+    :param clock: clock used for the timing - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, pthat, on_reply=None, clock=None):
+        """
+        Constructor
+        """
+        self.pthat = pthat
+        self.on_reply = on_reply
+        self.clock = get_clock() if clock is None else clock
+        self.lag = RunningStats("trigger lag")
+        """
+        Statistics of the time in nanoseconds from an axis crossing a rule until its command was written
+        """
+        self.fired = 0
+        """
+        Number of rules fired
+        """
+        self._counts = {axis: [] for axis in AXES}      # sorted pulse counts of the rules of each axis
+        self._actions = {axis: [] for axis in AXES}     # actions in the same order as the pulse counts
+        self._last = {axis: (-1, None) for axis in AXES}  # (pulse count, monotonic ns) last seen for each axis
+
+    def __len__(self):
+        return sum(len(counts) for counts in self._counts.values())
+
+    def add(self, axis, pulse_count, action):
+        """
+        Add a rule
+
+        :param axis: X, Y, Z or E
+        :param pulse_count: pulse count that fires the rule when it is reached
+        :param action: command string, such as one returned by :meth:'pthat.pthat.AUX.output_on' or
+                       :meth:'pthat.pthat.PWM.set_channel' in test mode, or a function called with the axis, the pulse
+                       count and the monotonic time in nanoseconds of the pulse count
+        """
+        if axis not in AXES:
+            raise ValueError(f"Invalid axis {axis}. Must be X, Y, Z or E")
+        if isinstance(action, str):
+            if not action.endswith("*"):
+                raise ValueError(f"Invalid command {action}")
+            action = action.encode("ascii")
+        elif not callable(action):
+            raise ValueError("The action must be a command string or a function")
+
+        index = bisect.bisect_right(self._counts[axis], pulse_count)
+        self._counts[axis].insert(index, pulse_count)
+        self._actions[axis].insert(index, action)
+
+    def clear(self, axis=None):
+        """
+        Remove the rules of an axis
+
+        :param axis: X, Y, Z or E - default None for every axis
+        """
+        for name in AXES if axis is None else axis:
+            self._counts[name].clear()
+            self._actions[name].clear()
+
+    def rearm(self, axis=None):
+        """
+        Let every rule of an axis fire again, for example before starting a move that will not count up from 0
+
+        :param axis: X, Y, Z or E - default None for every axis
+        """
+        for name in AXES if axis is None else axis:
+            self._last[name] = (-1, None)
+
+    def read_replies(self):
+        """
+        Read every reply that has arrived without waiting
+
+        :returns: number of rules fired
+        :rtype: int
+        """
+        serial = self.pthat.serial
+        fired = 0
+        while serial.in_waiting:
+            data = serial.read_until(b"*")
+            if not data:
+                break
+            resp = data.decode("ascii", "replace")
+            parsed = parse_pulse_count_reply(resp)
+            if parsed is not None:
+                fired += self.update(AXES[parsed[0]], parsed[2])
+            elif self.on_reply is not None:
+                self.on_reply(resp)
+        return fired
+
+    def feed(self, responses):
+        """
+        Use a list of replies such as the one returned by get_all_responses. Replies that are not pulse counts are
+        returned so they can still be parsed by the caller.
+
+        :param responses: list of responses
+        :returns: list of responses that were not pulse counts
+        :rtype: list
+        """
+        others = []
+        if responses is not None:
+            for resp in responses:
+                parsed = parse_pulse_count_reply(resp)
+                if parsed is None:
+                    others.append(resp)
+                else:
+                    self.update(AXES[parsed[0]], parsed[2])
+        return others
+
+    def update(self, axis, pulse_count, ns=None):
+        """
+        Fire the rules of an axis crossed since its last pulse count
+
+        :param axis: X, Y, Z or E
+        :param pulse_count: the new pulse count
+        :param ns: monotonic time in nanoseconds of the pulse count - default now
+        :returns: number of rules fired
+        :rtype: int
+        """
+        ns = self.clock.monotonic_ns() if ns is None else ns
+        last_count, last_ns = self._last[axis]
+        if pulse_count < last_count:
+            # The axis was started again
+            last_count, last_ns = -1, None
+        self._last[axis] = (pulse_count, ns)
+
+        counts = self._counts[axis]
+        first = bisect.bisect_right(counts, last_count)
+        last = bisect.bisect_right(counts, pulse_count)
+        if first >= last:
+            return 0
+
+        actions = self._actions[axis][first:last]
+        commands = b"".join(action for action in actions if isinstance(action, bytes))
+        if commands:
+            self.pthat.serial.write(commands)
+        written_ns = self.clock.monotonic_ns()
+        for action in actions:
+            if not isinstance(action, bytes):
+                action(axis, pulse_count, ns)
+
+        if last_ns is not None and pulse_count > last_count:
+            for count in counts[first:last]:
+                crossed = last_ns + (ns - last_ns) * (count - last_count) // (pulse_count - last_count)
+                self.lag.add(written_ns - crossed)
+        self.fired += last - first
+        return last - first
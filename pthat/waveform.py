@@ -0,0 +1,213 @@
+"""
+Pulse Train Hat PWM Waveforms
+=============================
+
+.. module:: pthat.waveform
+   :platform: Mac, Linux, Windows
+   :synopsis: Stream slow modulation of the PWM channels from a precomputed table of commands.
+.. moduleauthor:: Curtis White <drizztguen77@gmail.com>
+
+This contains the :class:'PWMWaveform' class and the :func:'sine_wave', :func:'triangle_wave' and :func:'ramp_wave'
+shape functions.
+
+A :class:'PWMWaveform' works out the frequency and duty cycle of both PWM channels at every update of one period of a
+waveform, such as a sine or a breathing pattern, and builds the set both channels command UA for each update up
+front. Updates whose command is the same as the one before are dropped from the table, so a slow or flat part of the
+waveform sends nothing.
+
+The table is played in one of two ways. :meth:'PWMWaveform.stream' writes each command from the host at its update
+time and measures the achieved update rate and the jitter. :meth:'PWMWaveform.buffer_program' builds a buffered
+program with wait delays between the commands that is run by the firmware with the buffer loop start, so the host is
+not involved once it has been sent.
+
+The frequency and duty cycle of each channel are a number or a function of the phase, 0.0 up to 1.0 over the period.
+
+.. code-block:: python
+
+   from pthat.pthat import PWM
+   from pthat.waveform import PWMWaveform, sine_wave
+
+   pwm = PWM("X", serial_device="/dev/ttyS0")
+   waveform = PWMWaveform(period=4.0, rate=50.0, frequency_x=1000, duty_cycle_x=sine_wave(5.0, 95.0),
+                          frequency_y=1000, duty_cycle_y=sine_wave(5.0, 95.0, phase=0.5))
+   waveform.stream(pwm, duration=20)
+   print(waveform.achieved_rate, waveform.jitter)
+"""
+import math
+
+from pthat.clock import get_clock
+from pthat.pthat import PTHat, PWM
+from pthat.sequencer import BUFFER_CAPACITY, wait_delay_commands
+from pthat.stats import RunningStats
+
+__license__ = "Apache V2"
+__docformat__ = 'reStructuredText'
+
+
+def sine_wave(low, high, phase=0.0):
+    """
+    :param low: lowest value
+    :param high: highest value
+    :param phase: fraction of the period the wave is moved on by - default 0.0
+    :returns: function of the phase going from the middle up to high, down to low and back
+    :rtype: function
+    """
+    return lambda t: low + (high - low) * (1.0 + math.sin(2.0 * math.pi * (t + phase))) / 2.0
+
+
+def triangle_wave(low, high, phase=0.0):
+    """
+    :param low: lowest value
+    :param high: highest value
+    :param phase: fraction of the period the wave is moved on by - default 0.0
+    :returns: function of the phase going from low up to high in a straight line and back
+    :rtype: function
+    """
+    return lambda t: low + (high - low) * (1.0 - abs(2.0 * ((t + phase) % 1.0) - 1.0))
+
+
+def ramp_wave(low, high, phase=0.0):
+    """
+    :param low: lowest value
+    :param high: highest value
+    :param phase: fraction of the period the wave is moved on by - default 0.0
+    :returns: function of the phase going from low up to high in a straight line and then back to low straight away
+    :rtype: function
+    """
+    return lambda t: low + (high - low) * ((t + phase) % 1.0)
+
+
+class PWMWaveform:
+    """
+    .. class:: PWMWaveform
+
+    Table of set both channels commands for one period of a waveform on the PWM channels.
+
+    :param period: length of the waveform in seconds
+    :param rate: updates a second
+    :param frequency_x: frequency of the X channel in Hz, a number or a function of the phase - default 1000
+    :param duty_cycle_x: duty cycle of the X channel 0-100%, a number or a function of the phase - default 0
+    :param frequency_y: frequency of the Y channel in Hz, a number or a function of the phase - default 1000
+    :param duty_cycle_y: duty cycle of the Y channel 0-100%, a number or a function of the phase - default 0
+    :param clock: clock used to time the updates - default the clock from :func:'pthat.clock.get_clock'
+    """
+    def __init__(self, period, rate, frequency_x=1000, duty_cycle_x=0, frequency_y=1000, duty_cycle_y=0, clock=None):
+        """
+        Constructor
+        """
+        if period <= 0 or rate <= 0:
+            raise ValueError("The period and rate must be greater than 0")
+
+        self.period = period
+        self.rate = rate
+        self.clock = get_clock() if clock is None else clock
+        self.updates = max(1, round(period * rate))
+        """
+        Number of updates in one period
+        """
+        self.table = self._build(frequency_x, duty_cycle_x, frequency_y, duty_cycle_y)
+        """
+        List of (update index, instant command bytes), leaving out the updates that are the same as the one before
+        """
+        self.jitter = RunningStats("update jitter")
+        """
+        Statistics of the time in nanoseconds between when a streamed update was due and when it was written
+        """
+        self.written = 0
+        """
+        Number of commands written by stream
+        """
+        self.skipped = 0
+        """
+        Number of updates stream did not write as they were the same as the one before
+        """
+        self._start_ns = None
+        self._end_ns = None
+
+    @property
+    def achieved_rate(self):
+        """
+        Updates a second of the last stream, counting the skipped ones
+
+        :rtype: float
+        """
+        if self._start_ns is None:
+            return 0.0
+        end = self.clock.monotonic_ns() if self._end_ns is None else self._end_ns
+        seconds = (end - self._start_ns) / 1e9
+        return (self.written + self.skipped) / seconds if seconds > 0 else 0.0
+
+    def stream(self, pthat, duration=None, should_stop=None):
+        """
+        Write the commands from the host at their update times, going round the table until the duration is up
+
+        :param pthat: PTHat, Axis, ADC, AUX or PWM object whose serial port is used
+        :param duration: seconds to run for - default None to run until should_stop returns True
+        :param should_stop: function called before every update, the run ends when it returns True - default None
+        """
+        period_ns = 1e9 / self.rate
+        commands = dict(self.table)
+        self._start_ns = self.clock.monotonic_ns()
+        self._end_ns = None
+        self.written = self.skipped = 0
+        end = None if duration is None else self._start_ns + int(duration * 1e9)
+        tick = 0
+        while not (should_stop is not None and should_stop()):
+            due = self._start_ns + int(tick * period_ns)
+            if end is not None and due >= end:
+                # Hold the last update for its whole update time
+                self.clock.sleep((due - self.clock.monotonic_ns()) / 1e9)
+                break
+            self.clock.sleep((due - self.clock.monotonic_ns()) / 1e9)
+            command = commands.get(tick % self.updates)
+            if command is None:
+                self.skipped += 1
+            else:
+                pthat.serial.write(command)
+                self.jitter.add(self.clock.monotonic_ns() - due)
+                self.written += 1
+            tick += 1
+        self._end_ns = self.clock.monotonic_ns()
+
+    def buffer_program(self, command_time=0):
+        """
+        Build a buffered program that plays the table in a loop from the buffer
+
+        :param command_time: microseconds the PTHat takes to run each buffered command, taken off the waits - default 0
+        :returns: list of commands, starting with the initiate buffer command and ending with the buffer loop start
+        :rtype: list
+        """
+        update_us = 1e6 / self.rate
+        program = []
+        for position, (index, command) in enumerate(self.table):
+            following = self.table[position + 1][0] if position + 1 < len(self.table) else self.updates
+            program.append("B" + command.decode("ascii")[1:])
+            program += wait_delay_commands(round((following - index) * update_us) - 2 * command_time)
+        if len(program) + 2 > BUFFER_CAPACITY:
+            raise ValueError(f"The program needs {len(program) + 2} commands, more than the buffer holds")
+
+        buffer = PTHat(test_mode=True)
+        return [buffer.initiate_buffer()] + program + [buffer.start_buffer_loop()]
+
+    def _build(self, frequency_x, duty_cycle_x, frequency_y, duty_cycle_y):
+        """
+        Work out and encode every update, dropping the ones that repeat the one before
+        """
+        def value(setting, phase):
+            return setting(phase) if callable(setting) else setting
+
+        builder = PWM("X", test_mode=True)
+        table = []
+        previous = None
+        for index in range(self.updates):
+            phase = index / self.updates
+            command = builder.set_both_channels(round(value(frequency_x, phase)), round(value(frequency_y, phase)),
+                                                round(value(duty_cycle_x, phase), 2),
+                                                round(value(duty_cycle_y, phase), 2))
+            if not command:
+                raise ValueError(f"Invalid PWM settings at phase {phase}")
+            command = command.encode("ascii")
+            if command != previous:
+                table.append((index, command))
+            previous = command
+        return table
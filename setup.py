@@ -8,4 +8,7 @@ setup(
     version="1.0.1",
     packages=find_packages(exclude=("tests", "examples")),
     python_requires='>=3.6',
+    entry_points={
+        "console_scripts": ["pthatd = pthat.daemon:main"],
+    },
 )
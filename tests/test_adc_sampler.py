@@ -0,0 +1,74 @@
+import unittest
+from pthat.adc_sampler import ADCSampler
+from pthat.clock import VirtualClock
+from pthat.pthat import ADC
+from pthat.simulator import SimulatedSerial
+
+
+class TestADCSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.sim.adc_values = {1: lambda ns: (ns // 10000000) % 10 * 100, 2: 512}
+        self.adc = ADC(1, serial_port=self.sim)
+
+    def test_samples_both_channels(self):
+        sampler = ADCSampler(self.adc, rate=100.0, window=10, decimation=5, clock=self.clock)
+        sampler.run(duration=1)
+
+        self.assertAlmostEqual(100.0, sampler.achieved_rate, delta=2)
+        self.assertAlmostEqual(200, sampler.samples, delta=4)
+        self.assertEqual(0, sampler.skipped)
+        self.assertEqual(512, sampler.stats[2].mean)
+        self.assertEqual(0.0, sampler.stats[2].stdev)
+        self.assertEqual(0, sampler.stats[1].min)
+        self.assertEqual(900, sampler.stats[1].max)
+        self.assertAlmostEqual(20, len(sampler.history[1]), delta=1)
+        self.assertEqual(512.0, sampler.history[2].latest()[1])
+        self.assertGreater(sampler.latency.min, 0)
+        self.assertAlmostEqual(115200 / 10 / 21 / 2, sampler.budget_rate, delta=1)
+
+    def test_depth_limits_requests(self):
+        sampler = ADCSampler(self.adc, channels=(1,), depth=1, clock=self.clock)
+        self.assertTrue(sampler.request())
+        self.assertFalse(sampler.request())
+        self.assertEqual(1, sampler.skipped)
+        self.clock.advance(0.01)
+        self.assertEqual(1, sampler.read_replies())
+        self.assertTrue(sampler.request())
+
+    def test_lost_reply(self):
+        sampler = ADCSampler(self.adc, channels=(1,), depth=1, clock=self.clock)
+        self.assertTrue(sampler.request())
+        self.clock.advance(0.01)
+        self.sim.reset_input_buffer()
+        self.assertEqual(0, sampler.read_replies())
+        self.assertFalse(sampler.request())
+        self.clock.advance(0.1)
+        self.assertTrue(sampler.request())
+        self.assertEqual(1, sampler.lost)
+        self.clock.advance(0.01)
+        self.assertEqual(1, sampler.read_replies())
+        self.assertEqual(1, sampler.samples)
+
+    def test_run_forgets_earlier_requests(self):
+        sampler = ADCSampler(self.adc, channels=(1,), depth=1, rate=10.0, clock=self.clock)
+        self.assertTrue(sampler.request())
+        self.clock.advance(0.01)
+        self.sim.reset_input_buffer()
+        sampler.run(duration=0.05)
+        self.assertEqual(0, sampler.skipped)
+        self.assertEqual(1, sampler.samples)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ADCSampler(self.adc, channels=(3,))
+        with self.assertRaises(ValueError):
+            ADCSampler(self.adc, rate=0)
+        with self.assertRaises(ValueError):
+            ADCSampler(self.adc, max_wait=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from pthat.clock import SystemClock, VirtualClock, get_clock, set_clock
+
+
+class TestClock(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock(start_ns=1000)
+
+    def tearDown(self):
+        set_clock(None)
+
+    def test_sleep_advances_instantly(self):
+        self.clock.sleep(3600)
+        self.assertEqual(1000 + 3600 * 1000000000, self.clock.monotonic_ns())
+
+    def test_callbacks_run_in_order(self):
+        calls = []
+        self.clock.call_later(2, lambda: calls.append(("b", self.clock.monotonic_ns())))
+        self.clock.call_at(1500, lambda: calls.append(("a", self.clock.monotonic_ns())))
+        self.clock.advance(1)
+        self.assertEqual([("a", 1500)], calls)
+        self.clock.run()
+        self.assertEqual([("a", 1500), ("b", 1000 + 2000000000)], calls)
+        self.assertIsNone(self.clock.next_event_ns())
+
+    def test_set_clock(self):
+        self.assertIsInstance(get_clock(), SystemClock)
+        set_clock(self.clock)
+        self.assertIs(self.clock, get_clock())
+        set_clock(None)
+        self.assertIsInstance(get_clock(), SystemClock)
+
+
+if __name__ == '__main__':
+    unittest.main()
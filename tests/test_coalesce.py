@@ -0,0 +1,78 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.coalesce import CoalescingSerial
+from pthat.pthat import Axis
+from pthat.simulator import SimulatedSerial
+
+
+class CountingSerial(SimulatedSerial):
+    """
+    Simulated serial port that keeps every write
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return super().write(data)
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = CountingSerial(clock=self.clock, timeout=0.1)
+        self.xaxis = Axis("X", command_id=1, serial_port=self.sim)
+        self.xaxis.clock = self.clock
+        self.xaxis.auto_send_command = True
+
+    def test_batch(self):
+        coalescer = CoalescingSerial.attach(self.xaxis)
+        yaxis = Axis("Y", command_id=2, serial_port=coalescer)
+        yaxis.auto_send_command = True
+        with coalescer.batch():
+            self.xaxis.set_axis(frequency=1000.0, pulse_count=2000, direction=0)
+            yaxis.set_axis(frequency=500.0, pulse_count=1000, direction=1)
+            self.xaxis.set_auto_count_pulse_out(pulse_count=500)
+            self.xaxis.start_all()
+            self.assertEqual([], self.sim.writes)
+        self.assertEqual(1, len(self.sim.writes))
+        self.assertEqual(3, coalescer.writes_saved)
+        responses = []
+        while "CI01SX*" not in responses:
+            responses += self.xaxis.get_all_responses()
+        self.assertIn("CI02CY*", responses)
+
+    def test_stop_bypasses_batch(self):
+        coalescer = CoalescingSerial.attach(self.xaxis)
+        with coalescer.batch():
+            self.xaxis.set_axis(frequency=1000.0, pulse_count=0)
+            self.xaxis.start()
+            self.xaxis.stop()
+            self.assertEqual([b"I01CX001000.000000000000000000000000*I01SX*", b"I01TX*"], self.sim.writes)
+            self.assertEqual(1, coalescer.priority_writes)
+            self.xaxis.start()
+            self.xaxis.stop_all()
+            self.assertEqual(0, coalescer.pending)
+        self.assertEqual(b"I01TA*", self.sim.writes[-1])
+        self.assertEqual(3, len(self.sim.writes))
+        responses = []
+        while "CI01TX*" not in responses:
+            responses += self.xaxis.get_all_responses()
+        self.assertFalse(self.sim.axes["X"].running)
+
+    def test_delay(self):
+        coalescer = CoalescingSerial.attach(self.xaxis, delay=0.002)
+        self.xaxis.set_axis(frequency=1000.0, pulse_count=2000, direction=0)
+        self.xaxis.set_auto_count_pulse_out(pulse_count=500)
+        self.assertEqual(0, len(self.sim.writes))
+        self.clock.advance(0.001)
+        self.assertEqual(0, len(self.sim.writes))
+        self.clock.advance(0.001)
+        self.assertEqual(1, len(self.sim.writes))
+        self.assertEqual(1, coalescer.writes_saved)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import threading
+import time
+import unittest
+from pthat.connection import Connection
+from pthat.override import FeedOverride
+from pthat.pthat import ADC, AUX, Axis
+from pthat.simulator import SimulatedSerial
+
+
+class PendingSerial(SimulatedSerial):
+    """
+    Simulated serial port with a command cut short in its output buffer
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pending = b"I00CX0010"
+        self.writes = []
+
+    @property
+    def out_waiting(self):
+        return len(self.pending)
+
+    def reset_output_buffer(self):
+        self.pending = b""
+        super().reset_output_buffer()
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return super().write(data)
+
+
+class TestConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedSerial(timeout=0.05)
+        self.sim.adc_values = {1: 100, 2: 200}
+        self.connection = Connection(serial_port=self.sim)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_threads_get_their_own_replies(self):
+        results = {}
+
+        def read_adc(adc_number):
+            adc = ADC(adc_number, test_mode=True)
+            results[adc_number] = [self.connection.request(adc.get_reading(), timeout=5).result for i in range(20)]
+
+        def toggle_aux():
+            aux = AUX(1, test_mode=True)
+            results["aux"] = [self.connection.request(command, timeout=5).replies
+                              for i in range(10) for command in (aux.output_on(), aux.output_off())]
+
+        threads = [threading.Thread(target=read_adc, args=(1,)), threading.Thread(target=read_adc, args=(2,)),
+                   threading.Thread(target=toggle_aux)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(["D10100*"] * 20, results[1])
+        self.assertEqual(["D20200*"] * 20, results[2])
+        self.assertEqual(20, len(results["aux"]))
+        self.assertTrue(all(replies[0][4:6] == replies[1][4:6] for replies in results["aux"]))
+        self.assertEqual(0, len(self.connection.allocator))
+        self.assertEqual(60, self.connection.writes)
+
+    def test_stop_all_jumps_the_queue(self):
+        axis = Axis("X", test_mode=True)
+        self.connection.request(axis.set_axis(frequency=1000.0, pulse_count=0), timeout=5)
+        start = self.connection.submit(axis.start(), received_only=True)
+        start.result(timeout=5)
+        self.connection.emergency_stop()
+        self.assertEqual(1, self.connection.priority_latency.count)
+        self.assertEqual("S", start.result().code[0])
+        deadline = time.monotonic() + 5
+        while not start.result().completed and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertTrue(start.result().completed)
+        self.assertFalse(self.sim.axes["X"].running)
+
+    def test_stop_waits_for_queued_start(self):
+        axis = Axis("X", test_mode=True)
+        self.connection.submit(axis.set_axis(frequency=1000.0, pulse_count=0))
+        self.connection.submit(axis.start(), received_only=True)
+        stop = self.connection.submit(axis.stop(), received_only=True)
+        stop.result(timeout=5)
+        self.assertEqual(0, self.connection.priority_latency.count)
+        self.assertEqual(["C", "S", "T"], [frame[3] for ns, frame in self.sim.log])
+        deadline = time.monotonic() + 5
+        while self.sim.axes["X"].running and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertFalse(self.sim.axes["X"].running)
+
+    def test_reader_survives_callback_errors(self):
+        def fail(resp):
+            raise RuntimeError(resp)
+
+        self.connection.on_reply = fail
+        adc = ADC(1, test_mode=True)
+        with self.assertLogs("pthat", "ERROR") as logs:
+            self.connection.submit(adc.get_reading(), listener=fail).result(timeout=5)
+            self.sim.write(b"I00JX0000000100000*")
+            deadline = time.monotonic() + 5
+            while len(logs.records) < 4 and time.monotonic() < deadline:
+                time.sleep(0.001)
+        self.assertGreaterEqual(len(logs.records), 4)
+        self.assertEqual("D10100*", self.connection.request(adc.get_reading(), timeout=5).result)
+
+    def test_stop_all_drops_command_taken_by_writer(self):
+        class GatedOverride(FeedOverride):
+            def __init__(self):
+                super().__init__()
+                self.taken = threading.Event()
+                self.gate = threading.Event()
+
+            def scale(self, data):
+                if b"CX" in data:
+                    self.taken.set()
+                    self.gate.wait(5)
+                return super().scale(data)
+
+        override = GatedOverride()
+        sim = SimulatedSerial(timeout=0.05)
+        connection = Connection(serial_port=sim, override=override)
+        try:
+            future = connection.submit(Axis("X", test_mode=True).set_axis(frequency=1000.0, pulse_count=0))
+            self.assertTrue(override.taken.wait(5))
+            connection.emergency_stop()
+            override.gate.set()
+            deadline = time.monotonic() + 5
+            while not future.done() and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.assertTrue(future.cancelled())
+            self.assertEqual(["I00TA"], [frame for ns, frame in sim.log])
+            self.assertEqual(0, len(connection.allocator))
+        finally:
+            connection.close()
+
+    def test_stop_all_ends_cut_short_command(self):
+        sim = PendingSerial(timeout=0.05)
+        connection = Connection(serial_port=sim)
+        try:
+            connection.emergency_stop()
+            connection.emergency_stop()
+        finally:
+            connection.close()
+        self.assertEqual([b"*I00TA*", b"I00TA*"], sim.writes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pthat.daemon import DaemonSerial, PTHatDaemon, TELEMETRY_PULSE_COUNT
+from pthat.override import FeedOverride
+from pthat.pthat import ADC, AUX, Axis, PTHat
+from pthat.simulator import SimulatedSerial
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "pthatd.sock")
+        self.sim = SimulatedSerial(timeout=0.05)
+        self.sim.adc_values[1] = 321
+        self.daemon = PTHatDaemon(self.path, serial_port=self.sim).start()
+        self.first = DaemonSerial(self.path, timeout=0.2)
+        self.second = DaemonSerial(self.path, timeout=0.2)
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        self.daemon.close()
+        self.directory.cleanup()
+
+    def wait_for(self, pthat, response):
+        responses = []
+        deadline = time.monotonic() + 5
+        while response not in responses and time.monotonic() < deadline:
+            responses += pthat.get_all_responses()
+        return responses
+
+    def test_clients_share_the_board(self):
+        self.second.subscribe(TELEMETRY_PULSE_COUNT)
+        self.assertTrue(self.first.acquire_control())
+        self.assertFalse(self.second.acquire_control())
+
+        xaxis = Axis("X", command_id=7, serial_port=self.first)
+        xaxis.auto_send_command = True
+        xaxis.set_axis(frequency=20000.0, pulse_count=2000, direction=0)
+        xaxis.set_auto_count_pulse_out(pulse_count=1000)
+        xaxis.start()
+
+        aux = AUX(1, command_id=3, serial_port=self.second)
+        aux.auto_send_command = True
+        aux.output_on()
+        adc = ADC(1, command_id=4, serial_port=self.second)
+        adc.auto_send_command = True
+        adc.get_reading()
+        self.assertIn("D10321*", self.wait_for(adc, "CI04D1*"))
+        self.assertEqual(["I03A11*"], self.second.rejected)
+
+        responses = self.wait_for(xaxis, "CI07SX*")
+        self.assertIn("RI07CX*", responses)
+        self.assertIn("XP00000002000*", responses)
+        self.assertEqual("XP00000001000*", self.second.telemetry.get(timeout=2))
+        self.assertEqual(0, self.sim.aux[1])
+
+        self.first.release_control()
+        self.assertTrue(self.second.acquire_control())
+
+    def test_only_controller_resets(self):
+        self.assertTrue(self.first.acquire_control())
+        xaxis = Axis("X", command_id=7, serial_port=self.first)
+        xaxis.auto_send_command = True
+        xaxis.set_axis(frequency=1000.0, pulse_count=0)
+        xaxis.start()
+        self.wait_for(xaxis, "RI07SX*")
+
+        # An object given its serial port leaves the board alone when it is destroyed, so no reset is sent here
+        yaxis = Axis("Y", command_id=2, serial_port=self.second)
+        yaxis.__del__()
+        pthat = PTHat(command_id=2, serial_port=self.second)
+        pthat.auto_send_command = True
+        pthat.reset()
+        deadline = time.monotonic() + 5
+        while not self.second.rejected and time.monotonic() < deadline:
+            pthat.get_all_responses()
+        self.assertEqual(["N*"], self.second.rejected)
+        self.assertTrue(self.sim.axes["X"].running)
+
+        pthat.emergency_stop()
+        deadline = time.monotonic() + 5
+        while self.sim.axes["X"].running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(self.sim.axes["X"].running)
+        self.assertEqual(["N*"], self.second.rejected)
+
+    def test_stop_all_cancels_queued_commands(self):
+        class GatedOverride(FeedOverride):
+            def __init__(self):
+                super().__init__()
+                self.taken = threading.Event()
+                self.gate = threading.Event()
+
+            def scale(self, data):
+                if b"CX" in data:
+                    self.taken.set()
+                    self.gate.wait(5)
+                return super().scale(data)
+
+        override = GatedOverride()
+        self.daemon.connection.override = override
+        xaxis = Axis("X", command_id=7, serial_port=self.second)
+        xaxis.auto_send_command = True
+        xaxis.set_axis(frequency=1000.0, pulse_count=0)
+        self.assertTrue(override.taken.wait(5))
+        aux = AUX(1, command_id=3, serial_port=self.second)
+        aux.auto_send_command = True
+        aux.output_on()
+        deadline = time.monotonic() + 5
+        while len(self.daemon.connection.allocator) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        pthat = PTHat(command_id=2, serial_port=self.first)
+        pthat.auto_send_command = True
+        pthat.emergency_stop()
+        while not self.sim.log and time.monotonic() < deadline:
+            time.sleep(0.01)
+        override.gate.set()
+        while len(self.second.cancelled) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(["I03A11*", "I07CX001000.000000000000000000000000*"], sorted(self.second.cancelled))
+        self.assertEqual([], self.first.cancelled)
+        self.assertEqual(0, self.sim.aux[1])
+
+    def test_close_without_serving(self):
+        path = os.path.join(self.directory.name, "unused.sock")
+        daemon = PTHatDaemon(path, serial_port=SimulatedSerial(timeout=0.05))
+        closing = threading.Thread(target=daemon.close, daemon=True)
+        closing.start()
+        closing.join(5)
+        self.assertFalse(closing.is_alive())
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import random
+import unittest
+from pthat import estimator
+from pthat.estimator import CycleTimeEstimator, move_time_ns
+from pthat.pthat import Axis, PTHat
+from pthat.simulator import MotionProfile
+
+
+class TestCycleTimeEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.xaxis = Axis("X", test_mode=True)
+        self.yaxis = Axis("Y", test_mode=True)
+        self.pthat = PTHat(test_mode=True)
+        self.estimator = CycleTimeEstimator(baud_rate=115200)
+        self.command_ns = 37 * 10 * 1e9 / 115200
+        self.reply_ns = int(7 * 10 * 1e9 / 115200)
+
+    def test_move_time_matches_profile(self):
+        generator = random.Random(1)
+        for i in range(200):
+            settings = (generator.uniform(1, 125000), generator.randint(1, 100000), generator.randint(0, 1),
+                        generator.randint(0, 1), generator.randint(0, 255), generator.randint(0, 255))
+            self.assertAlmostEqual(MotionProfile(*settings).duration_ns, move_time_ns(*settings), delta=1000)
+        self.assertIsNone(move_time_ns(1000.0, 0))
+
+    def test_vectorised_matches_scalar(self):
+        generator = random.Random(2)
+        commands = [self.xaxis.set_axis(frequency=round(generator.uniform(1, 125000), 3),
+                                        pulse_count=generator.randint(0, 100000), start_ramp=generator.randint(0, 1),
+                                        finish_ramp=generator.randint(0, 1), ramp_divide=generator.randint(0, 255),
+                                        ramp_pause=generator.randint(0, 255)) for i in range(500)]
+        vectorised = estimator._set_axis_moves(commands)
+        numpy = estimator.numpy
+        estimator.numpy = None
+        try:
+            scalar = estimator._set_axis_moves(commands)
+        finally:
+            estimator.numpy = numpy
+        for (settings, move), (expected_settings, expected) in zip(vectorised, scalar):
+            self.assertEqual(expected_settings, settings)
+            if expected is None:
+                self.assertIsNone(move)
+            else:
+                self.assertAlmostEqual(expected, move, delta=1)
+
+    def test_instant_move(self):
+        program = [self.xaxis.set_axis(frequency=1000.0, pulse_count=2000, start_ramp=1, finish_ramp=1,
+                                       ramp_divide=10, ramp_pause=9), self.xaxis.start()]
+        estimate = self.estimator.estimate(program)
+        self.assertEqual(2, len(estimate.segments))
+        setup, move = estimate.segments
+        self.assertEqual(0, setup.index)
+        self.assertEqual(int(self.command_ns), setup.transmit)
+        self.assertEqual(self.reply_ns, setup.replies)
+        self.assertEqual(1, move.index)
+        motion = move_time_ns(1000.0, 2000, 1, 1, 10, 9)
+        self.assertEqual(motion - self.reply_ns, move.motion)
+        self.assertEqual(setup.duration_ns, move.start_ns)
+        self.assertEqual(estimate.total_ns, sum(estimate.totals().values()))
+        self.assertEqual(motion, estimate.total_ns - setup.duration_ns - int(6 * 10 * 1e9 / 115200) - self.reply_ns)
+
+    def test_change_speed_while_moving(self):
+        program = [self.xaxis.set_axis(frequency=1000.0, pulse_count=10000), self.xaxis.start(),
+                   self.pthat.set_wait_delay("W", 5000), self.xaxis.change_speed(2000.0)]
+        estimate = self.estimator.estimate(program)
+        # Half the pulses at 1000Hz, the rest at 2000Hz
+        self.assertAlmostEqual(7.5e9, estimate.total_ns, delta=10e6)
+        self.assertEqual(5000000000, estimate.totals()["delays"])
+
+    def test_waits_for_axis_before_setting_it_again(self):
+        move = [self.xaxis.set_axis(frequency=1000.0, pulse_count=1000), self.xaxis.start()]
+        estimate = self.estimator.estimate(move * 3)
+        self.assertEqual(4, len(estimate.segments))
+        self.assertAlmostEqual(3e9, estimate.totals()["motion"], delta=5e6)
+
+    def test_buffered_program(self):
+        buffered = Axis("X", command_type="B", test_mode=True)
+        wait = PTHat(command_type="B", test_mode=True)
+        program = [self.pthat.initiate_buffer(), buffered.set_axis(frequency=1000.0, pulse_count=1000),
+                   buffered.start(), wait.set_wait_delay("W", 250), buffered.change_speed(500.0),
+                   self.pthat.start_buffer()]
+        estimate = CycleTimeEstimator(command_time=100).estimate(program)
+        totals = estimate.totals()
+        self.assertEqual(400000, totals["firmware"])
+        self.assertEqual(250000000, totals["delays"])
+        # 250 pulses at 1000Hz and 750 at 500Hz
+        self.assertAlmostEqual(1.75e9, totals["delays"] + totals["motion"], delta=5e6)
+
+    def test_runs_until_stopped(self):
+        self.assertRaises(ValueError, self.estimator.estimate, [self.xaxis.set_axis(frequency=1000.0, pulse_count=0),
+                                                                self.xaxis.start()])
+        estimate = self.estimator.estimate([self.xaxis.set_axis(frequency=1000.0, pulse_count=0), self.xaxis.start(),
+                                            self.pthat.set_wait_delay("W", 100), self.xaxis.stop()])
+        self.assertAlmostEqual(0.1e9, estimate.total_ns, delta=10e6)
+
+    def test_large_program(self):
+        axes = [self.xaxis, self.yaxis]
+        program = []
+        for i in range(20000):
+            axis = axes[i % 2]
+            program += [axis.set_axis(frequency=1000.0 + i, pulse_count=100 + i, start_ramp=1, finish_ramp=1,
+                                      ramp_divide=10, ramp_pause=1), axis.start()]
+        estimate = CycleTimeEstimator(wait_for_replies=False).estimate(program)
+        self.assertEqual(20001, len(estimate.segments))
+        self.assertEqual(0, estimate.totals()["replies"] - 20000 * self.reply_ns)
+
+
+if __name__ == '__main__':
+    unittest.main()
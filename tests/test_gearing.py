@@ -0,0 +1,68 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.gearing import MAX_CHANGE_SPEED_FREQUENCY, ElectronicGearing
+from pthat.pthat import Axis
+from pthat.simulator import SimulatedSerial
+
+
+class TestElectronicGearing(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.slave = Axis("Y", test_mode=True)
+
+    def test_slave_follows_master(self):
+        sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        master = Axis("X", command_id=1, serial_port=sim)
+        master.auto_send_command = True
+        slave = Axis("Y", command_id=2, serial_port=sim)
+        slave.auto_send_command = True
+        master.set_axis(frequency=1000.0, pulse_count=0)
+        slave.set_axis(frequency=1.0, pulse_count=0)
+        master.set_auto_count_pulse_out(pulse_count=100, xreplies=1, yreplies=1)
+        slave.start()
+        master.start()
+
+        gearing = ElectronicGearing(slave, ratio=0.5, master_axis="X", gain=2.0, clock=self.clock)
+        while self.clock.monotonic_ns() < 3000000000:
+            resp = slave.get_response()
+            if resp is not None:
+                gearing.add_reply(resp)
+
+        self.assertAlmostEqual(500.0, gearing.frequency, delta=10)
+        self.assertAlmostEqual(gearing.frequency, sim.axes["Y"].frequency)
+        self.assertLess(abs(gearing.tracking_error.last), 10)
+        self.assertGreater(gearing.commands, 1)
+        self.assertEqual(gearing.tracking_error.count, len(gearing.history))
+
+    def test_limits(self):
+        gearing = ElectronicGearing(self.slave, ratio=1000.0, gain=0.0, clock=self.clock)
+        gearing.update(0, 0)
+        self.assertEqual("I00QY125000.000*", gearing.update(1000, 1000000000))
+        self.assertEqual(MAX_CHANGE_SPEED_FREQUENCY, gearing.frequency)
+
+        sent = []
+        limited = ElectronicGearing(self.slave, ratio=1.0, gain=0.0, max_rate=1000.0, send=sent.append,
+                                    clock=self.clock)
+        limited.update(0, 0)
+        limited.update(100, 100000000)
+        self.assertEqual(100.0, limited.frequency)
+        limited.update(200, 200000000)
+        self.assertEqual(200.0, limited.frequency)
+        self.assertEqual("I00QY000100.000*", limited.update(200, 300000000))
+        self.assertEqual(3, len(sent))
+
+        steady = ElectronicGearing(self.slave, ratio=1.0, gain=0.0, clock=self.clock)
+        steady.update(0, 0)
+        self.assertEqual("I00QY001000.000*", steady.update(100, 100000000))
+        self.assertIsNone(steady.update(200, 200000000))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ElectronicGearing(self.slave, master_axis="Y")
+        with self.assertRaises(ValueError):
+            ElectronicGearing(self.slave, max_rate=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
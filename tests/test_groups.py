@@ -0,0 +1,91 @@
+import time
+import unittest
+from pthat.connection import Connection
+from pthat.groups import AxisGroup, BoardGroup
+from pthat.simulator import SimulatedSerial
+
+
+class TestBoardGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.sims = {"left": SimulatedSerial(timeout=0.05), "right": SimulatedSerial(timeout=0.05)}
+        self.group = BoardGroup(self.sims)
+
+    def tearDown(self):
+        self.group.close()
+
+    def test_start_gather_and_stop(self):
+        for board in self.group:
+            board.request(board.axis("X").set_axis(frequency=1000.0, pulse_count=0, direction=1), timeout=5)
+
+        started = self.group.start_all(timeout=5)
+        self.assertEqual({"left", "right"}, set(started))
+        self.assertEqual(1, self.group.start_skew.count)
+        self.assertGreaterEqual(self.group.start_skew.last, 0)
+        self.assertTrue(all(sim.axes["X"].running for sim in self.sims.values()))
+
+        counts = self.group.gather_pulse_counts("X", timeout=5)
+        self.assertEqual({("left", "X"), ("right", "X")}, set(counts))
+        self.assertTrue(all(count is not None and count[0] == 1 for count in counts.values()))
+
+        self.group.stop_all()
+        deadline = time.monotonic() + 5
+        while any(sim.axes["X"].running for sim in self.sims.values()) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertFalse(any(sim.axes["X"].running for sim in self.sims.values()))
+
+    def test_needs_a_board(self):
+        with self.assertRaises(ValueError):
+            BoardGroup({})
+
+
+class TestAxisGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedSerial(timeout=0.05)
+        self.connection = Connection(serial_port=self.sim)
+        self.group = AxisGroup(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_set_axes_in_one_write(self):
+        setup = self.group.set_axes({"X": {"frequency": 1000.0, "pulse_count": 20},
+                                     "Y": {"frequency": 2000.0, "pulse_count": 40, "direction": 1},
+                                     "Z": {"frequency": 4000.0, "pulse_count": 80}})
+        self.assertEqual(3, len(setup.result(timeout=5)))
+        self.assertEqual(1, self.connection.writes)
+        self.assertEqual({"X", "Y", "Z"}, self.group.configured)
+        self.assertEqual(1, self.sim.axes["Y"].direction)
+
+    def test_start_all_waits_for_every_axis(self):
+        self.group.set_axes({"X": {"frequency": 1000.0, "pulse_count": 20},
+                             "Y": {"frequency": 2000.0, "pulse_count": 80}}).result(timeout=5)
+        start = self.group.start_all().result(timeout=5)
+        self.assertTrue(start.completed)
+        self.assertEqual(["CSX", "CSY"], sorted(reply[0] + reply[4:6] for reply in start.replies[1:]))
+        self.assertFalse(any(axis.running for axis in self.sim.axes.values()))
+
+    def test_pause_resume_and_stop(self):
+        self.group.set_axes({"X": {"frequency": 1000.0, "pulse_count": 0},
+                             "E": {"frequency": 1000.0, "pulse_count": 0}}).result(timeout=5)
+        start = self.group.start_all()
+        pause = self.group.pause_all().result(timeout=5)
+        self.assertEqual(2, sum(reply[0] == "D" for reply in pause.replies))
+        self.assertTrue(self.sim.axes["E"].paused)
+        resume = self.group.resume_all().result(timeout=5)
+        self.assertEqual(2, sum(reply[0] == "C" for reply in resume.replies))
+        self.group.stop_all().result(timeout=5)
+        self.assertTrue(start.result(timeout=5).completed)
+
+    def test_invalid_axes(self):
+        with self.assertRaises(ValueError):
+            AxisGroup(self.connection, axes="XW")
+        with self.assertRaises(ValueError):
+            AxisGroup(self.connection, axes="X").set_axes({"Y": {"frequency": 1000.0}})
+        with self.assertRaises(ValueError):
+            self.group.start_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import logging
+import time
+import unittest
+from pthat.clock import VirtualClock
+from pthat.connection import Connection
+from pthat.hooks import CommandCounters, CommandTiming, HookRegistry, StructuredLog, registry
+from pthat.pthat import ADC, Axis
+from pthat.simulator import SimulatedSerial
+
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.xaxis = Axis("X", command_id=1, serial_port=self.sim)
+        self.xaxis.clock = self.clock
+        self.xaxis.auto_send_command = True
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_registry(self):
+        hooks = HookRegistry()
+        self.assertFalse(hooks.sending)
+        self.assertRaises(ValueError, hooks.add, "on_send", print)
+        hooks.add("post_send", print)
+        self.assertTrue(hooks.sending)
+        self.assertEqual((print,), hooks.post_send)
+        hooks.remove("post_send", print)
+        self.assertFalse(hooks.sending)
+        self.assertEqual((), hooks.post_send)
+        counters = hooks.attach(CommandCounters())
+        self.assertEqual(1, len(hooks.pre_send) + len(hooks.post_send))
+        hooks.detach(counters)
+        self.assertEqual((), hooks.pre_send + hooks.on_reply + hooks.on_validate_failure)
+
+    def test_send_and_reply(self):
+        calls = []
+        registry.add("pre_send", lambda source, data: calls.append(("pre", source, data)))
+        registry.add("post_send", lambda source, data, ns: calls.append(("post", source, data)))
+        registry.add("on_reply", lambda source, reply: calls.append(("reply", source, reply)))
+        command = self.xaxis.set_axis(frequency=1000.0, pulse_count=100).encode("ascii")
+        self.assertEqual([("pre", self.xaxis, command), ("post", self.xaxis, command)], calls)
+        self.assertEqual(["RI01CX*", "CI01CX*"], self.xaxis.get_all_responses())
+        self.assertEqual([("reply", self.xaxis, "RI01CX*"), ("reply", self.xaxis, "CI01CX*")], calls[2:])
+        self.xaxis.emergency_stop()
+        self.assertEqual(("post", self.xaxis, b"I00TA*"), calls[-1])
+
+    def test_validate_failure(self):
+        messages = []
+        registry.add("on_validate_failure", lambda source, message: messages.append((source, message)))
+        self.assertFalse(self.xaxis.change_speed(200000.0))
+        self.assertTrue(ADC(1, test_mode=True).get_reading())
+        self.xaxis.command_id = 100
+        self.assertFalse(self.xaxis.get_io_port_status())
+        self.assertEqual([(self.xaxis, "Invalid frequency 200000.0. Must be between 0.0 and 125000.0"),
+                          (self.xaxis, "Invalid command ID 100")], messages)
+
+    def test_counters_and_timing(self):
+        counters = registry.attach(CommandCounters())
+        timing = registry.attach(CommandTiming(clock=self.clock))
+        self.xaxis.set_axis(frequency=1000.0, pulse_count=100)
+        self.xaxis.get_all_responses()
+        self.xaxis.start()
+        self.xaxis.get_all_responses()
+        self.assertEqual({"CX": 1, "SX": 1}, counters.commands)
+        self.assertEqual(2, counters.writes)
+        self.assertEqual(43, counters.bytes_sent)
+        self.assertEqual({"R": 2, "C": 2}, counters.replies)
+        self.assertEqual(2, timing.write_time.count)
+        self.assertEqual(2, timing.round_trip.count)
+        self.assertEqual(2, timing.completion.count)
+        self.assertAlmostEqual(100000000, timing.completion.max, delta=1000000)
+
+    def test_structured_log(self):
+        logger = logging.getLogger("pthat.test")
+        registry.attach(StructuredLog(logger, level=logging.INFO))
+        with self.assertLogs(logger, logging.INFO) as logs:
+            self.xaxis.get_current_pulse_count()
+            self.xaxis.change_speed(-1.0)
+        self.assertEqual(["pre_send", "post_send", "on_validate_failure"],
+                         [record.event for record in logs.records])
+        self.assertEqual("I01XP*", logs.records[0].command)
+
+    def test_connection(self):
+        counters = registry.attach(CommandCounters())
+        with Connection(serial_port=SimulatedSerial(timeout=0.05)) as connection:
+            connection.request(Axis("X", test_mode=True).get_current_pulse_count(), timeout=5)
+            deadline = time.monotonic() + 5
+            while counters.replies.get("C", 0) < 1 and time.monotonic() < deadline:
+                time.sleep(0.001)
+        self.assertEqual({"XP": 1}, counters.commands)
+        self.assertEqual(1, counters.replies["R"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.io_watcher import INPUT_EMERGENCY_STOP, INPUT_X_LIMIT, INPUT_Y_LIMIT, IOPortWatcher
+from pthat.pthat import Axis
+from pthat.simulator import SimulatedSerial
+
+
+class TestIOPortWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.sim.inputs = 0b10000
+        self.axis = Axis("X", command_id=1, serial_port=self.sim)
+        self.axis.auto_send_command = True
+        self.edges = []
+
+    def record(self, bit, level, ns):
+        self.edges.append((bit, level))
+
+    def test_edges_and_stop(self):
+        self.axis.set_axis(frequency=1000.0, pulse_count=0)
+        self.axis.start()
+        watcher = IOPortWatcher(self.axis, rate=100.0, stop_on_falling=INPUT_EMERGENCY_STOP, clock=self.clock)
+        watcher.on_rising(INPUT_X_LIMIT | INPUT_Y_LIMIT, self.record)
+        watcher.on_falling(INPUT_X_LIMIT | INPUT_EMERGENCY_STOP, self.record)
+
+        self.clock.call_at(100000000, lambda: setattr(self.sim, "inputs", 0b11100))
+        self.clock.call_at(200000000, lambda: setattr(self.sim, "inputs", 0b10100))
+        self.clock.call_at(300000000, lambda: setattr(self.sim, "inputs", 0b00100))
+        watcher.run(duration=0.5)
+
+        self.assertEqual([(INPUT_Y_LIMIT, 1), (INPUT_X_LIMIT, 1), (INPUT_X_LIMIT, 0), (INPUT_EMERGENCY_STOP, 0)],
+                         self.edges)
+        self.assertEqual(4, watcher.edges)
+        self.assertEqual(3, watcher.latency.count)
+        self.assertLess(watcher.latency.max, 20000000)
+        self.assertEqual(0b00100, watcher.inputs)
+        self.assertEqual(1, watcher.stops)
+        self.assertFalse(self.sim.axes["X"].running)
+        self.assertAlmostEqual(50, watcher.polls, delta=1)
+
+    def test_no_edges_without_change(self):
+        watcher = IOPortWatcher(self.axis, clock=self.clock)
+        watcher.on_rising(INPUT_X_LIMIT, self.record)
+        watcher.update(0b00000, 0)
+        watcher.update(0b00000, 1)
+        watcher.update(0b01000, 2)
+        self.assertEqual([(INPUT_X_LIMIT, 1)], self.edges)
+        with self.assertRaises(ValueError):
+            watcher.on_rising(0b100000, self.record)
+
+    def test_lost_reply(self):
+        watcher = IOPortWatcher(self.axis, max_wait=0.05, clock=self.clock)
+        self.assertTrue(watcher.request())
+        while self.sim.read_until(b"*") != b"L10000*":
+            pass
+        self.clock.advance(0.04)
+        self.assertFalse(watcher.request())
+        self.clock.advance(0.01)
+        self.assertTrue(watcher.request())
+        self.assertEqual(1, watcher.lost)
+        self.clock.advance(0.01)
+        self.assertEqual(1, watcher.read_replies())
+        self.assertEqual(0b10000, watcher.inputs)
+        with self.assertRaises(ValueError):
+            IOPortWatcher(self.axis, max_wait=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import time
+import unittest
+from pthat.connection import Connection
+from pthat.override import FeedOverride
+from pthat.pthat import Axis
+from pthat.simulator import SimulatedSerial
+
+
+class TestFeedOverride(unittest.TestCase):
+
+    def test_scale(self):
+        override = FeedOverride(1.5)
+        self.assertEqual(b"I00CX001500.000000000100011100100000*B01QY000150.000*I02AX1*",
+                         override.scale(b"I00CX001000.000000000100011100100000*B01QY000100.000*I02AX1*"))
+        self.assertEqual({"X": 1000.0, "Y": 100.0}, override.programmed)
+        self.assertEqual(2, override.scaled)
+        self.assertEqual(b"I00QX125000.000*", override.scale(b"I00QX100000.000*"))
+        self.assertEqual(b"I00CX150000.000000000100011100100000*",
+                         override.scale(b"I00CX100000.000000000100011100100000*"))
+
+    def test_unchanged(self):
+        override = FeedOverride()
+        data = b"I00CX001000.000000000100011100100000*"
+        self.assertIs(data, override.scale(data))
+        self.assertEqual({"X": 1000.0}, override.programmed)
+
+    def test_limits(self):
+        self.assertRaises(ValueError, FeedOverride, 2.0)
+        override = FeedOverride()
+        self.assertRaises(ValueError, override.set, 0.4)
+        self.assertEqual(1.0, override.factor)
+
+    def test_moving_axes(self):
+        override = FeedOverride()
+        override.scale(b"I00CX001000.000000000100011100100000*I01CY000500.000000000100011100100000*")
+        override.scale(b"I02SA*")
+        self.assertEqual({"X", "Y"}, override.moving)
+        self.assertEqual(["I00QX001000.000*", "I00QY000500.000*"], override.set(0.8))
+        override.add_reply("CI02SX*")
+        self.assertEqual(["B05QY000500.000*"], override.set(1.2, "B", 5))
+        override.add_reply("CI03TY*")
+        self.assertEqual([], override.set(1.0))
+
+    def test_beyond_change_speed(self):
+        override = FeedOverride()
+        override.scale(b"I00CX300000.000000000100011100100000*I01CY110000.000000000100011100100000*I02SA*")
+        self.assertEqual({"X", "Y"}, override.moving)
+        self.assertEqual(["I00QY110000.000*"], override.set(1.0))
+        self.assertEqual([], override.set(1.2))
+        self.assertEqual(["I00QY110000.000*"], override.set(0.8))
+
+
+class TestConnectionFeedOverride(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedSerial(timeout=0.05)
+        self.override = FeedOverride()
+        self.connection = Connection(serial_port=self.sim, override=self.override)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_no_override(self):
+        connection = Connection(serial_port=SimulatedSerial(timeout=0.05))
+        try:
+            self.assertRaises(ValueError, connection.set_feed_override, 1.2)
+        finally:
+            connection.close()
+
+    def test_queued_and_moving(self):
+        xaxis = Axis("X", test_mode=True)
+        self.connection.set_feed_override(0.5)
+        self.connection.request(xaxis.set_axis(frequency=1000.0, pulse_count=0), timeout=5)
+        self.assertEqual(500.0, self.sim.axes["X"].frequency)
+        self.connection.submit(xaxis.start(), received_only=True).result(timeout=5)
+        self.assertEqual({"X"}, self.override.moving)
+
+        futures = self.connection.set_feed_override(1.5)
+        self.assertEqual(1, len(futures))
+        self.assertEqual("QX", futures[0].result(timeout=5).code)
+        self.assertEqual(1500.0, self.sim.axes["X"].frequency)
+
+        self.connection.emergency_stop()
+        deadline = time.monotonic() + 5
+        while self.override.moving and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(set(), self.override.moving)
+
+    def test_reset_forgets_moving(self):
+        xaxis = Axis("X", test_mode=True)
+        self.connection.request(xaxis.set_axis(frequency=1000.0, pulse_count=0), timeout=5)
+        self.connection.submit(xaxis.start(), received_only=True).result(timeout=5)
+        self.assertEqual({"X"}, self.override.moving)
+        self.connection.emergency_stop(reset=True)
+        self.assertEqual(set(), self.override.moving)
+        self.assertEqual([], self.connection.set_feed_override(1.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
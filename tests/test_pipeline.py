@@ -0,0 +1,73 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pipeline import CommandIDAllocator, Pipeline
+from pthat.pthat import ADC, Axis
+from pthat.simulator import SimulatedSerial
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.xaxis = Axis("X", serial_port=self.sim)
+        self.yaxis = Axis("Y", serial_port=self.sim)
+        self.adc = ADC(1, serial_port=self.sim)
+        self.sim.adc_values[1] = 512
+        self.pipeline = Pipeline(self.xaxis, CommandIDAllocator(clock=self.clock))
+
+    def test_allocator_rotates_ids(self):
+        allocator = CommandIDAllocator(first_id=1, last_id=3, clock=self.clock)
+        first = [allocator.assign("I00LI*") for i in range(3)]
+        self.assertEqual(["I01LI*", "I02LI*", "I03LI*"], [command for command, entry in first])
+        self.assertIsNone(allocator.assign("I00LI*"))
+        self.assertEqual(("N*", None), allocator.assign("N*"))
+        allocator.handle_reply("RI02LI*")
+        allocator.handle_reply("L00000*")
+        self.assertEqual("L00000*", first[1][1].result)
+        self.assertIs(first[1][1], allocator.handle_reply("CI02LI*"))
+        self.assertEqual(2, len(allocator))
+        self.assertEqual("I02LI*", allocator.assign("I00LI*")[0])
+
+    def test_result_needs_matching_command(self):
+        allocator = CommandIDAllocator(clock=self.clock)
+        command, status = allocator.assign("I00LI*")
+        command, pulses = allocator.assign("I00XP*")
+        command, adc = allocator.assign("I00D1*")
+        self.assertIsNone(allocator.handle_reply("XP00000001000*"))
+        allocator.handle_reply("RI00LI*")
+        allocator.handle_reply("RI01XP*")
+        allocator.handle_reply("RI02D1*")
+        self.assertIs(adc, allocator.handle_reply("D10512*"))
+        self.assertIs(status, allocator.handle_reply("L00000*"))
+        self.assertIs(pulses, allocator.handle_reply("XP00000001000*"))
+        self.assertIsNone(allocator.handle_reply("XP00000002000*"))
+        self.assertEqual(("L00000*", "XP00000001000*", "D10512*"), (status.result, pulses.result, adc.result))
+
+    def test_pipelined_setup(self):
+        commands = self.pipeline.run([self.xaxis.set_axis(frequency=1000.0, pulse_count=2000, direction=0),
+                                      self.yaxis.set_axis(frequency=500.0, pulse_count=1000, direction=1),
+                                      self.adc.get_reading(),
+                                      self.xaxis.get_io_port_status()])
+        self.assertEqual([0, 1, 2, 3], [c.command_id for c in commands])
+        self.assertTrue(all(c.completed for c in commands))
+        self.assertEqual("D10512*", commands[2].result)
+        self.assertEqual("L00000*", commands[3].result)
+        self.assertEqual(0, len(self.pipeline.allocator))
+        self.assertEqual(4, self.pipeline.allocator.round_trip.count)
+        # One round trip for the whole sequence, not one per command
+        wire_ns = sum(len(c.command) for c in commands) * 10 * 1e9 / 115200
+        self.assertLess(self.clock.monotonic_ns(), 2 * wire_ns + 1000000)
+
+    def test_stop_completes_on_received(self):
+        self.pipeline.run([self.xaxis.set_axis(frequency=1000.0, pulse_count=0)])
+        start = self.pipeline.send(self.xaxis.start())
+        self.clock.advance(0.5)
+        stop = self.pipeline.send(self.xaxis.stop())
+        self.assertTrue(self.pipeline.wait([start, stop]))
+        self.assertNotEqual(start.command_id, stop.command_id)
+        self.assertTrue(start.completed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import unittest
+from unittest import mock
+import serial
+from pthat.process_serial import ProcessSerial
+from pthat.pthat import ADC, Axis
+
+
+def exit_at_once(*args):
+    os._exit(1)
+
+
+class TestProcessSerial(unittest.TestCase):
+
+    def setUp(self):
+        self.port = ProcessSerial(simulate=True, timeout=0.5, capacity=256)
+
+    def tearDown(self):
+        self.port.close()
+
+    def wait_for(self, pthat, response):
+        responses = []
+        for i in range(20):
+            responses += pthat.get_all_responses()
+            if response in responses:
+                break
+        return responses
+
+    def test_axis_through_child_process(self):
+        xaxis = Axis("X", command_id=1, serial_port=self.port)
+        xaxis.auto_send_command = True
+        xaxis.set_axis(frequency=20000.0, pulse_count=4000, direction=0)
+        xaxis.set_auto_count_pulse_out(pulse_count=1000)
+        xaxis.start()
+        responses = self.wait_for(xaxis, "CI01SX*")
+        self.assertEqual(["XP00000001000*", "XP00000002000*", "XP00000003000*", "XP00000004000*"],
+                         [r for r in responses if r.startswith("XP")])
+
+        adc = ADC(1, command_id=2, serial_port=self.port)
+        adc.auto_send_command = True
+        for i in range(20):
+            adc.get_reading()
+        responses = self.wait_for(adc, "CI02D1*")
+        while responses.count("CI02D1*") < 20:
+            responses += adc.get_all_responses()
+        self.assertEqual(20, responses.count("D10000*"))
+        self.assertEqual(0, self.port.out_waiting)
+
+    @unittest.skipUnless(hasattr(signal, "SIGSTOP"), "processes can not be paused")
+    def test_stop_all_discards_queued_commands(self):
+        xaxis = Axis("X", command_id=1, serial_port=self.port)
+        xaxis.auto_send_command = True
+        xaxis.set_axis(frequency=1000.0, pulse_count=0)
+        xaxis.start()
+        self.assertIn("RI01SX*", self.wait_for(xaxis, "RI01SX*"))
+
+        # Pause the child process so the ADC readings are still queued when stop all is sent. Setting the doorbell
+        # event waits for the paused child to wake, so a plain event stands in for it, and stop all, which waits for
+        # the child to write it, is sent from another thread.
+        pid = self.port._process.pid
+        doorbell, self.port._command_ready = self.port._command_ready, threading.Event()
+        os.kill(pid, signal.SIGSTOP)
+        try:
+            adc = ADC(1, command_id=2, serial_port=self.port)
+            adc.auto_send_command = True
+            for i in range(5):
+                adc.get_reading()
+            queued = self.port.out_waiting
+            self.assertGreater(queued, 0)
+            stop = threading.Thread(target=xaxis.stop_all)
+            stop.start()
+            deadline = time.monotonic() + 5
+            while self.port.out_waiting <= queued and time.monotonic() < deadline:
+                time.sleep(0.001)
+        finally:
+            self.port._command_ready = doorbell
+            os.kill(pid, signal.SIGCONT)
+        stop.join(5)
+        responses = self.wait_for(xaxis, "CI01SX*")
+        self.assertIn("RI01TA*", responses)
+        self.assertIn("CI01SX*", responses)
+        self.assertNotIn("RI02D1*", responses)
+
+    def test_write_after_child_exits(self):
+        self.port._stop.set()
+        self.port._process.join(5)
+        with self.assertRaises(serial.SerialException):
+            self.port.write(b"I00LI*" * 100)
+
+    def test_open_error(self):
+        with self.assertRaises(serial.SerialException):
+            ProcessSerial(serial_device="/dev/pthat-missing", timeout=0.5, capacity=256)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "fork is not available")
+    def test_child_dies_before_reporting(self):
+        with mock.patch("pthat.process_serial._serve", exit_at_once):
+            with self.assertRaises(serial.SerialException):
+                ProcessSerial(simulate=True, capacity=256, start_method="fork")
+
+
+if __name__ == '__main__':
+    unittest.main()
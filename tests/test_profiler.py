@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+from pthat.clock import VirtualClock
+from pthat.profiler import CycleProfiler, ProfilingSerial
+from pthat.pthat import Axis
+from pthat.simulator import SimulatedSerial
+
+
+class TestCycleProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.xaxis = Axis("X", command_id=1, serial_port=self.sim)
+        self.profiler = CycleProfiler(baud_rate=115200, clock=self.clock)
+        self.profiler.attach(self.xaxis)
+
+    def wait_for(self, reply):
+        while reply not in self.xaxis.get_all_responses():
+            pass
+
+    def test_attach(self):
+        serial = self.xaxis.serial
+        self.assertIsInstance(serial, ProfilingSerial)
+        self.assertIs(serial, self.profiler.attach(self.xaxis))
+        self.assertEqual(0, serial.out_waiting)
+
+    def test_categories(self):
+        with self.profiler.segment("set up"):
+            self.xaxis.send_command(self.xaxis.set_axis(frequency=1000.0, pulse_count=500))
+            self.wait_for("CI01CX*")
+        self.clock.advance(0.02)
+        with self.profiler.segment("move"):
+            self.xaxis.send_command(self.xaxis.start())
+            self.wait_for("CI01SX*")
+
+        self.assertEqual(["set up", "job", "move"], list(self.profiler.times))
+        setup = self.profiler.times["set up"]
+        self.assertEqual(int(37 * 10 * 1e9 / 115200), setup["transmit"])
+        self.assertNotIn("completed", setup)
+        self.assertEqual({"compute": 20000000}, self.profiler.times["job"])
+        move = self.profiler.times["move"]
+        self.assertAlmostEqual(500000000, move["completed"], delta=1000000)
+        self.assertEqual(int(6 * 10 * 1e9 / 115200), move["transmit"])
+        # The read after the last reply times out with nothing more to come
+        self.assertEqual(100000000, move["idle"])
+        self.assertEqual(self.clock.perf_counter_ns(), sum(self.profiler.totals().values()))
+
+    def test_reports(self):
+        with self.profiler.segment("move"):
+            self.xaxis.send_command(self.xaxis.set_axis(frequency=1000.0, pulse_count=100))
+            self.wait_for("CI01CX*")
+            self.xaxis.send_command(self.xaxis.start())
+            self.wait_for("CI01SX*")
+
+        folded = self.profiler.folded().splitlines()
+        self.assertIn("move;completed", [line.split(" ")[0] for line in folded])
+        report = self.profiler.report()
+        self.assertTrue(report.startswith("move "))
+        self.assertIn("completed", report)
+
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        self.profiler.save_chrome_trace(path)
+        with open(path) as f:
+            trace = json.load(f)
+        events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        self.assertEqual({"segment", "wire", "received", "completed", "idle"},
+                         {event["cat"] for event in events})
+        segment = [event for event in events if event["cat"] == "segment"][0]
+        self.assertEqual("move", segment["name"])
+        self.assertEqual(0, segment["ts"])
+        self.profiler.reset()
+        self.assertEqual({}, self.profiler.times)
+
+
+if __name__ == '__main__':
+    unittest.main()
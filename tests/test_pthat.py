@@ -1,5 +1,31 @@
 import unittest
-from pthat.pthat import PTHat
+from pthat.clock import VirtualClock
+from pthat.pthat import Axis, PTHat
+from pthat.simulator import SimulatedSerial
+
+
+class PendingSerial:
+    """
+    Serial like object with bytes still waiting in its output buffer
+    """
+    def __init__(self, pending):
+        self.pending = pending
+        self.written = b""
+
+    @property
+    def out_waiting(self):
+        return len(self.pending)
+
+    def reset_output_buffer(self):
+        self.pending = b""
+
+    def write(self, data):
+        self.written += self.pending + data
+        self.pending = b""
+        return len(data)
+
+    def flush(self):
+        pass
 
 
 class TestPthat(unittest.TestCase):
@@ -50,6 +76,29 @@ class TestPthat(unittest.TestCase):
     def test_reset(self):
         self.assertEqual("N*", self.pthat.reset())
 
+    def test_emergency_stop_discards_pending_output(self):
+        port = PendingSerial(b"I01CX001000.000000")
+        pthat = PTHat(serial_port=port)
+        self.assertEqual("I00TA*", pthat.emergency_stop())
+        self.assertEqual(b"*I00TA*", port.written)
+        self.assertEqual("N*", pthat.emergency_stop(reset=True))
+        self.assertEqual(b"*I00TA*N*", port.written)
+        self.assertEqual(2, pthat.priority_latency.count)
+
+    def test_stop_all_uses_priority_lane(self):
+        clock = VirtualClock()
+        sim = SimulatedSerial(clock=clock, timeout=0.1)
+        axis = Axis("X", command_id=1, serial_port=sim)
+        axis.clock = clock
+        axis.auto_send_command = True
+        axis.set_axis(frequency=1000.0, pulse_count=0)
+        axis.start()
+        clock.advance(1)
+        axis.stop_all()
+        self.assertEqual(1, axis.priority_latency.count)
+        clock.advance(1)
+        self.assertIn("CI01SX*", axis.get_all_responses())
+
     def test_rpm_to_frequency(self):
         self.assertEqual(self.pthat.rpm_to_frequency(rpm=800, steps_per_rev=200, round_digits=0), 2667)
 
@@ -23,6 +23,11 @@ class TestPwm(unittest.TestCase):
     def test_set_both_channels(self):
         self.assertEqual("I00UA000000000000000000000000*", self.pwm.set_both_channels())
 
+    def test_fractional_duty_cycle_and_repeat(self):
+        self.assertEqual("I00UA000100008050000200002500*", self.pwm.set_both_channels(1000, 2000, 80.5, 25))
+        self.assertEqual("I00UA000100008050000200002500*", self.pwm.set_both_channels())
+        self.assertEqual("I00UX000100001234*", self.pwm.set_channel(frequency=1000, duty_cycle=12.34))
+
 
 if __name__ == '__main__':
     unittest.main()
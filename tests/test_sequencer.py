@@ -0,0 +1,57 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pthat import AUX
+from pthat.sequencer import AUXSequencer
+from pthat.simulator import SimulatedSerial
+
+
+class TestAUXSequencer(unittest.TestCase):
+
+    def test_compile(self):
+        sequencer = AUXSequencer()
+        sequencer.add_pulses(1, width=500, period=15000, count=2)
+        sequencer.add_pulses(2, width=15500, delay=0)
+        self.assertEqual(["B00A11*", "B00A21*", "B00WM0500*", "B00A10*", "B00WW0014*", "B00WM0500*", "B00A11*",
+                          "B00WM0500*", "B00A10*", "B00A20*"], sequencer.compile())
+        self.assertEqual("H0000*", sequencer.program()[0])
+        self.assertEqual("Z0000*", sequencer.program()[-1])
+
+    def test_periodic_pattern_runs_in_a_loop(self):
+        clock = VirtualClock()
+        sim = SimulatedSerial(clock=clock, timeout=0.1)
+        aux = AUX(1, serial_port=sim)
+        sequencer = AUXSequencer(cycle=50000, command_time=sim.command_ns // 1000)
+        sequencer.add_pulses(1, width=2000, count=None)
+        sequencer.add_pulses(3, width=20000, delay=10000)
+        self.assertEqual("W0000*", sequencer.send(aux)[-1])
+
+        clock.advance(0.5)
+        sim.read(0)
+        starts = [ns for ns, frame in sim.log if frame == "B00A11"]
+        self.assertGreaterEqual(len(starts), 9)
+        for first, second in zip(starts, starts[1:]):
+            self.assertAlmostEqual(50000000, second - first, delta=2000)
+        aux.emergency_stop()
+        clock.advance(0.2)
+        sim.read(0)
+        self.assertEqual(len(starts), len([ns for ns, frame in sim.log if frame == "B00A11"]))
+
+    def test_invalid_patterns(self):
+        sequencer = AUXSequencer(cycle=10000)
+        with self.assertRaises(ValueError):
+            sequencer.add_pulses(4, width=100)
+        with self.assertRaises(ValueError):
+            sequencer.add_pulses(1, width=200, period=100)
+        with self.assertRaises(ValueError):
+            sequencer.compile()
+        sequencer.add_pulses(1, width=5000, delay=8000)
+        with self.assertRaises(ValueError):
+            sequencer.compile()
+        too_long = AUXSequencer(capacity=10)
+        too_long.add_pulses(1, width=100, period=200, count=10)
+        with self.assertRaises(ValueError):
+            too_long.compile()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import time
+import unittest
+from pthat.pthat import Axis
+from pthat.session import RECEIVED, SENT, ReplaySerial, Session, SessionRecorder
+
+
+class LoopbackSerial:
+    """
+    Serial port that answers every command with received and completed replies
+    """
+    def __init__(self):
+        self.replies = b""
+
+    def write(self, data):
+        command = data[3:-1]
+        self.replies += b"RI01" + command + b"*CI01" + command + b"*"
+        return len(data)
+
+    def read_until(self, expected=b"\n", size=None):
+        end = self.replies.find(expected) + 1
+        data, self.replies = self.replies[:end], self.replies[end:]
+        return data
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.axis = Axis("X", command_id=1, serial_port=LoopbackSerial())
+
+    def test_record(self):
+        recorder = SessionRecorder()
+        recorder.attach(self.axis)
+        self.axis.send_command(self.axis.get_current_pulse_count())
+        self.assertEqual(["RI01XP*", "CI01XP*"], self.axis.get_all_responses())
+        self.assertEqual([SENT, RECEIVED, RECEIVED], [e[1] for e in recorder.session.events])
+        self.assertEqual([b"I01XP*"], recorder.session.commands())
+
+    def test_save_load(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            events = [(1, SENT, b"I01XP*"), (2, RECEIVED, b"RI01XP*"), (3, RECEIVED, b"a\\x41\\\n\r\xff *")]
+            Session(events).save(path)
+            self.assertEqual(events, Session.load(path).events)
+        finally:
+            os.remove(path)
+
+    def test_replay_as_fast_as_possible(self):
+        session = Session([(0, RECEIVED, b"X*"), (10, SENT, b"I01XP*"), (5000000000, RECEIVED, b"RI01XP*")])
+        replay = ReplaySerial(session, realtime=False)
+        axis = Axis("X", command_id=1, serial_port=replay)
+        self.assertEqual(["X*"], axis.get_all_responses())
+        axis.send_command(axis.get_current_pulse_count())
+        start = time.monotonic()
+        self.assertEqual(["RI01XP*"], axis.get_all_responses())
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(0, replay.mismatches)
+
+    def test_replay_realtime(self):
+        session = Session([(0, SENT, b"I01XP*"), (20000000, RECEIVED, b"RI01XP*")])
+        replay = ReplaySerial(session, realtime=True)
+        replay.write(b"I01SX*")
+        self.assertEqual(0, replay.in_waiting)
+        start = time.monotonic()
+        self.assertEqual(b"RI01XP*", replay.read_until(b"*"))
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+        self.assertEqual(1, replay.mismatches)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pthat import ADC, AUX, Axis, PTHat
+from pthat.simulator import MotionProfile, SimulatedSerial
+
+
+class TestSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.axis = Axis("X", command_id=1, serial_port=self.sim)
+        self.axis.auto_send_command = True
+
+    def wait_for(self, pthat, response):
+        responses = []
+        while response not in responses:
+            responses += pthat.get_all_responses()
+        return responses
+
+    def test_motion_profile(self):
+        profile = MotionProfile(1000.0, 10000)
+        self.assertEqual(10000000000, profile.duration_ns)
+        self.assertEqual(500, profile.pulses_at(500000000))
+        self.assertEqual(250000000, profile.time_for_pulses(250))
+        ramped = MotionProfile(1000.0, 10000, start_ramp=1, finish_ramp=1, ramp_divide=10, ramp_pause=9)
+        self.assertGreater(ramped.duration_ns, profile.duration_ns)
+        self.assertEqual(10000, ramped.pulses_at(ramped.duration_ns))
+
+    def test_hour_long_move_with_auto_count(self):
+        self.axis.set_axis(frequency=1000.0, pulse_count=3600000)
+        self.axis.set_auto_count_pulse_out(pulse_count=1200000)
+        self.axis.start()
+        responses = self.wait_for(self.axis, "CI01SX*")
+        self.assertEqual(["XP00001200000*", "XP00002400000*", "XP00003600000*"],
+                         [r for r in responses if r.startswith("XP")])
+        self.assertAlmostEqual(3600, self.clock.monotonic_ns() / 1e9, delta=1)
+
+    def test_stop_and_pulse_count(self):
+        self.axis.set_axis(frequency=1000.0, pulse_count=0)
+        self.axis.start()
+        self.clock.advance(2)
+        self.axis.get_current_pulse_count()
+        responses = self.wait_for(self.axis, "CI01XP*")
+        count = int([r for r in responses if r.startswith("XP0")][0][3:-1])
+        self.assertAlmostEqual(2000, count, delta=5)
+        self.axis.stop()
+        self.assertIn("CI01TX*", self.wait_for(self.axis, "CI01SX*"))
+
+    def test_stop_completed_has_start_id(self):
+        self.axis.set_axis(frequency=1000.0, pulse_count=0)
+        self.axis.start()
+        self.wait_for(self.axis, "RI01SX*")
+        stopper = Axis("X", command_id=5, serial_port=self.sim)
+        stopper.send_command(stopper.stop())
+        responses = self.wait_for(stopper, "CI01TX*")
+        self.assertIn("RI05TX*", responses)
+        self.assertNotIn("CI05TX*", responses)
+
+    def test_adc_port_status_and_wait(self):
+        self.sim.adc_values[2] = 1023
+        self.sim.inputs = 0b10001
+        adc = ADC(2, command_id=2, serial_port=self.sim)
+        adc.send_command(adc.get_reading())
+        self.assertIn("D21023*", self.wait_for(adc, "CI02D2*"))
+        pthat = PTHat(command_id=3, serial_port=self.sim)
+        pthat.send_command(pthat.get_io_port_status())
+        self.assertIn("L10001*", self.wait_for(pthat, "CI03LI*"))
+        start = self.clock.monotonic_ns()
+        pthat.send_command(pthat.set_wait_delay(period="W", delay=500))
+        self.wait_for(pthat, "CI03WW*")
+        self.assertGreaterEqual(self.clock.monotonic_ns() - start, 500000000)
+
+    def test_buffer_loop(self):
+        aux = AUX(1, command_type="B", command_id=4, serial_port=self.sim)
+        for command in (aux.initiate_buffer(), aux.output_on(), aux.set_wait_delay("W", 10), aux.output_off(),
+                        aux.set_wait_delay("W", 10), aux.start_buffer_loop()):
+            aux.send_command(command)
+        self.clock.advance(0.1)
+        self.sim.read(0)
+        switches = [ns for ns, frame in self.sim.log if frame.startswith("B04A1")]
+        self.assertGreater(len(switches), 5)
+        self.assertAlmostEqual(10000000, switches[2] - switches[1], delta=100000)
+        aux.send_command("I04TA*")
+        self.clock.advance(0.1)
+        self.sim.read(0)
+        self.assertEqual(len(switches), len([f for ns, f in self.sim.log if f.startswith("B04A1")]))
+
+
+if __name__ == '__main__':
+    unittest.main()
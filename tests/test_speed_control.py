@@ -0,0 +1,61 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pthat import ADC, Axis
+from pthat.simulator import SimulatedSerial
+from pthat.speed_control import PID, ADCSpeedControl, LookupTable, LowPassFilter
+
+
+class TestSpeedControl(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.axis = Axis("X", command_id=1, serial_port=self.sim)
+        self.axis.auto_send_command = True
+        self.adc = ADC(1, command_id=2, serial_port=self.sim)
+        self.adc.auto_send_command = True
+        self.axis.set_axis(frequency=100.0, pulse_count=0)
+        self.axis.start()
+
+    def test_lookup_table(self):
+        table = LookupTable([(1000, 5000.0), (0, 0.0), (500, 1000.0)])
+        self.assertEqual(0.0, table(-5))
+        self.assertEqual(500.0, table(250))
+        self.assertEqual(3000.0, table(750))
+        self.assertEqual(5000.0, table(2000))
+
+    def test_low_pass_and_pid(self):
+        low_pass = LowPassFilter(1.0)
+        self.assertEqual(100.0, low_pass(100))
+        self.assertAlmostEqual(100.0 + 100.0 * 0.632, low_pass(200, 1.0), delta=0.1)
+        pid = PID(setpoint=500, kp=2.0, ki=1.0, output_max=1000.0)
+        self.assertEqual(200.0, pid(400))
+        self.assertEqual(300.0, pid(400, 1.0))
+        self.assertEqual(1000.0, pid(0, 1.0))
+        self.assertEqual(100.0, pid.integral)
+
+    def test_loop_follows_adc(self):
+        self.sim.adc_values[1] = lambda ns: 200 if ns < 1000000000 else 800
+        control = ADCSpeedControl(self.adc, self.axis, LookupTable([(0, 0.0), (1000, 10000.0)]), rate=20.0,
+                                  deadband=50.0, low_pass=LowPassFilter(0.05), clock=self.clock)
+        control.run(duration=2)
+
+        self.assertAlmostEqual(40, control.polls, delta=1)
+        self.assertAlmostEqual(8000.0, control.frequency, delta=50)
+        self.assertEqual(control.frequency, self.sim.axes["X"].frequency)
+        self.assertLess(control.commands, control.polls)
+        self.assertEqual(control.commands, control.latency.count)
+        self.assertEqual(control.polls, control.jitter.count)
+        self.assertEqual(0, control.overruns)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ADCSpeedControl(self.adc, self.axis, LookupTable([(0, 0.0)]), rate=0)
+        with self.assertRaises(ValueError):
+            LookupTable([])
+        with self.assertRaises(ValueError):
+            LowPassFilter(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pthat import Axis
+from pthat.simulator import SimulatedSerial
+from pthat.speed_stream import SpeedStream
+
+
+class TestSpeedStream(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.xaxis = Axis("X", serial_port=self.sim)
+
+    def test_encode(self):
+        stream = SpeedStream(self.xaxis, clock=self.clock)
+        self.assertEqual(self.xaxis.change_speed(1234.5).encode("ascii"), stream.encode(1234.5))
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, SpeedStream, self.xaxis, rate=0)
+        self.assertRaises(ValueError, SpeedStream, self.xaxis, spin=-1)
+
+    def test_generator(self):
+        stream = SpeedStream(self.xaxis, rate=100.0, spin=0, clock=self.clock)
+        stream.run(f for f in [100.0, 200.0, 200.0, None, 300.0, 200000.0])
+        self.assertEqual(6, stream.ticks)
+        self.assertEqual(3, stream.written)
+        self.assertEqual(1, stream.invalid)
+        self.assertEqual(300.0, stream.frequency)
+        self.assertEqual(0, stream.overruns)
+        self.assertEqual(0, stream.jitter.max)
+        self.clock.advance(0.01)
+        self.sim.read(0)
+        frames = [frame for ns, frame in self.sim.log if "Q" in frame]
+        self.assertEqual(["I00QX000100.000", "I00QX000200.000", "I00QX000300.000"], frames)
+
+    def test_callback_duration(self):
+        ticks = []
+        stream = SpeedStream(self.xaxis, rate=50.0, spin=0, clock=self.clock)
+        stream.run(lambda tick: ticks.append(tick) or 1000.0 + tick, duration=1.0)
+        self.assertEqual(list(range(50)), ticks)
+        self.assertEqual(50, stream.written)
+
+    def test_overrun_drops_ticks(self):
+        ticks = []
+
+        def slow(tick):
+            ticks.append(tick)
+            if tick == 3:
+                self.clock.advance(0.025)
+            return 100.0 + tick
+
+        stream = SpeedStream(self.xaxis, rate=100.0, spin=0, clock=self.clock)
+        stream.run(slow, duration=0.1)
+        self.assertEqual(1, stream.overruns)
+        self.assertEqual(1, stream.drops)
+        self.assertEqual([0, 1, 2, 3, 5, 6, 7, 8, 9], ticks)
+        self.assertEqual(25000000, stream.jitter.max)
+
+    def test_should_stop(self):
+        stream = SpeedStream(self.xaxis, rate=100.0, spin=0, clock=self.clock)
+        stream.run(lambda tick: 100.0, should_stop=lambda: stream.ticks >= 5)
+        self.assertEqual(5, stream.ticks)
+        self.assertEqual(1, stream.written)
+
+
+if __name__ == '__main__':
+    unittest.main()
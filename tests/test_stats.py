@@ -0,0 +1,40 @@
+import statistics
+import unittest
+from pthat.stats import RollingStats, RunningStats
+
+
+class TestStats(unittest.TestCase):
+
+    def test_running_stats(self):
+        values = [120, 95, 310, 87, 150]
+        stats = RunningStats("latency")
+        for value in values:
+            stats.add(value)
+        self.assertEqual(5, len(stats))
+        self.assertEqual(87, stats.min)
+        self.assertEqual(310, stats.max)
+        self.assertEqual(150, stats.last)
+        self.assertAlmostEqual(statistics.mean(values), stats.mean)
+        self.assertAlmostEqual(statistics.stdev(values), stats.stdev)
+        stats.reset()
+        self.assertEqual(0, stats.count)
+        self.assertIsNone(stats.min)
+
+    def test_rolling_stats(self):
+        values = [5, 3, 8, 1, 9, 2, 7, 7, 4, 6]
+        stats = RollingStats(4, "adc")
+        for i, value in enumerate(values):
+            stats.add(value)
+            window = values[max(0, i - 3):i + 1]
+            self.assertEqual(min(window), stats.min)
+            self.assertEqual(max(window), stats.max)
+            self.assertAlmostEqual(statistics.mean(window), stats.mean)
+            if len(window) > 1:
+                self.assertAlmostEqual(statistics.stdev(window), stats.stdev)
+        self.assertEqual(4, len(stats))
+        stats.reset()
+        self.assertIsNone(stats.max)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from pthat.telemetry import ADCBuffer, PulseCountBuffer, Telemetry, parse_adc_reply, parse_pulse_count_reply
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.telemetry = Telemetry(capacity=4)
+
+    def test_parse_pulse_count_reply(self):
+        self.assertEqual((1, 1, 1234), parse_pulse_count_reply("YP10000001234*"))
+        self.assertIsNone(parse_pulse_count_reply("RI00XP*"))
+
+    def test_parse_adc_reply(self):
+        self.assertEqual((2, 512), parse_adc_reply("D20512*"))
+        self.assertIsNone(parse_adc_reply("DI00JX*"))
+
+    def test_feed(self):
+        others = self.telemetry.feed(["RI00XP*", "XP00000000010*", "D11023*", "CI00XP*"])
+        self.assertEqual(["RI00XP*", "CI00XP*"], others)
+        self.assertEqual(1, len(self.telemetry.pulse_counts))
+        self.assertEqual(1, len(self.telemetry.adc))
+
+    def test_overwrite_oldest(self):
+        buffer = PulseCountBuffer(capacity=3)
+        for i in range(5):
+            buffer.add_reply(f"XP0{i:010}*", ns=i)
+        self.assertEqual(2, buffer.overwritten)
+        self.assertEqual([2, 3, 4], list(buffer.last(10)["count"]))
+        self.assertEqual([3, 4], list(buffer.last(2)["count"]))
+        self.assertEqual((4, 0, 0, 4), buffer.latest())
+
+    def test_between(self):
+        buffer = ADCBuffer(capacity=4)
+        for i in range(6):
+            buffer.add_reply(f"D1{i * 10:04}*", ns=i * 100)
+        window = buffer.between(250, 450)
+        self.assertEqual([300, 400], list(window["ns"]))
+        self.assertEqual([30, 40], list(window["value"]))
+        self.assertEqual([500], list(buffer.since(450)["ns"]))
+        self.assertEqual([], list(buffer.between(0, 150)["ns"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import multiprocessing
+import unittest
+from pthat.telemetry_bus import TelemetryBus, numpy
+from pthat.telemetry_log import ADC, PORT_STATUS, PULSE_COUNT
+
+
+def read_bus(name, results):
+    bus = TelemetryBus(name, create=False)
+    records, sequence = bus.read()
+    results.put((sequence, [tuple(r)[-1] for r in records], bus.latest(ADC, 2)))
+    del records
+    bus.close()
+
+
+class TestTelemetryBus(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = TelemetryBus(capacity=4)
+
+    def tearDown(self):
+        self.bus.close()
+        self.bus.unlink()
+
+    def test_publish_and_read(self):
+        reader = TelemetryBus(self.bus.name, create=False)
+        self.assertIsNone(reader.latest(PULSE_COUNT, 0))
+        self.assertEqual(["RI01CX*"], self.bus.feed(["XP00000001000*", "RI01CX*", "D20512*", "L10000*"]))
+        records, sequence = reader.read()
+        self.assertEqual(3, sequence)
+        self.assertEqual([1000, 512, 16], [int(tuple(r)[-1]) for r in records])
+        sequence_x, ns, direction, count = reader.latest(PULSE_COUNT, 0)
+        self.assertEqual((1, 0, 1000), (sequence_x, direction, count))
+        self.assertEqual(16, reader.latest(PORT_STATUS)[3])
+
+        for count in range(2000, 7000, 1000):
+            self.bus.publish(f"YP1{count:010}*")
+        records, sequence = reader.read(sequence)
+        self.assertEqual(8, sequence)
+        self.assertEqual([4000, 5000, 6000], [int(tuple(r)[-1]) for r in records])
+        self.assertEqual(2, reader.missed)
+        del records
+        reader.close()
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_views(self):
+        self.bus.feed(["XP00000001000*", "YP10000006000*"])
+        latest = self.bus.latest_view()
+        records = self.bus.records_view()
+        self.assertEqual([1000, 6000], list(latest["value"][:2]))
+        self.assertEqual([1000, 6000], list(records["value"][:2]))
+        del latest, records
+
+    def test_reader_process(self):
+        self.bus.feed(["D10100*", "D20200*"])
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=read_bus, args=(self.bus.name, results))
+        process.start()
+        sequence, values, latest = results.get(timeout=30)
+        process.join()
+        self.assertEqual(2, sequence)
+        self.assertEqual([100, 200], values)
+        self.assertEqual(200, latest[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
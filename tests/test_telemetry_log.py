@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from pthat.telemetry_log import ADC, PORT_STATUS, PULSE_COUNT, TelemetryLogReader, TelemetryLogWriter
+
+
+class TestTelemetryLog(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".ptlog")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write_log(self):
+        with TelemetryLogWriter(self.path, chunk_records=2) as log:
+            log.add_reply("RI00XP*", ns=100)
+            log.add_reply("XP00000000010*", ns=100)
+            log.add_reply("D10512*", ns=200)
+            log.add_reply("L10111*", ns=300)
+            log.add_reply("YP10000000020*", ns=400)
+            log.feed(["CI00XP*"])
+
+    def test_columns(self):
+        self.write_log()
+        with TelemetryLogReader(self.path) as log:
+            self.assertEqual(4, len(log))
+            self.assertEqual(2, len(log.chunks))
+            columns = log.columns()
+            self.assertEqual([PULSE_COUNT, ADC, PORT_STATUS, PULSE_COUNT], list(columns["kind"]))
+            self.assertEqual([10, 512, 0b10111, 20], list(columns["value"]))
+            counts = log.columns(kind=PULSE_COUNT)
+            self.assertEqual([0, 1], list(counts["channel"]))
+            self.assertEqual([0, 1], list(counts["direction"]))
+
+    def test_between(self):
+        self.write_log()
+        with TelemetryLogReader(self.path) as log:
+            self.assertEqual([200, 300], list(log.between(150, 400)["ns"]))
+
+    def test_unclosed_log(self):
+        self.write_log()
+        with open(self.path, "r+b") as f:
+            f.truncate(32 + 3 * 16 + 5)    # drop the index, the trailer and part of the last record
+        with TelemetryLogReader(self.path) as log:
+            self.assertEqual(3, len(log))
+            self.assertEqual([512, 0b10111], list(log.between(200, 1000)["value"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
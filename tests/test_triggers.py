@@ -0,0 +1,57 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pthat import AUX, PWM, Axis
+from pthat.simulator import SimulatedSerial
+from pthat.triggers import PositionTriggers
+
+
+class TestPositionTriggers(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.axis = Axis("X", command_id=1, serial_port=self.sim)
+        self.axis.auto_send_command = True
+
+    def test_fires_at_positions(self):
+        aux = AUX(1, test_mode=True)
+        called = []
+        triggers = PositionTriggers(self.axis, clock=self.clock)
+        triggers.add("X", 800, aux.output_off())
+        triggers.add("X", 500, aux.output_on())
+        triggers.add("X", 500, lambda axis, count, ns: called.append((axis, count)))
+        triggers.add("X", 950, PWM("X", test_mode=True).set_channel(frequency=1000, duty_cycle=50))
+        self.assertEqual(4, len(triggers))
+
+        self.axis.set_auto_count_pulse_out(pulse_count=50)
+        self.axis.set_axis(frequency=1000.0, pulse_count=1000)
+        self.axis.start()
+        switched_on = None
+        while self.clock.monotonic_ns() < 1200000000:
+            triggers.read_replies()
+            if switched_on is None and self.sim.aux[1] == 1:
+                switched_on = self.clock.monotonic_ns()
+            self.clock.advance(0.001)
+
+        self.assertEqual(4, triggers.fired)
+        self.assertEqual([("X", 500)], called)
+        self.assertEqual(0, self.sim.aux[1])
+        self.assertEqual((1000, 5000), self.sim.pwm["X"])
+        self.assertAlmostEqual(500000000, switched_on, delta=10000000)
+        self.assertEqual(4, triggers.lag.count)
+        self.assertLess(triggers.lag.max, 5000000)
+
+    def test_rules_fire_once_a_move(self):
+        triggers = PositionTriggers(self.axis, clock=self.clock)
+        triggers.add("Y", 0, "I00A11*")
+        triggers.add("Y", 100, "I00A10*")
+        self.assertEqual(1, triggers.update("Y", 50, 0))
+        self.assertEqual(0, triggers.update("Y", 60, 1))
+        self.assertEqual(1, triggers.update("Y", 150, 2))
+        self.assertEqual(2, triggers.update("Y", 120, 3))
+        with self.assertRaises(ValueError):
+            triggers.add("W", 10, "I00A11*")
+
+
+if __name__ == '__main__':
+    unittest.main()
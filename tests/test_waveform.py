@@ -0,0 +1,54 @@
+import unittest
+from pthat.clock import VirtualClock
+from pthat.pthat import PWM
+from pthat.simulator import SimulatedSerial
+from pthat.waveform import PWMWaveform, ramp_wave, sine_wave, triangle_wave
+
+
+class TestPWMWaveform(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.sim = SimulatedSerial(clock=self.clock, timeout=0.1)
+        self.pwm = PWM("X", serial_port=self.sim)
+
+    def test_shapes(self):
+        self.assertAlmostEqual(50.0, sine_wave(0, 100)(0.0))
+        self.assertAlmostEqual(100.0, sine_wave(0, 100)(0.25))
+        self.assertAlmostEqual(100.0, triangle_wave(0, 100)(0.5))
+        self.assertAlmostEqual(25.0, ramp_wave(0, 100)(0.25))
+
+    def test_table_skips_repeats(self):
+        flat = PWMWaveform(period=1.0, rate=100.0, duty_cycle_x=50, duty_cycle_y=25.5)
+        self.assertEqual([(0, b"I00UA000100005000000100002550*")], flat.table)
+        stepped = PWMWaveform(period=1.0, rate=100.0, duty_cycle_x=lambda t: 10 if t < 0.5 else 20)
+        self.assertEqual([0, 50], [index for index, command in stepped.table])
+
+    def test_stream(self):
+        waveform = PWMWaveform(period=0.5, rate=100.0, duty_cycle_x=triangle_wave(0, 50), clock=self.clock)
+        waveform.stream(self.pwm, duration=1.0)
+        self.assertEqual(100, waveform.written + waveform.skipped)
+        self.assertAlmostEqual(100.0, waveform.achieved_rate, delta=1)
+        self.assertEqual(waveform.written, waveform.jitter.count)
+        self.clock.advance(0.01)
+        self.sim.read(0)
+        self.assertEqual((1000, 200), self.sim.pwm["X"])
+
+    def test_buffer_program(self):
+        waveform = PWMWaveform(period=0.2, rate=50.0, duty_cycle_x=lambda t: [10, 10, 40, 60, 60, 60, 60, 60, 80, 90][
+            int(t * 10)])
+        program = waveform.buffer_program()
+        self.assertEqual("H0000*", program[0])
+        self.assertEqual("W0000*", program[-1])
+        self.assertEqual(["B00WW0040*", "B00WW0020*", "B00WW0100*", "B00WW0020*", "B00WW0020*"],
+                         [command for command in program if command[3] == "W"])
+        self.sim.write("".join(program).encode("ascii"))
+        self.clock.advance(0.5)
+        self.sim.read(0)
+        updates = [ns for ns, frame in self.sim.log if frame.startswith("B00UA")]
+        self.assertGreaterEqual(len(updates), 10)
+        self.assertAlmostEqual(200000000, updates[5] - updates[0], delta=100000)
+
+
+if __name__ == '__main__':
+    unittest.main()